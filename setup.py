@@ -18,12 +18,18 @@ setup(
         "Operating System :: OS Independent",
     ],
     packages=find_packages(),
-    python_requires=">=3.6",
+    python_requires=">=3.7",
     install_requires=[
-        "xmltodict",
-        "requests",
-        "typing",
-        "python-dotenv",
         "numpy"
-    ]
+    ],
+    extras_require={
+        "client": ["requests"],
+        "async": ["aiohttp"],
+        "all": ["requests", "aiohttp"],
+        "test": ["pytest", "xmltodict"],
+    },
+    entry_points={
+        "console_scripts": ["ubki-rescore = ubkisaas.ubki_rescore:main",
+                            "ubki-loadgen = ubkisaas.ubki_loadgen:main"],
+    }
 )
\ No newline at end of file
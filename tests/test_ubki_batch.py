@@ -0,0 +1,58 @@
+""" Кодирование категориальных признаков в наборах признаков словарями значений вызывающего """
+from ubkisaas.ubki_batch import get_useful_ubki_fields_batch, CATEGORY_FIELDS, MISSING_CATEGORY, UNKNOWN_CATEGORY
+from ubkisaas.ubki_report import UbkiReport
+from ubkisaas.ubki_synthetic import generate_credit_report_xml, generate_credit_score_xml
+
+import datetime
+import numpy as np
+import pytest
+
+PHONE = '+380111656411'
+EMAIL = 'email@gmail.com'
+OUR_DATE = datetime.datetime(2026, 1, 1)
+REPORTS = [(generate_credit_report_xml(seed), generate_credit_score_xml(seed), PHONE, EMAIL) for seed in range(20)]
+# Отчет без блока идентификации: все категориальные признаки отсутствуют
+EMPTY = ('<doc><comp id="1"/></doc>', '<doc/>', PHONE, EMAIL)
+
+def get_expected(reports) -> list:
+    return [UbkiReport(*report).get_useful_ubki_fields(our_date=OUR_DATE) for report in reports]
+
+def test_without_vocabulary_categories_stay_numeric():
+    batch = get_useful_ubki_fields_batch(REPORTS + [EMPTY], our_date=OUR_DATE)
+    assert batch.codes == {} and batch.categories == {}
+    assert all(key in batch.fields for key in CATEGORY_FIELDS)
+    for row, expected in enumerate(get_expected(REPORTS + [EMPTY])):
+        for key in CATEGORY_FIELDS:
+            assert batch.missing[key][row] == (expected[key] is None)
+            assert expected[key] is None or batch.values[key][row] == float(expected[key])
+
+def test_encoding():
+    # Словарь в произвольном порядке и без части значений: код - индекс значения в словаре
+    vocabulary = [5, 3, 1, 2]
+    reports = REPORTS + [EMPTY]
+    batch = get_useful_ubki_fields_batch(reports, our_date=OUR_DATE, categories={'sstate': vocabulary})
+    assert 'sstate' not in batch.fields and 'sstate' not in batch.values
+    assert ['cgrag', 'family', 'ceduc'] == [key for key in CATEGORY_FIELDS if key in batch.fields]
+    assert batch.codes['sstate'].dtype == np.int32
+    assert batch.categories['sstate'].tolist() == vocabulary
+
+    expected = [fields['sstate'] for fields in get_expected(reports)]
+    codes = batch.codes['sstate'].tolist()
+    assert codes[-1] == MISSING_CATEGORY and batch.missing['sstate'][-1]
+    for code, value in zip(codes[:-1], expected[:-1]):
+        if int(value) in vocabulary:
+            assert code == vocabulary.index(int(value))
+        else:
+            assert code == UNKNOWN_CATEGORY
+    assert UNKNOWN_CATEGORY in codes and set(codes) - {MISSING_CATEGORY, UNKNOWN_CATEGORY}
+
+    # Коды не зависят от состава набора
+    part = get_useful_ubki_fields_batch(reports[5:], our_date=OUR_DATE, categories={'sstate': vocabulary})
+    assert part.codes['sstate'].tolist() == codes[5:]
+
+    X, missing = batch.to_matrix()
+    assert X.shape == missing.shape == (len(reports), len(batch.fields))
+
+def test_unknown_category_field():
+    with pytest.raises(ValueError):
+        get_useful_ubki_fields_batch(REPORTS[:1], our_date=OUR_DATE, categories={'wdohod': [1, 2]})
@@ -0,0 +1,34 @@
+""" Запоминание скомпилированных наборов признаков: ключ без незарегистрированных имен и ограниченный размер """
+from ubkisaas import ubki_features
+from ubkisaas.ubki_features import compile_features, register_feature, unregister_feature, get_features, MAX_PLANS
+
+import itertools
+
+def test_unknown_names_share_plan():
+    plan = compile_features(['ubki_score'])
+    assert compile_features(['ubki_score', 'no_such_field', 'other']) is plan
+    assert compile_features(('ubki_score', 'ubki_score')) is plan
+    assert compile_features(['no_such_field']) is compile_features()
+
+def test_plans_are_bounded():
+    names = [f.name for f in get_features()]
+    subsets = list(itertools.islice(itertools.combinations(names, 2), 3 * MAX_PLANS))
+    assert len(subsets) == 3 * MAX_PLANS
+    first = compile_features(subsets[0])
+    for subset in subsets[1:]:
+        compile_features(subset)
+        compile_features(subsets[0]) # Часто используемый набор не вытесняется
+    assert len(ubki_features._plans) == MAX_PLANS
+    assert compile_features(subsets[0]) is first
+    assert compile_features(subsets[1]) is not None and len(ubki_features._plans) == MAX_PLANS
+
+def test_registration_clears_plans():
+    plan = compile_features()
+    register_feature('test_plan_feature', 'report', '10', {'cont': ['cval']}, lambda records, phone, email: 0)
+    try:
+        assert compile_features() is not plan
+        assert 'test_plan_feature' in [f.name for f in compile_features().custom['report']]
+        assert compile_features(['test_plan_feature']) is not compile_features()
+    finally:
+        unregister_feature('test_plan_feature')
+    assert 'test_plan_feature' not in [f.name for f in compile_features().custom['report']]
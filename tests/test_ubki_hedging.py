@@ -0,0 +1,148 @@
+""" Дублирование медленных запросов: дубликат отправляется после задержки-перцентиля,
+не отправляется без бюджета, а отмененный проигравший не попадает в окно задержек
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from ubkisaas.ubki_hedging import AsyncRequestHedger, RequestHedger
+
+REQTYPE = 10
+SAMPLES = 5
+DELAY = 0.05 # Задержка дублирования: быстрые ответы разогрева дают перцентиль меньше min_delay
+
+def make_hedger(cls, budget = 1.0):
+    return cls(percentile = 95, budget = budget, burst = 1, min_delay = DELAY, min_samples = SAMPLES, window = 100)
+
+def warm_up(hedger):
+    for _ in range(SAMPLES):
+        assert hedger.do(REQTYPE, lambda: 'fast') == 'fast'
+    assert hedger.get_delay(REQTYPE) == DELAY
+
+def test_no_hedge_before_samples():
+    hedger = make_hedger(RequestHedger)
+    hedges = []
+    for _ in range(SAMPLES):
+        hedger.do(REQTYPE, lambda: time.sleep(2 * DELAY), lambda: hedges.append(1))
+    assert hedges == [] and hedger.get_stats()['hedged'] == 0
+    hedger.close()
+
+def test_hedge_fires_after_delay():
+    hedger = make_hedger(RequestHedger)
+    warm_up(hedger)
+    # Быстрый ответ: дубликат не нужен
+    assert hedger.do(REQTYPE, lambda: 'primary', lambda: 'hedge') == 'primary'
+    assert hedger.get_stats()['hedged'] == 0
+
+    release = threading.Event()
+    fired = []
+    start = time.perf_counter()
+    def slow():
+        release.wait(5)
+        return 'primary'
+    def hedge():
+        fired.append(time.perf_counter() - start)
+        return 'hedge'
+    assert hedger.do(REQTYPE, slow, hedge) == 'hedge'
+    release.set()
+    assert len(fired) == 1 and fired[0] >= DELAY * 0.9
+    stats = hedger.get_stats()
+    assert (stats['hedged'], stats['wins'], stats['skipped']) == (1, 1, 0)
+    hedger.close()
+
+def test_primary_error_waits_for_hedge():
+    hedger = make_hedger(RequestHedger)
+    warm_up(hedger)
+    def failing():
+        time.sleep(2 * DELAY)
+        raise ValueError('ubki')
+    def hedge():
+        time.sleep(3 * DELAY)
+        return 'hedge'
+    assert hedger.do(REQTYPE, failing, hedge) == 'hedge'
+    hedger.close()
+
+def test_exhausted_budget_suppresses_hedge():
+    hedger = make_hedger(RequestHedger, budget = 0.0)
+    warm_up(hedger)
+    hedges = []
+    def slow():
+        time.sleep(2 * DELAY)
+        return 'primary'
+    assert hedger.do(REQTYPE, slow, lambda: hedges.append(1)) == 'primary'
+    assert hedges == []
+    stats = hedger.get_stats()
+    assert (stats['hedged'], stats['skipped']) == (0, 1)
+    hedger.close()
+
+def test_async_cancelled_loser_not_recorded():
+    async def run():
+        hedger = make_hedger(AsyncRequestHedger)
+        async def fast():
+            return 'fast'
+        for _ in range(SAMPLES):
+            await hedger.do(REQTYPE, fast)
+        cancelled = []
+        async def hung():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(1)
+                raise
+            return 'primary'
+        async def hedge():
+            return 'hedge'
+        start = time.perf_counter()
+        assert await hedger.do(REQTYPE, hung, hedge) == 'hedge'
+        assert time.perf_counter() - start >= DELAY * 0.9
+        await asyncio.sleep(0)
+        assert cancelled == [1]
+        # В окне только разогрев и дубликат: время отмененного основного запроса не учтено
+        latencies = hedger._latencies[REQTYPE]
+        assert len(latencies) == SAMPLES + 1 and max(latencies) < DELAY
+        stats = hedger.get_stats()
+        assert (stats['hedged'], stats['wins']) == (1, 1)
+
+        # Без бюджета дубликат не отправляется, ждется основной запрос
+        hedger.budget = 0.0
+        hedger._credits = 0.0
+        async def slow():
+            await asyncio.sleep(2 * DELAY)
+            return 'primary'
+        assert await hedger.do(REQTYPE, slow, hedge) == 'primary'
+        assert hedger.get_stats()['skipped'] == 1
+    asyncio.run(run())
+
+def test_async_close_cancels_requests():
+    async def run():
+        hedger = make_hedger(AsyncRequestHedger)
+        async def fast():
+            return 'fast'
+        for _ in range(SAMPLES):
+            await hedger.do(REQTYPE, fast)
+        async def hung():
+            await asyncio.sleep(10)
+        call = asyncio.ensure_future(hedger.do(REQTYPE, hung))
+        await asyncio.sleep(3 * DELAY) # Основной и дублирующий запросы выполняются
+        assert len(hedger._tasks) == 2
+        await hedger.close()
+        assert hedger._tasks == set()
+        await asyncio.gather(call, return_exceptions=True)
+        assert call.cancelled()
+    asyncio.run(run())
+
+def test_async_request_close_closes_hedger():
+    pytest.importorskip('aiohttp')
+    from ubkisaas.ubki_async_request import AsyncUbkiRequest
+    class Hedger(AsyncRequestHedger):
+        closed = False
+        async def close(self):
+            self.closed = True
+            await super().close()
+    async def run():
+        hedger = Hedger()
+        await AsyncUbkiRequest('login', 'password', is_test = True, hedger = hedger).close()
+        return hedger.closed
+    assert asyncio.run(run())
@@ -0,0 +1,63 @@
+""" Объединение признаков кредитного отчета и кредитного балла в UbkiReport и наборах признаков """
+from ubkisaas.ubki_report import UbkiReport, SHARED_FIELDS
+from ubkisaas.ubki_batch import get_useful_ubki_fields_batch
+from ubkisaas.ubki_rescore import get_pair_fields
+from ubkisaas.ubki_credit_report import get_useful_credit_report_fields
+from ubkisaas.ubki_credit_score import get_useful_credit_score_fields
+from ubkisaas.ubki_synthetic import generate_credit_report_xml, generate_credit_score_xml
+
+import datetime
+import numpy as np
+import pytest
+
+xmltodict = pytest.importorskip('xmltodict')
+
+PHONE = '+380111656411'
+EMAIL = 'email@gmail.com'
+OUR_DATE = datetime.datetime(2026, 1, 1)
+DOCUMENTS = [(generate_credit_report_xml(seed), generate_credit_score_xml(seed)) for seed in range(5)]
+
+def get_reference(report_xml:str, score_xml:str) -> dict:
+    """ Исходное объединение: признаки кредитного балла заменяют одноименные признаки кредитного отчета """
+    return {**get_useful_credit_report_fields(xmltodict.parse(report_xml), PHONE, EMAIL, OUR_DATE),
+            **get_useful_credit_score_fields(xmltodict.parse(score_xml))}
+
+def test_shared_fields():
+    assert SHARED_FIELDS == ['ubki_phone_deltatime', 'ubki_email_deltatime', 'ubki_week_queries']
+
+@pytest.mark.parametrize('report_xml, score_xml', DOCUMENTS)
+def test_default_merge_takes_shared_fields_from_score(report_xml, score_xml):
+    expected = get_reference(report_xml, score_xml)
+    fields = UbkiReport(report_xml, score_xml, PHONE, EMAIL).get_useful_ubki_fields(our_date=OUR_DATE)
+    assert list(fields) == list(expected)
+    assert fields == expected
+    assert all(fields[key] is None for key in SHARED_FIELDS)
+
+    report = UbkiReport(report_xml, score_xml, PHONE, EMAIL)
+    report.keep_features_only()
+    assert report.get_useful_ubki_fields(our_date=OUR_DATE) == expected
+
+@pytest.mark.parametrize('report_xml, score_xml', DOCUMENTS)
+def test_shared_fields_from_report(report_xml, score_xml):
+    reference = get_useful_credit_report_fields(xmltodict.parse(report_xml), PHONE, EMAIL, OUR_DATE)
+    expected = dict(get_reference(report_xml, score_xml), **{key: reference[key] for key in SHARED_FIELDS})
+    report = UbkiReport(report_xml, score_xml, PHONE, EMAIL)
+    assert report.get_useful_ubki_fields(our_date=OUR_DATE, shared_from_report=True) == expected
+    report.keep_features_only()
+    assert report.get_useful_ubki_fields(our_date=OUR_DATE, shared_from_report=True) == expected
+
+@pytest.mark.parametrize('shared_from_report', [False, True])
+def test_batch_and_rescore_match_report(shared_from_report):
+    reports = [UbkiReport(report_xml, score_xml, PHONE, EMAIL) for report_xml, score_xml in DOCUMENTS]
+    reports[-1].keep_features_only()
+    batch = get_useful_ubki_fields_batch(reports, our_date=OUR_DATE, shared_from_report=shared_from_report)
+    for row, (report, (report_xml, score_xml)) in enumerate(zip(reports, DOCUMENTS)):
+        expected = report.get_useful_ubki_fields(our_date=OUR_DATE, shared_from_report=shared_from_report)
+        for key in batch.fields:
+            assert batch.missing[key][row] == (expected[key] is None), key
+            assert expected[key] is None or batch.values[key][row] == expected[key], key
+        assert get_pair_fields(report_xml, score_xml, PHONE, EMAIL, OUR_DATE, batch.fields, shared_from_report) == \
+            [expected[key] for key in batch.fields]
+    if not shared_from_report:
+        assert all(batch.missing[key].all() for key in SHARED_FIELDS)
+        assert np.isnan(batch.as_of(datetime.datetime(2030, 1, 1)).values['ubki_phone_deltatime']).all()
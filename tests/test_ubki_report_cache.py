@@ -0,0 +1,96 @@
+""" Дисковый кэш ответов УБКИ: срок жизни, вытеснение по времени обращения и отбор сохраняемых ответов """
+from ubkisaas import ubki_report_cache
+from ubkisaas.ubki_report_cache import ReportCache, is_cacheable, get_cache_key
+from ubkisaas.ubki_request import UbkiRequest, TEST_PERSON_DATA
+from ubkisaas.ubki_session_store import SessionStore
+from ubkisaas.ubki_synthetic import generate_credit_report_xml, generate_credit_score_xml
+
+import random
+import gzip
+import time
+import os
+import pytest
+
+REPORT = generate_credit_report_xml(1)
+SCORE = generate_credit_score_xml(1)
+UBKI_ERROR = '<?xml version="1.0" encoding="utf-8"?><doc><ubki><error errtype="data" errtext="..."/></ubki></doc>'
+
+@pytest.fixture
+def clock(monkeypatch):
+    """ Часы кэша, которые двигает тест """
+    now = [time.time() - 10 ** 6] # В прошлом: только что записанные файлы новее всех отметок теста
+    monkeypatch.setattr(ubki_report_cache.time, 'time', lambda: now[0])
+    return now
+
+def random_text(seed:int, size:int = 4000) -> str:
+    return '%x' % random.Random(seed).getrandbits(size * 4) # Почти не сжимается: размеры файлов близки
+
+def test_ttl_miss(tmp_path, clock):
+    cache = ReportCache(str(tmp_path), ttl=60)
+    cache.put('a', REPORT)
+    os.utime(cache._get_path('a'), (clock[0], clock[0])) # Время записи - по часам теста
+    clock[0] += 59
+    assert cache.get('a') == REPORT
+    clock[0] += 2
+    assert cache.get('a') is None
+    assert not os.path.exists(cache._get_path('a'))
+    assert cache.get_stats()['hits'] == 1 and cache.get_stats()['misses'] == 1
+
+def test_lru_eviction(tmp_path, clock):
+    size = len(gzip.compress(random_text(0).encode('utf-8')))
+    cache = ReportCache(str(tmp_path), max_size=int(size * 3.5))
+    for i, key in enumerate('abc'):
+        cache.put(key, random_text(i))
+        os.utime(cache._get_path(key), (clock[0] + i, clock[0] + i)) # a - самый старый
+    clock[0] += 10
+    assert cache.get('a') == random_text(0) # Обращение делает a недавно использованным
+    cache.put('d', random_text(3))
+    assert cache.get_stats()['evictions'] == 1
+    assert not os.path.exists(cache._get_path('b'))
+    assert all(os.path.exists(cache._get_path(key)) for key in 'acd')
+    assert cache.get_stats()['size'] <= cache.max_size
+
+def test_oversized_response_is_not_stored(tmp_path):
+    cache = ReportCache(str(tmp_path), max_size=100)
+    cache.put('a', random_text(0))
+    assert cache.get('a') is None and cache.get_stats()['entries'] == 0
+
+@pytest.mark.parametrize('text, status, expected', [
+    (REPORT, 200, True),
+    (REPORT, 203, True),
+    (REPORT, 500, False),
+    (REPORT, 404, False),
+    ('<html><body>502 Bad Gateway</body></html>', 200, False),
+    (UBKI_ERROR, 200, False),
+    (REPORT.replace('<tech>', '<error errtype="data"/><tech>'), 200, False),
+])
+def test_is_cacheable(text, status, expected):
+    assert is_cacheable(text, status) is expected
+
+class FakeTransport():
+    """ Транспорт, отвечающий на запрос отчета заданными (код http, текст) по номеру шаблона """
+    def __init__(self, responses:dict):
+        self.responses = responses
+        self.calls = 0
+
+    def post(self, url:str, data, headers=None) -> str:
+        return "{'doc': {'auth': {'sessid': 'S1'}}}"
+
+    def post_response(self, url:str, data:bytes, headers=None):
+        self.calls += 1
+        return self.responses[10 if b'reqtype="10"' in data else 11]
+
+    def close(self):
+        pass
+
+@pytest.mark.parametrize('report', [(500, REPORT), (200, UBKI_ERROR), (200, '<html>Service Unavailable</html>')])
+def test_failed_responses_are_not_stored(tmp_path, report):
+    cache = ReportCache(str(tmp_path / 'cache'))
+    transport = FakeTransport({10: report, 11: (200, SCORE)})
+    request = UbkiRequest('login', 'password', is_test=True, transport=transport,
+                          session_store=SessionStore(str(tmp_path / 'keys.json')), cache=cache)
+    request.get_person_credit_report()
+    request.get_person_credit_report()
+    assert transport.calls == 3 # Кредитный балл взят из кэша, ответ на запрос отчета - нет
+    assert cache.get(get_cache_key(True, 10, TEST_PERSON_DATA)) is None
+    assert cache.get(get_cache_key(True, 11, TEST_PERSON_DATA)) == SCORE
@@ -0,0 +1,72 @@
+""" Сохранение отчетов в файл и чтение: признаки совпадают, запомненные признаки восстанавливаются
+только при той же версии реестра признаков """
+from ubkisaas.ubki_report import UbkiReport
+from ubkisaas.ubki_report_file import save_reports, iter_reports, load_reports
+from ubkisaas.ubki_features import register_feature, unregister_feature, get_features_version
+from ubkisaas.ubki_synthetic import generate_credit_report_xml, generate_credit_score_xml
+
+import datetime
+import pytest
+
+PHONE = '+380111656411'
+EMAIL = 'email@gmail.com'
+OUR_DATE = datetime.datetime(2026, 1, 1)
+
+def make_reports() -> list:
+    reports = [UbkiReport(generate_credit_report_xml(seed), generate_credit_score_xml(seed), PHONE, EMAIL)
+               for seed in range(4)]
+    reports[1].get_useful_ubki_fields(our_date=OUR_DATE) # Признаки уже вычислены
+    reports[2].keep_features_only()
+    reports[3].compress()
+    return reports
+
+@pytest.mark.parametrize('compact', [True, False])
+def test_round_trip(tmp_path, compact):
+    reports = make_reports()
+    expected = [report.get_useful_ubki_fields(our_date=OUR_DATE) for report in reports]
+    path = str(tmp_path / 'reports.bin')
+    assert save_reports(iter(reports), path) == len(reports)
+
+    loaded = load_reports(path, compact=compact)
+    assert [report.has_xml() for report in loaded] == [True, True, False, True]
+    assert [report.compact for report in loaded] == [compact, compact, False, compact]
+    assert loaded[0].get_report_xml() == reports[0].get_report_xml()
+    assert loaded[3].get_score_xml() == reports[3].get_score_xml()
+    assert loaded[1]._fields['report'] # Версия реестра та же: признаки не вычисляются заново
+    for report, fields in zip(loaded, expected):
+        assert (report.phone, report.email) == (PHONE, EMAIL)
+        assert report.get_useful_ubki_fields(our_date=OUR_DATE) == fields
+        assert report.get_useful_ubki_fields(our_date=OUR_DATE, shared_from_report=True) == \
+            reports[loaded.index(report)].get_useful_ubki_fields(our_date=OUR_DATE, shared_from_report=True)
+
+def test_fields_version_mismatch(tmp_path):
+    reports = make_reports()
+    path = str(tmp_path / 'reports.bin')
+    save_reports(reports, path)
+    version = get_features_version()
+    register_feature('test_contacts_count', 'report', '10', {'cont': ['cval']},
+                     lambda records, phone, email: len(records['cont']))
+    try:
+        assert get_features_version() != version
+        loaded = list(iter_reports(path))
+        # Признаки, запомненные при другой версии реестра, вычисляются заново, в том числе новый признак
+        assert all(report._fields == {'report': {}, 'score': {}} for report in loaded if report.has_xml())
+        fields = loaded[1].get_useful_ubki_fields(our_date=OUR_DATE)
+        assert fields['test_contacts_count'] == reports[1].get_useful_ubki_fields(our_date=OUR_DATE)['test_contacts_count']
+        assert fields['test_contacts_count'] > 0
+        # У отчета только с признаками xml нет, признаки остаются сохраненными
+        assert 'test_contacts_count' not in loaded[2].get_useful_ubki_fields(our_date=OUR_DATE)
+    finally:
+        unregister_feature('test_contacts_count')
+    assert get_features_version() == version
+
+def test_corrupted_file(tmp_path):
+    path = tmp_path / 'reports.bin'
+    save_reports(make_reports(), str(path))
+    data = path.read_bytes()
+    path.write_bytes(data[:-10])
+    with pytest.raises(ValueError):
+        load_reports(str(path))
+    path.write_bytes(b'NOTUBKI!' + data[8:])
+    with pytest.raises(ValueError):
+        load_reports(str(path))
@@ -0,0 +1,95 @@
+""" Пересчет признаков по архивам: продолжение после прерванной записи csv, повторяющиеся ключи пар
+и поврежденные архивы """
+from ubkisaas.ubki_rescore import rescore, find_pairs, main
+from ubkisaas.ubki_synthetic import generate_credit_report_xml, generate_credit_score_xml
+
+import datetime
+import tarfile
+import zipfile
+import csv
+import io
+import pytest
+
+OUR_DATE = datetime.datetime(2026, 1, 1)
+PAIRS = 6
+FIELDS = ['ubki_balance_value', 'ubki_score']
+
+def write_pairs(root, prefix = 'a'):
+    directory = root / prefix
+    directory.mkdir(parents=True)
+    for seed in range(PAIRS):
+        (directory / ('%d_report.xml' % seed)).write_text(generate_credit_report_xml(seed), encoding='utf-8')
+        (directory / ('%d_score.xml' % seed)).write_text(generate_credit_score_xml(seed), encoding='utf-8')
+    return directory
+
+def make_tar(path, directory, mode = 'w'):
+    with tarfile.open(str(path), mode) as archive:
+        archive.add(str(directory), arcname=directory.name)
+    return str(path)
+
+def read_csv(path) -> list:
+    with open(str(path), newline='', encoding='utf-8') as file:
+        return list(csv.reader(file))
+
+def run(inputs, output, resume = False) -> dict:
+    return rescore([str(path) for path in inputs], str(output), fields=FIELDS, our_date=OUR_DATE, workers=1,
+                   chunk_size=2, resume=resume)
+
+def test_resume_after_partial_csv(tmp_path):
+    directory = write_pairs(tmp_path / 'in')
+    output = tmp_path / 'features.csv'
+    assert run([directory.parent], output) == {'processed': PAIRS, 'skipped': 0, 'errors': 0}
+    rows = read_csv(output)
+    assert rows[0] == ['key'] + FIELDS and len(rows) == PAIRS + 1
+
+    # Прерванная запись: две полные строки и недописанная третья
+    lines = output.read_text(encoding='utf-8').splitlines(keepends=True)
+    output.write_text(''.join(lines[:3]) + lines[3][:5], encoding='utf-8')
+    assert run([directory.parent], output, resume=True) == {'processed': PAIRS - 2, 'skipped': 2, 'errors': 0}
+    resumed = read_csv(output)
+    assert resumed[0] == rows[0]
+    assert sorted(resumed[1:]) == sorted(rows[1:])
+    assert len({row[0] for row in resumed[1:]}) == PAIRS
+
+    with pytest.raises(ValueError): # Столбцы файла не совпадают с признаками
+        rescore([str(directory.parent)], str(output), fields=FIELDS[:1], our_date=OUR_DATE, workers=1, resume=True)
+
+def test_duplicate_keys(tmp_path):
+    directory = write_pairs(tmp_path / 'in')
+    archive = make_tar(tmp_path / 'pairs.tar', directory)
+    assert sorted(key for key, _, _ in find_pairs([archive])) == sorted('a/%d' % seed for seed in range(PAIRS))
+    # Одинаковые относительные пути в разных входах - одна и та же пара
+    with pytest.raises(ValueError, match='a/0'):
+        list(find_pairs([str(directory.parent), archive]))
+    # Повтор файла внутри одного архива
+    with tarfile.open(archive, 'a') as tar:
+        tar.add(str(directory / '0_score.xml'), arcname='a/0_score.xml')
+    with pytest.raises(ValueError, match='a/0'):
+        list(find_pairs([archive]))
+    # Разные подкаталоги не смешиваются
+    write_pairs(tmp_path / 'in', 'b')
+    assert len(list(find_pairs([str(directory.parent)]))) == 2 * PAIRS
+
+@pytest.mark.parametrize('mode, suffix', [('w', '.tar'), ('w:gz', '.tar.gz'), ('zip', '.zip')])
+def test_truncated_archive(tmp_path, capsys, mode, suffix):
+    directory = write_pairs(tmp_path / 'in')
+    path = tmp_path / ('pairs' + suffix)
+    if mode == 'zip':
+        with zipfile.ZipFile(str(path), 'w') as archive:
+            for file in sorted(directory.iterdir()):
+                archive.write(str(file), 'a/' + file.name)
+    else:
+        make_tar(path, directory, mode)
+    data = path.read_bytes()
+    path.write_bytes(data[:len(data) // 2])
+    with pytest.raises(ValueError, match=str(path)):
+        list(find_pairs([str(path)]))
+
+    output = tmp_path / 'features.csv'
+    assert main([str(path), '-o', str(output), '--workers', '1', '--date', '2026-01-01']) == 2
+    message = capsys.readouterr().err
+    assert str(path) in message and 'Traceback' not in message
+
+def test_missing_input(tmp_path):
+    with pytest.raises(ValueError):
+        list(find_pairs([str(tmp_path / 'missing.tar')]))
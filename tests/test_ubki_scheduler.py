@@ -0,0 +1,166 @@
+""" Планировщик запросов на подменных часах: пополнение ведра токенов, порядок классов приоритета,
+отказы 'queue_full' и 'deadline'. Реальное время ожидания не влияет на результат: скорость выбрана так,
+что токен на реальных часах не освободится, а часы планировщика сдвигает сам тест
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from ubkisaas import ubki_scheduler
+from ubkisaas.ubki_scheduler import AsyncRequestScheduler, RequestDropped, RequestScheduler, TokenBucket
+
+RATE = 0.01 # Токен раз в 100 секунд
+STEP = 1 / RATE
+
+class FakeTime():
+    """ Подмена модуля time в ubki_scheduler """
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeTime()
+    monkeypatch.setattr(ubki_scheduler, 'time', clock)
+    return clock
+
+def wait_until(condition):
+    for _ in range(500):
+        if condition():
+            return
+        time.sleep(0.01)
+    raise AssertionError("Условие не выполнилось")
+
+def queued(scheduler, priority):
+    return scheduler.get_stats()['queued']['xml'][priority]
+
+def test_token_refill(clock):
+    bucket = TokenBucket(2, 2)
+    for _ in range(2):
+        assert bucket.get_delay(clock.now) == 0
+        bucket.take()
+    assert bucket.get_delay(clock.now) == pytest.approx(0.5)
+    assert bucket.get_delay(clock.now + 0.25) == pytest.approx(0.25)
+    assert bucket.get_delay(clock.now + 0.5) == 0
+    assert bucket.get_delay(clock.now + 0.5, 2) == pytest.approx(0.5)
+    # Емкость ограничена burst, сколько бы ни прошло времени
+    assert bucket.get_delay(clock.now + 100) == 0
+    assert bucket.tokens == 2
+    assert bucket.get_delay(clock.now + 100, 3) == pytest.approx(0.5)
+
+def test_burst_then_rate(clock):
+    scheduler = RequestScheduler({'xml': (RATE, 2)})
+    scheduler.acquire('xml')
+    scheduler.acquire('xml')
+    with pytest.raises(RequestDropped) as error:
+        scheduler.acquire('xml', deadline = clock.now + STEP / 2)
+    assert error.value.reason == 'deadline'
+    clock.now += STEP
+    scheduler.acquire('xml', deadline = clock.now)
+    assert scheduler.get_stats() == {'granted': 3, 'dropped': 1, 'queued': {'xml': {'interactive': 0, 'batch': 0}}}
+
+def test_unlimited_endpoint_and_unknown_priority(clock):
+    scheduler = RequestScheduler({'xml': RATE})
+    for _ in range(10):
+        scheduler.acquire('auth')
+    with pytest.raises(ValueError):
+        scheduler.acquire('xml', 'urgent')
+
+def test_priority_order(clock):
+    scheduler = RequestScheduler({'xml': (RATE, 1)})
+    scheduler.acquire('xml')
+    order = []
+    def worker(priority):
+        scheduler.acquire('xml', priority)
+        order.append(priority)
+    def wake():
+        with scheduler._condition:
+            scheduler._condition.notify_all()
+    threads = []
+    for priority in ('batch', 'interactive'): # Пакетный запрос ждет дольше, но интерактивный важнее
+        threads.append(threading.Thread(target=worker, args=(priority,), daemon=True))
+        threads[-1].start()
+        wait_until(lambda: queued(scheduler, priority) == 1)
+    clock.now += STEP
+    wake()
+    wait_until(lambda: len(order) == 1)
+    assert order == ['interactive'] and queued(scheduler, 'batch') == 1
+    clock.now += STEP
+    wake()
+    for thread in threads:
+        thread.join(5)
+    assert order == ['interactive', 'batch']
+    assert scheduler.get_stats()['granted'] == 3
+
+def test_queue_full(clock):
+    scheduler = RequestScheduler({'xml': (RATE, 1)}, max_queue = 1)
+    scheduler.acquire('xml')
+    thread = threading.Thread(target=scheduler.acquire, args=('xml', 'batch'), daemon=True)
+    thread.start()
+    wait_until(lambda: queued(scheduler, 'batch') == 1)
+    with pytest.raises(RequestDropped) as error:
+        scheduler.acquire('xml', 'batch')
+    assert error.value.reason == 'queue_full' and error.value.priority == 'batch'
+    # Очередь другого класса приоритета не заполнена, но ее запрос не успевает к крайнему сроку
+    with pytest.raises(RequestDropped) as error:
+        scheduler.acquire('xml', 'interactive', deadline = clock.now + 1)
+    assert error.value.reason == 'deadline'
+    assert queued(scheduler, 'interactive') == 0
+    clock.now += STEP
+    with scheduler._condition:
+        scheduler._condition.notify_all()
+    thread.join(5)
+    assert scheduler.get_stats()['dropped'] == 2 and queued(scheduler, 'batch') == 0
+
+def async_wake(scheduler):
+    changed, scheduler._changed = scheduler._changed, None
+    if changed is not None:
+        changed.set()
+
+def test_async_priority_order(clock):
+    async def run():
+        scheduler = AsyncRequestScheduler({'xml': (RATE, 1)}, max_queue = 1)
+        await scheduler.acquire('xml')
+        order = []
+        async def worker(priority):
+            await scheduler.acquire('xml', priority)
+            order.append(priority)
+        tasks = []
+        for priority in ('batch', 'interactive'):
+            tasks.append(asyncio.ensure_future(worker(priority)))
+            await asyncio.sleep(0)
+        assert queued(scheduler, 'batch') == queued(scheduler, 'interactive') == 1
+        with pytest.raises(RequestDropped) as error:
+            await scheduler.acquire('xml', 'batch')
+        assert error.value.reason == 'queue_full'
+        with pytest.raises(RequestDropped) as error:
+            await scheduler.acquire('xml', 'batch', deadline = clock.now + 1)
+        assert error.value.reason == 'queue_full'
+        clock.now += STEP
+        async_wake(scheduler)
+        for _ in range(5):
+            await asyncio.sleep(0)
+        assert order == ['interactive']
+        clock.now += STEP
+        async_wake(scheduler)
+        await asyncio.wait_for(asyncio.gather(*tasks), 5)
+        assert order == ['interactive', 'batch']
+        assert scheduler.get_stats()['dropped'] == 2
+    asyncio.run(run())
+
+def test_async_deadline(clock):
+    async def run():
+        scheduler = AsyncRequestScheduler({'xml': (RATE, 1)})
+        await scheduler.acquire('xml')
+        with pytest.raises(RequestDropped) as error:
+            await scheduler.acquire('xml', 'interactive', deadline = clock.now + STEP / 2)
+        assert error.value.reason == 'deadline'
+        assert queued(scheduler, 'interactive') == 0
+        clock.now += STEP
+        await scheduler.acquire('xml', 'interactive', deadline = clock.now)
+        assert scheduler.get_stats()['granted'] == 2
+    asyncio.run(run())
@@ -0,0 +1,118 @@
+""" Хранилище сессионных ключей: одна авторизация на все потоки и процессы, срок жизни, отклоненный ключ """
+from ubkisaas import ubki_session_store
+from ubkisaas.ubki_session_store import SessionStore
+
+import multiprocessing
+import threading
+import asyncio
+import json
+import time
+import os
+import pytest
+
+KEY = 'test:login'
+
+class Authorizer():
+    """ Функция авторизации, выдающая ключи S1, S2, ... и считающая вызовы """
+    def __init__(self, delay:float = 0):
+        self.delay = delay
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self) -> str:
+        time.sleep(self.delay)
+        with self._lock:
+            self.calls += 1
+            return 'S%d' % self.calls
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'keys.json')
+
+def test_concurrent_get_sessid_authorizes_once(path):
+    authorize = Authorizer(delay=0.2)
+    stores = [SessionStore(path) for _ in range(4)] # Отдельные экземпляры: между ними работает только flock
+    results = []
+    threads = [threading.Thread(target=lambda store=store: results.append(store.get_sessid(KEY, authorize)))
+               for store in stores for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert authorize.calls == 1
+    assert results == ['S1'] * len(threads)
+
+def _get_sessid_in_process(path:str, counter:str) -> str:
+    def authorize():
+        time.sleep(0.2)
+        with open(counter, 'a') as file:
+            file.write('x')
+        return 'S%d' % os.getpid()
+    return SessionStore(path).get_sessid(KEY, authorize)
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='нужен fork')
+def test_concurrent_processes_authorize_once(path, tmp_path):
+    counter = str(tmp_path / 'calls')
+    with multiprocessing.get_context('fork').Pool(4) as pool:
+        results = pool.starmap(_get_sessid_in_process, [(path, counter)] * 4)
+    with open(counter) as file:
+        assert file.read() == 'x'
+    assert len(set(results)) == 1
+
+def test_save_is_atomic_json(path):
+    store = SessionStore(path)
+    store.get_sessid(KEY, Authorizer())
+    store.get_sessid('other', Authorizer())
+    with open(path) as file:
+        tokens = json.load(file)
+    assert set(tokens) == {KEY, 'other'}
+    assert not [name for name in os.listdir(os.path.dirname(path)) if name.endswith('.tmp')]
+
+def test_ttl_expiry(path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ubki_session_store.time, 'time', lambda: now[0])
+    authorize = Authorizer()
+    store = SessionStore(path, ttl=60)
+    assert store.get_sessid(KEY, authorize) == 'S1'
+    now[0] += 59
+    assert store.get_sessid(KEY, authorize) == 'S1'
+    assert SessionStore(path, ttl=60).get_cached(KEY) == 'S1' # Ключ читается из файла другим экземпляром
+    now[0] += 2
+    assert store.get_cached(KEY) is None
+    assert store.get_sessid(KEY, authorize) == 'S2'
+    assert authorize.calls == 2
+
+def test_rejected_sessid_forces_new_one(path):
+    authorize = Authorizer()
+    store = SessionStore(path)
+    assert store.get_sessid(KEY, authorize) == 'S1'
+    assert store.get_sessid(KEY, authorize, rejected='S1') == 'S2'
+    assert SessionStore(path).get_sessid(KEY, authorize, rejected='S1') == 'S2' # Другой процесс видит новый ключ
+    assert store.get_sessid(KEY, authorize, rejected='S0') == 'S2'
+    assert authorize.calls == 2
+
+def test_cancelled_async_get_sessid_releases_lock(path):
+    pytest.importorskip('aiohttp')
+    from ubkisaas.ubki_async_request import AsyncUbkiRequest
+
+    class Request(AsyncUbkiRequest):
+        async def ubki_authorization(self, login:str, password:str) -> str:
+            return 'S1'
+
+    async def main():
+        store = SessionStore(path)
+        request = Request('login', 'password', session_store=store)
+        held = store.lock()
+        held.acquire()
+        task = asyncio.ensure_future(request.get_sessid())
+        await asyncio.sleep(0.1) # Задача ждет блокировку в потоке пула
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        threading.Timer(0.1, held.release).start()
+        try:
+            return await asyncio.wait_for(request.get_sessid(), 5)
+        finally:
+            await request.close()
+
+    assert asyncio.run(main()) == 'S1'
@@ -0,0 +1,145 @@
+""" Объединение одновременных вызовов: один вызов функции на ключ, общий результат и общая ошибка,
+ключ освобождается после завершения, в том числе после ошибки и отмены ожидающих
+"""
+import asyncio
+import threading
+
+import pytest
+
+from ubkisaas.ubki_single_flight import AsyncSingleFlight, SingleFlight
+
+CALLERS = 8
+
+def run_threads(flight, function, key='key'):
+    """ Запуск CALLERS потоков с одним ключом, функция которых ждет, пока все потоки войдут в do """
+    outcomes = [None] * CALLERS
+    def call(index):
+        try:
+            outcomes[index] = flight.do(key, function)
+        except Exception as error:
+            outcomes[index] = error
+    threads = [threading.Thread(target=call, args=(index,)) for index in range(CALLERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    return outcomes
+
+def blocking(flight, outcome):
+    """ Функция, завершающаяся (результатом или исключением outcome), только когда все CALLERS потоков
+    уже присоединились к вызову """
+    calls = []
+    def function():
+        calls.append(1)
+        for _ in range(500):
+            if flight.get_stats()['calls'] >= CALLERS:
+                break
+            threading.Event().wait(0.01)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+    return function, calls
+
+def test_concurrent_calls_run_once():
+    flight = SingleFlight()
+    function, calls = blocking(flight, 'report')
+    assert run_threads(flight, function) == ['report'] * CALLERS
+    assert len(calls) == 1
+    assert flight.get_stats() == {'calls': CALLERS, 'coalesced': CALLERS - 1, 'in_flight': 0}
+
+def test_error_reaches_every_caller():
+    flight = SingleFlight()
+    error = ValueError('ubki')
+    function, calls = blocking(flight, error)
+    assert run_threads(flight, function) == [error] * CALLERS
+    assert len(calls) == 1
+    assert flight.get_stats()['in_flight'] == 0
+    # Ключ освобожден: следующий вызов снова выполняет функцию
+    assert flight.do('key', lambda: 'retry') == 'retry'
+
+def test_different_keys_are_not_coalesced():
+    flight = SingleFlight()
+    assert [flight.do(key, lambda key = key: key) for key in ('a', 'b')] == ['a', 'b']
+    assert flight.get_stats() == {'calls': 2, 'coalesced': 0, 'in_flight': 0}
+
+def test_async_concurrent_calls_run_once():
+    async def run():
+        flight = AsyncSingleFlight()
+        release = asyncio.Event()
+        calls = []
+        async def function():
+            calls.append(1)
+            await release.wait()
+            return 'report'
+        waiters = [asyncio.ensure_future(flight.do('key', function)) for _ in range(CALLERS)]
+        await asyncio.sleep(0)
+        release.set()
+        assert await asyncio.gather(*waiters) == ['report'] * CALLERS
+        assert len(calls) == 1
+        await asyncio.sleep(0)
+        assert flight.get_stats() == {'calls': CALLERS, 'coalesced': CALLERS - 1, 'in_flight': 0}
+    asyncio.run(run())
+
+def test_async_error_reaches_every_caller():
+    async def run():
+        flight = AsyncSingleFlight()
+        release = asyncio.Event()
+        async def function():
+            await release.wait()
+            raise ValueError('ubki')
+        waiters = [asyncio.ensure_future(flight.do('key', function)) for _ in range(CALLERS)]
+        await asyncio.sleep(0)
+        release.set()
+        outcomes = await asyncio.gather(*waiters, return_exceptions=True)
+        assert all(isinstance(outcome, ValueError) for outcome in outcomes)
+        await asyncio.sleep(0)
+        assert flight.get_stats()['in_flight'] == 0
+        async def retry():
+            return 'retry'
+        assert await flight.do('key', retry) == 'retry'
+    asyncio.run(run())
+
+@pytest.mark.parametrize('outcome', ['report', ValueError('ubki')], ids=['result', 'error'])
+def test_async_cancelled_waiter(outcome):
+    """ Отмена одного ожидающего не отменяет вызов для остальных, после завершения ключ освобождается """
+    async def run():
+        flight = AsyncSingleFlight()
+        release = asyncio.Event()
+        calls = []
+        async def function():
+            calls.append(1)
+            await release.wait()
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+        cancelled = asyncio.ensure_future(flight.do('key', function))
+        waiter = asyncio.ensure_future(flight.do('key', function))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.sleep(0)
+        assert cancelled.cancelled() and flight.get_stats()['in_flight'] == 1
+        release.set()
+        result = await asyncio.gather(waiter, return_exceptions=True)
+        assert result == [outcome] and len(calls) == 1
+        await asyncio.sleep(0)
+        assert flight.get_stats()['in_flight'] == 0
+    asyncio.run(run())
+
+def test_async_all_waiters_cancelled():
+    """ Если отменены все ожидающие, вызов завершается в фоне и ключ освобождается """
+    async def run():
+        flight = AsyncSingleFlight()
+        release = asyncio.Event()
+        async def function():
+            await release.wait()
+            raise ValueError('ubki')
+        waiters = [asyncio.ensure_future(flight.do('key', function)) for _ in range(CALLERS)]
+        await asyncio.sleep(0)
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        release.set()
+        for _ in range(3):
+            await asyncio.sleep(0)
+        assert flight.get_stats()['in_flight'] == 0
+    asyncio.run(run())
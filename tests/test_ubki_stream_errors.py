@@ -0,0 +1,48 @@
+""" Совпадение ошибок потоковых сканеров (метрика ubki.extract.error) с эталоном xmltodict + get_useful_*_fields """
+from ubkisaas.ubki_stream import extract_credit_report_fields, extract_credit_score_fields
+from ubkisaas.ubki_credit_report import get_useful_credit_report_fields
+from ubkisaas.ubki_credit_score import get_useful_credit_score_fields
+from ubkisaas.ubki_synthetic import generate_credit_report_xml, generate_credit_score_xml
+from ubkisaas.ubki_metrics import InMemoryMetrics, set_metrics_sink
+from test_ubki_stream_parity import REPORTS, SCORES, PHONE, EMAIL, OUR_DATE
+
+import pytest
+
+xmltodict = pytest.importorskip('xmltodict')
+
+@pytest.fixture
+def metrics():
+    sink = InMemoryMetrics()
+    set_metrics_sink(sink)
+    yield sink
+    set_metrics_sink(None)
+
+def get_errors(metrics:InMemoryMetrics) -> dict:
+    errors = {key: stat['count'] for key, stat in metrics.get_stats().items() if key.startswith('ubki.extract.error')}
+    metrics.clear()
+    return errors
+
+def check_report(xml:str, metrics:InMemoryMetrics):
+    get_useful_credit_report_fields(xmltodict.parse(xml), PHONE, EMAIL, OUR_DATE)
+    expected = get_errors(metrics)
+    extract_credit_report_fields(xml, PHONE, EMAIL, OUR_DATE)
+    assert get_errors(metrics) == expected
+
+def check_score(xml:str, metrics:InMemoryMetrics):
+    get_useful_credit_score_fields(xmltodict.parse(xml))
+    expected = get_errors(metrics)
+    extract_credit_score_fields(xml)
+    assert get_errors(metrics) == expected
+
+@pytest.mark.parametrize('name', list(REPORTS))
+def test_credit_report_errors(name, metrics):
+    check_report(REPORTS[name], metrics)
+
+@pytest.mark.parametrize('name', list(SCORES))
+def test_credit_score_errors(name, metrics):
+    check_score(SCORES[name], metrics)
+
+def test_synthetic_errors(metrics):
+    for seed in range(20):
+        check_report(generate_credit_report_xml(seed, comps=12, crdeals=10, deallifes=12, conts=10, credres=10), metrics)
+        check_score(generate_credit_score_xml(seed, seed % 4), metrics)
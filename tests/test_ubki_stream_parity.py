@@ -0,0 +1,174 @@
+""" Совпадение потоковых сканеров ubki_stream с эталоном xmltodict + get_useful_*_fields """
+from ubkisaas.ubki_stream import (extract_credit_report_fields, extract_credit_score_fields,
+                                  CreditReportScanner, CreditScoreScanner)
+from ubkisaas.ubki_credit_report import get_useful_credit_report_fields
+from ubkisaas.ubki_credit_score import get_useful_credit_score_fields
+
+import datetime
+import random
+import pytest
+
+xmltodict = pytest.importorskip('xmltodict')
+
+PHONE = '+380111656411'
+EMAIL = 'email@gmail.com'
+OUR_DATE = datetime.datetime(2026, 1, 1)
+
+HEAD = '<?xml version="1.0" encoding="utf-8"?>'
+TECH = '<tech><billing><balance value="3629.26" currency="UAH"/></billing></tech>'
+PERSON = ('<comp id="1"><cki><ident cgrag="804" sstate="2" family="1" ceduc="3"/>'
+          '<work cdolgn="2" wdohod="48000" wstag="14"/></cki></comp>')
+CREDITS = ('<comp id="2"><crdeal dlamt="1500" dlds="2018-12-10"><deallife dlds="2018-12-10" dlamtcur="1500" dlamtexp="10"/></crdeal>'
+           '<crdeal dlamt="39100" dlds="2021-08-20"><deallife dlds="2021-08-20" dlamtcur="900"/><deallife dlds="2021-09-20" dlamtcur="100"/></crdeal></comp>')
+QUERIES = ('<comp id="4"><reestrtime wk="2"/><credres reqreason="2"/><credres reqreason="0"/>'
+           '<credres reqreason="4"/></comp>')
+CONTACTS = ('<comp id="10"><cont cval="380111656411" vdate="2014-06-20"/><cont cval="+380111656411" vdate="2012-01-02"/>'
+            '<cont cval="EMAIL@GMAIL.COM" vdate="2020-05-25"/><cont cval="+380697444855" vdate="2005-03-17"/></comp>')
+RATING = ('<comp id="8"><urating score="607" scorelast="560" scorelevel="4">'
+          '<dinfo all="8" open="1" close="7" expyear="да" maxnowexp="30 дней"/></urating></comp>')
+
+def report(*parts:str) -> str:
+    return HEAD + '<ubkidata>' + ''.join(parts) + '</ubkidata>'
+
+REPORTS = {
+    'full': report(TECH, PERSON, CREDITS, QUERIES, CONTACTS),
+    'repeated_ident': report(PERSON.replace('<ident ', '<ident cgrag="100" sstate="1" family="2" ceduc="1"/><ident ')),
+    'single_ident': report(PERSON.replace('<work cdolgn="2" wdohod="48000" wstag="14"/>', ''), CREDITS),
+    'repeated_work': report(PERSON.replace('<work ', '<work cdolgn="NA" wdohod="" wstag="3"/><work '), QUERIES),
+    'single_crdeal': report(CREDITS[:CREDITS.index('<crdeal dlamt="39100"')] + '</comp>', QUERIES),
+    'single_deallife': report(CREDITS.replace('<deallife dlds="2021-09-20" dlamtcur="100"/>', ''), QUERIES),
+    'empty_crdeal': report(CREDITS.replace('</comp>', '<crdeal/></comp>'), QUERIES),
+    'crdeal_without_attrs': report(CREDITS.replace('</comp>', '<crdeal><deallife dlds="2020-01-01" dlamtcur="1"/>'
+                                                              '</crdeal></comp>'), QUERIES),
+    'crdeal_without_deallife': report(CREDITS.replace('</comp>', '<crdeal dlamt="5"/></comp>'), QUERIES),
+    'empty_deallife': report(CREDITS.replace('<deallife dlds="2021-09-20" dlamtcur="100"/>', '<deallife/>'), QUERIES),
+    'deallife_without_dlamtcur': report(CREDITS.replace('dlamtcur="100"', 'dlamtexp="3"'), QUERIES),
+    'bad_dlamtcur': report(CREDITS.replace('dlamtcur="900"', 'dlamtcur="много"'), QUERIES),
+    'single_credres': report(QUERIES.replace('<credres reqreason="0"/><credres reqreason="4"/>', ''), CONTACTS),
+    'single_cont': report(TECH, CONTACTS.replace('<cont cval="380111656411" vdate="2014-06-20"/>', '')
+                          .replace('<cont cval="EMAIL@GMAIL.COM" vdate="2020-05-25"/>', '')
+                          .replace('<cont cval="+380697444855" vdate="2005-03-17"/>', ''), QUERIES),
+    'single_comp': report(TECH, PERSON),
+    'empty_comps': report(TECH, '<comp id="1"/>', '<comp id="2"/>', '<comp id="4"/>', '<comp id="10"/>'),
+    'no_comps': report(TECH),
+    'empty_root': HEAD + '<ubkidata/>',
+    'other_root': HEAD + '<doc><comp id="1"/></doc>',
+    'empty_comp_without_id': report(PERSON, '<comp/>', CREDITS, QUERIES),
+    'comp_without_id': report(PERSON, '<comp name="x"/>', CREDITS, QUERIES),
+    'comp_without_attrs': report(PERSON, '<comp><item/></comp>', CREDITS, QUERIES),
+    'missing_attrs': report('<tech><billing><balance currency="UAH"/></billing></tech>',
+                            '<comp id="1"><cki><ident cgrag="804"/><work wdohod="1"/></cki></comp>',
+                            '<comp id="2"><crdeal dlds="2018-12-10"/><crdeal dlamt="5"/></comp>',
+                            '<comp id="4"><credres/><credres reqreason="2"/></comp>',
+                            '<comp id="10"><cont cval="380111656411"/><cont vdate="2012-01-02"/></comp>'),
+    'bad_values': report('<tech><billing><balance value="abc"/></billing></tech>',
+                         CREDITS.replace('2018-12-10', '2018-13-40'), QUERIES.replace('wk="2"', 'wk="x"'),
+                         CONTACTS.replace('2012-01-02', 'never')),
+    'repeated_tech': report(TECH, TECH, PERSON, QUERIES),
+    'empty_tech': report('<tech/>', PERSON, QUERIES),
+    'namespaces': HEAD + '<ubkidata xmlns="urn:ubki" xmlns:u="urn:ubki:ext">' + TECH + PERSON
+                  + '<u:comp id="3"><u:item/></u:comp>' + CREDITS.replace('<crdeal ', '<crdeal u:ref="1" ')
+                  + '<comp id="10"><u:cont cval="380111656411" vdate="2014-06-20"/><cont cval="+380111656411" '
+                    'vdate="2012-01-02"/></comp></ubkidata>',
+}
+
+SCORES = {
+    'full': report(RATING, '<comp id="3"/>'),
+    'rating_first_only': report(RATING, RATING.replace('607', '1')),
+    'rating_after_other': report('<comp id="3"/>', RATING),
+    'single_comp': report(RATING),
+    'no_comps': report(TECH),
+    'empty_root': HEAD + '<ubkidata/>',
+    'empty_comp_without_id': report('<comp/>', RATING),
+    'comp_without_id': report('<comp name="x"><item/></comp>', RATING),
+    'comp_without_id_after_rating': report(RATING, '<comp name="x"/>'),
+    'missing_attrs': report('<comp id="8"><urating score="607"><dinfo open="1"/></urating></comp>', '<comp id="3"/>'),
+    'null_values': report(RATING.replace('607', 'NA').replace('"1"', '""').replace('да', 'null'), '<comp id="3"/>'),
+    'no_dinfo': report('<comp id="8"><urating score="607" scorelast="560" scorelevel="4"/></comp>', '<comp id="3"/>'),
+    'namespaces': HEAD + '<ubkidata xmlns:u="urn:ubki:ext"><u:comp id="3"/>' + RATING + '</ubkidata>',
+}
+
+SEEDS = range(20)
+SIZES = [dict(crdeals=0, deallifes=0, conts=0, credres=0),
+         dict(crdeals=1, deallifes=1, conts=1, credres=1),
+         dict(crdeals=10, deallifes=24, conts=10, credres=10),
+         dict(crdeals=50, deallifes=60, conts=50, credres=50)]
+
+def element(tag:str, attrs:dict, children:list = ()) -> str:
+    attrs = ''.join(' %s="%s"' % (key, value) for key, value in attrs.items())
+    return '<%s%s>%s</%s>' % (tag, attrs, ''.join(children), tag) if children else '<%s%s/>' % (tag, attrs)
+
+def random_report(seed:int, crdeals:int, deallifes:int, conts:int, credres:int) -> str:
+    """ Случайный кредитный отчет: пропуски, пустые и ошибочные значения встречаются с заметной вероятностью """
+    rnd = random.Random(seed)
+    def date():
+        return rnd.choice(['2019-03-01', '2020-11-30', '2021-02-29', '', 'NA']) if rnd.random() < 0.1 else \
+            (datetime.date(2005, 1, 1) + datetime.timedelta(days=rnd.randint(0, 7000))).isoformat()
+    def value(low:int, high:int):
+        return rnd.choice(['', 'NA', 'null', 'x']) if rnd.random() < 0.1 else str(rnd.randint(low, high))
+    def maybe(attrs:dict) -> dict:
+        return {key: item for key, item in attrs.items() if rnd.random() > 0.05}
+    blocks = [element('tech', {}, [element('billing', {}, [element('balance', maybe({'value': value(0, 5000)}))])])]
+    if crdeals or deallifes or conts or credres:
+        blocks.append(element('comp', {'id': '1'}, [element('cki', {}, [
+            element('ident', maybe({key: value(1, 6) for key in ('cgrag', 'sstate', 'family', 'ceduc')})),
+            element('work', maybe({'cdolgn': value(1, 9), 'wdohod': value(0, 60000), 'wstag': value(0, 30)}))])]))
+    blocks.append(element('comp', {'id': '2'}, [
+        element('crdeal', maybe({'dlamt': value(100, 90000), 'dlds': date()}), [
+            element('deallife', maybe({'dlds': date(), 'dlamtcur': value(0, 90000)}))
+            for _ in range(rnd.randint(min(1, deallifes), deallifes))])
+        for _ in range(crdeals)]))
+    blocks.append(element('comp', {'id': '4'}, [element('reestrtime', maybe({'wk': value(0, 9)}))] +
+                          [element('credres', maybe({'reqreason': value(0, 4)})) for _ in range(credres)]))
+    contacts = [PHONE, PHONE.lstrip('+'), EMAIL.upper(), '+380697444855', 'other@mail.com']
+    blocks.append(element('comp', {'id': '10'}, [element('cont', maybe({'cval': rnd.choice(contacts), 'vdate': date()}))
+                                                for _ in range(conts)]))
+    return report(*blocks)
+
+def random_score(seed:int, comps:int) -> str:
+    rnd = random.Random(seed)
+    rating = element('comp', {'id': '8'}, [element('urating', {
+        'score': str(rnd.randint(1, 999)), 'scorelast': rnd.choice(['', str(rnd.randint(1, 999))]),
+        'scorelevel': str(rnd.randint(1, 5))}, [element('dinfo', {
+            'all': str(rnd.randint(0, 30)), 'open': str(rnd.randint(0, 30)), 'close': str(rnd.randint(0, 30)),
+            'expyear': rnd.choice(['да', 'нет']), 'maxnowexp': rnd.choice(['нет', '30 дней', '90 дней'])})])])
+    return report(*([rating] + [element('comp', {'id': str(3 + i)}) for i in range(comps - 1)] if comps else []))
+
+def chunks(xml:str, size:int):
+    data = xml.encode('utf-8')
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+def check_report(xml:str):
+    expected = get_useful_credit_report_fields(xmltodict.parse(xml), PHONE, EMAIL, OUR_DATE)
+    assert extract_credit_report_fields(xml, PHONE, EMAIL, OUR_DATE) == expected
+    assert extract_credit_report_fields(xml.encode('utf-8'), PHONE, EMAIL, OUR_DATE) == expected
+    scanner = CreditReportScanner()
+    for chunk in chunks(xml, 7): # Границы частей посреди элементов и многобайтовых символов
+        scanner.feed(chunk)
+    assert scanner.close().get_fields(PHONE, EMAIL, OUR_DATE) == expected
+
+def check_score(xml:str):
+    expected = get_useful_credit_score_fields(xmltodict.parse(xml))
+    assert extract_credit_score_fields(xml) == expected
+    scanner = CreditScoreScanner()
+    for chunk in chunks(xml, 5):
+        scanner.feed(chunk)
+    assert scanner.close().get_fields() == expected
+
+@pytest.mark.parametrize('name', list(REPORTS))
+def test_credit_report_edge_cases(name):
+    check_report(REPORTS[name])
+
+@pytest.mark.parametrize('name', list(SCORES))
+def test_credit_score_edge_cases(name):
+    check_score(SCORES[name])
+
+@pytest.mark.parametrize('sizes', SIZES, ids=['empty', 'single', 'medium', 'large'])
+def test_random_reports(sizes):
+    for seed in SEEDS:
+        check_report(random_report(seed, **sizes))
+
+@pytest.mark.parametrize('comps', [0, 1, 2, 5])
+def test_random_scores(comps):
+    for seed in SEEDS:
+        check_score(random_score(seed, comps))
@@ -0,0 +1,167 @@
+""" Потоковое получение отчетов с обрывом посреди тела ответа: повтор начинается с нового сканера,
+а признаки совпадают с признаками отчета, полученного целиком """
+from ubkisaas.ubki_request import UbkiRequest
+from ubkisaas.ubki_session_store import SessionStore
+from ubkisaas.ubki_stream import StreamedResponse
+from ubkisaas.ubki_transport import UbkiTransport, AsyncUbkiTransport, RetryPolicy
+from ubkisaas.ubki_features import compile_features
+from ubkisaas.ubki_report import UbkiReport
+from ubkisaas.ubki_synthetic import generate_credit_report_xml, generate_credit_score_xml
+
+import asyncio
+import pytest
+
+requests = pytest.importorskip('requests')
+
+from urllib3.exceptions import ProtocolError, ReadTimeoutError
+
+REPORT = generate_credit_report_xml(7)
+SCORE = generate_credit_score_xml(7)
+AUTH = "{'doc': {'auth': {'sessid': 'S1'}}}"
+CHUNK = 997 # Части не совпадают с границами элементов и символов utf-8
+
+class FakeResponse():
+    def __init__(self, body: bytes, error: Exception = None):
+        self.status_code = 200
+        self.body = body
+        self.error = error
+        self.text = body.decode('utf-8')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def iter_content(self, chunk_size):
+        size = min(CHUNK, len(self.body) // 4 + 1)
+        for start in range(0, len(self.body), size):
+            if self.error is not None and start >= len(self.body) // 2:
+                raise self.error
+            yield self.body[start:start + size]
+
+class FakeSession():
+    """ Сессия requests, которая на первые запросы шаблона обрывает ответ ошибками failures[reqtype] """
+    def __init__(self, failures: dict):
+        self.failures = {reqtype: list(errors) for reqtype, errors in failures.items()}
+        self.calls = {10: 0, 11: 0}
+
+    def post(self, url, data = None, **kwargs):
+        if url.endswith('/auth'):
+            return FakeResponse(AUTH.encode('utf-8'))
+        reqtype = 10 if b'reqtype="10"' in data else 11
+        self.calls[reqtype] += 1
+        errors = self.failures.get(reqtype)
+        return FakeResponse((REPORT if reqtype == 10 else SCORE).encode('utf-8'), errors.pop(0) if errors else None)
+
+    def close(self):
+        pass
+
+def make_request(tmp_path, failures: dict, stream: bool = True, keep_xml: bool = False) -> UbkiRequest:
+    transport = UbkiTransport(retry_policy=RetryPolicy(retries=2, backoff=0))
+    transport.session = FakeSession(failures)
+    return UbkiRequest('login', 'password', is_test=True, transport=transport, stream=stream, keep_xml=keep_xml,
+                       session_store=SessionStore(str(tmp_path / 'keys.json')))
+
+def record_responses(request: UbkiRequest) -> list:
+    created = []
+    create_response = request._create_response
+    def wrapper(reqtype):
+        created.append((reqtype, create_response(reqtype)))
+        return created[-1][1]
+    request._create_response = wrapper
+    return created
+
+BROKEN = [requests.exceptions.ChunkedEncodingError('Connection broken: IncompleteRead'),
+          requests.ConnectionError(ProtocolError('Connection broken: reset'))]
+
+@pytest.mark.parametrize('error', BROKEN, ids=lambda error: type(error).__name__)
+@pytest.mark.parametrize('keep_xml', [False, True])
+def test_retry_after_broken_body(tmp_path, error, keep_xml):
+    expected = make_request(tmp_path, {}, stream=False).get_person_credit_report().get_useful_ubki_fields()
+
+    request = make_request(tmp_path, {10: [error]}, keep_xml=keep_xml)
+    created = record_responses(request)
+    report = request.get_person_credit_report()
+    assert request.transport.session.calls == {10: 2, 11: 1}
+    # Повтор получил новый приемник с новым сканером, части оборванного ответа в нем нет
+    assert [reqtype for reqtype, _ in created] == [10, 10, 11]
+    broken, retried = created[0][1], created[1][1]
+    assert broken.scanner is not retried.scanner
+    assert 0 < broken.size < len(REPORT.encode('utf-8')) == retried.size
+    assert report.get_useful_ubki_fields() == expected
+    assert report.has_xml() == keep_xml
+    if keep_xml:
+        assert report.get_report_xml() == REPORT and report.get_score_xml() == SCORE
+
+def test_broken_body_in_every_attempt(tmp_path):
+    request = make_request(tmp_path, {11: BROKEN[:1] * 3})
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        request.get_person_credit_report()
+    assert request.transport.session.calls[11] == 3
+
+def test_read_timeout_mid_body_is_not_retried(tmp_path):
+    request = make_request(tmp_path, {10: [requests.ConnectionError(ReadTimeoutError(None, None, 'Read timed out'))]})
+    with pytest.raises(requests.ConnectionError):
+        request.get_person_credit_report()
+    assert request.transport.session.calls[10] == 1
+
+def test_transport_post_stream(tmp_path):
+    """ post_stream без UbkiRequest: сканер, заполненный по частям после обрыва, дает те же признаки """
+    transport = UbkiTransport(retry_policy=RetryPolicy(retries=1, backoff=0))
+    transport.session = FakeSession({10: BROKEN[:1]})
+    consumers = []
+    def create_consumer():
+        consumers.append(StreamedResponse(compile_features().create_scanner('report'), keep_xml=True))
+        return consumers[-1]
+    response = transport.post_stream('http://ubki/xml', b'reqtype="10"', create_consumer)
+    assert response is consumers[-1] and len(consumers) == 2 and response.status == 200
+    assert response.get_xml() == REPORT
+    score = StreamedResponse(compile_features().create_scanner('score')).feed_text(SCORE)
+    phone, email = '+380111656411', 'email@gmail.com'
+    assert UbkiReport.from_scanners(response.scanner, score.scanner, phone, email).get_useful_ubki_fields() == \
+        UbkiReport(REPORT, SCORE, phone, email).get_useful_ubki_fields()
+
+class AsyncFakeResponse(FakeResponse):
+    def __init__(self, body: bytes, error: Exception = None):
+        super().__init__(body, error)
+        self.status = self.status_code
+        self.content = self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+    async def iter_any(self):
+        for chunk in self.iter_content(CHUNK):
+            yield chunk
+
+class AsyncFakeSession(FakeSession):
+    def post(self, url, data = None, **kwargs):
+        response = super().post(url, data)
+        return AsyncFakeResponse(response.body, response.error)
+
+    async def close(self):
+        pass
+
+def test_async_retry_after_broken_body():
+    aiohttp = pytest.importorskip('aiohttp')
+    async def run():
+        transport = AsyncUbkiTransport(retry_policy=RetryPolicy(retries=1, backoff=0))
+        transport.session = session = AsyncFakeSession({10: [aiohttp.ClientPayloadError('Response payload is not completed')]})
+        consumers = []
+        def create_consumer():
+            consumers.append(StreamedResponse(compile_features().create_scanner('report'), keep_xml=True))
+            return consumers[-1]
+        response = await transport.post_stream('http://ubki/xml', b'reqtype="10"', create_consumer)
+        await transport.close()
+        return session, consumers, response
+    session, consumers, response = asyncio.run(run())
+    assert session.calls[10] == 2 and len(consumers) == 2 and response is consumers[1]
+    assert 0 < consumers[0].size < response.size
+    score = StreamedResponse(compile_features().create_scanner('score')).feed_text(SCORE)
+    phone, email = '+380111656411', 'email@gmail.com'
+    assert UbkiReport.from_scanners(response.scanner, score.scanner, phone, email).get_useful_ubki_fields() == \
+        UbkiReport(REPORT, SCORE, phone, email).get_useful_ubki_fields()
@@ -0,0 +1,125 @@
+""" Повторы транспорта: повторяются только ошибки установки соединения, обрывы и ответы 429/5xx,
+таймаут чтения ответа передается вызывающему после первой попытки
+"""
+import asyncio
+
+import pytest
+
+requests = pytest.importorskip('requests')
+
+from urllib3.exceptions import ReadTimeoutError
+
+from ubkisaas.ubki_transport import AsyncUbkiTransport, RetryPolicy, TransportError, UbkiTransport
+
+RETRIES = 2
+
+class FakeResponse():
+    text = 'ok'
+
+    def __init__(self, status):
+        self.status_code = self.status = status
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+class FakeSession():
+    """ Сессия, которая на каждую попытку выдает следующий элемент outcomes: исключение или код ответа """
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def next(self):
+        outcome = self.outcomes[min(self.calls, len(self.outcomes) - 1)]
+        self.calls += 1
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return FakeResponse(outcome)
+
+    def post(self, url, **kwargs):
+        return self.next()
+
+    def close(self):
+        pass
+
+def make_transport(outcomes):
+    transport = UbkiTransport(retry_policy=RetryPolicy(retries=RETRIES, backoff=0))
+    transport.session = FakeSession(outcomes)
+    return transport
+
+@pytest.mark.parametrize('error', [requests.ConnectionError(), requests.ConnectTimeout(),
+                                   requests.exceptions.ChunkedEncodingError()], ids=lambda error: type(error).__name__)
+def test_connection_errors_are_retried(error):
+    transport = make_transport([error, error, 200])
+    assert transport.post('http://ubki', '') == 'ok'
+    assert transport.session.calls == 3
+
+    transport = make_transport([error])
+    with pytest.raises(type(error)):
+        transport.post('http://ubki', '')
+    assert transport.session.calls == RETRIES + 1
+
+@pytest.mark.parametrize('error', [requests.ReadTimeout(), requests.ConnectionError(ReadTimeoutError(None, None, 'read'))],
+                         ids=['ReadTimeout', 'stream'])
+def test_read_timeout_is_not_retried(error):
+    transport = make_transport([error, 200])
+    with pytest.raises(type(error)):
+        transport.post('http://ubki', '')
+    assert transport.session.calls == 1
+
+def test_transient_statuses():
+    transport = make_transport([503, 429, 200])
+    assert transport.post_response('http://ubki', '') == (200, 'ok')
+    assert transport.session.calls == 3
+
+    transport = make_transport([502])
+    with pytest.raises(TransportError) as error:
+        transport.post('http://ubki', '')
+    assert error.value.status == 502 and transport.session.calls == RETRIES + 1
+
+    transport = make_transport([400, 200])
+    assert transport.post_response('http://ubki', '') == (400, 'ok')
+    assert transport.session.calls == 1
+
+class AsyncFakeResponse(FakeResponse):
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+    async def text(self):
+        return 'ok'
+
+class AsyncFakeSession(FakeSession):
+    def post(self, url, **kwargs):
+        response = self.next()
+        return AsyncFakeResponse(response.status)
+
+    async def close(self):
+        pass
+
+def async_post(outcomes):
+    transport = AsyncUbkiTransport(retry_policy=RetryPolicy(retries=RETRIES, backoff=0))
+    transport.session = session = AsyncFakeSession(outcomes)
+    async def run():
+        try:
+            return await transport.post('http://ubki', '')
+        finally:
+            await transport.close()
+    return session, run
+
+def test_async_timeouts():
+    aiohttp = pytest.importorskip('aiohttp')
+    connect_timeout = aiohttp.ConnectionTimeoutError()
+    session, run = async_post([connect_timeout, aiohttp.ClientPayloadError(), 200])
+    assert asyncio.run(run()) == 'ok'
+    assert session.calls == 3
+
+    for error in (aiohttp.SocketTimeoutError(), asyncio.TimeoutError()):
+        session, run = async_post([error, 200])
+        with pytest.raises(asyncio.TimeoutError):
+            asyncio.run(run())
+        assert session.calls == 1
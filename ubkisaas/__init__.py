@@ -1,4 +1,83 @@
-from .ubki_request import UbkiRequest
-from .ubki_report import UbkiReport
-from .ubki_credit_report import get_useful_credit_report_fields
-from .ubki_credit_score import get_useful_credit_score_fields
\ No newline at end of file
+from typing import TYPE_CHECKING
+import importlib
+
+# Имя -> модуль, из которого оно экспортируется. Модуль загружается при первом обращении к имени (PEP 562),
+# поэтому import ubkisaas не загружает ни http клиент, ни numpy
+_EXPORTS = {
+    'UbkiRequest': 'ubki_request',
+    'AsyncUbkiRequest': 'ubki_async_request',
+    'UbkiTransport': 'ubki_transport',
+    'AsyncUbkiTransport': 'ubki_transport',
+    'RetryPolicy': 'ubki_transport',
+    'TransportError': 'ubki_transport',
+    'SessionStore': 'ubki_session_store',
+    'ReportCache': 'ubki_report_cache',
+    'SingleFlight': 'ubki_single_flight',
+    'AsyncSingleFlight': 'ubki_single_flight',
+    'RequestScheduler': 'ubki_scheduler',
+    'AsyncRequestScheduler': 'ubki_scheduler',
+    'RequestDropped': 'ubki_scheduler',
+    'TokenBucket': 'ubki_scheduler',
+    'RequestHedger': 'ubki_hedging',
+    'AsyncRequestHedger': 'ubki_hedging',
+    'MetricsSink': 'ubki_metrics',
+    'InMemoryMetrics': 'ubki_metrics',
+    'set_metrics_sink': 'ubki_metrics',
+    'get_metrics_sink': 'ubki_metrics',
+    'UbkiReport': 'ubki_report',
+    'save_reports': 'ubki_report_file',
+    'load_reports': 'ubki_report_file',
+    'iter_reports': 'ubki_report_file',
+    'get_useful_credit_report_fields': 'ubki_credit_report',
+    'get_useful_credit_score_fields': 'ubki_credit_score',
+    'extract_credit_report_fields': 'ubki_stream',
+    'extract_credit_score_fields': 'ubki_stream',
+    'CreditReportScanner': 'ubki_stream',
+    'CreditScoreScanner': 'ubki_stream',
+    'UbkiFeature': 'ubki_features',
+    'FeaturePlan': 'ubki_features',
+    'register_feature': 'ubki_features',
+    'unregister_feature': 'ubki_features',
+    'get_features': 'ubki_features',
+    'get_features_version': 'ubki_features',
+    'compile_features': 'ubki_features',
+    'get_useful_ubki_fields_batch': 'ubki_batch',
+    'UbkiFeatureBatch': 'ubki_batch',
+    'CreditTimeline': 'ubki_timeline',
+    'ContactTimeline': 'ubki_timeline',
+    'get_deltatime': 'ubki_timeline',
+    'get_deltatimes': 'ubki_timeline',
+}
+
+__all__ = list(_EXPORTS)
+
+def __getattr__(name:str):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    value = getattr(importlib.import_module('.' + module, __name__), name)
+    globals()[name] = value # Следующие обращения не проходят через __getattr__
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
+
+if TYPE_CHECKING: # Для анализаторов кода и подсказок IDE
+    from .ubki_request import UbkiRequest
+    from .ubki_async_request import AsyncUbkiRequest
+    from .ubki_transport import UbkiTransport, AsyncUbkiTransport, RetryPolicy, TransportError
+    from .ubki_session_store import SessionStore
+    from .ubki_report_cache import ReportCache
+    from .ubki_single_flight import SingleFlight, AsyncSingleFlight
+    from .ubki_scheduler import RequestScheduler, AsyncRequestScheduler, RequestDropped, TokenBucket
+    from .ubki_hedging import RequestHedger, AsyncRequestHedger
+    from .ubki_metrics import MetricsSink, InMemoryMetrics, set_metrics_sink, get_metrics_sink
+    from .ubki_report import UbkiReport
+    from .ubki_report_file import save_reports, load_reports, iter_reports
+    from .ubki_credit_report import get_useful_credit_report_fields
+    from .ubki_credit_score import get_useful_credit_score_fields
+    from .ubki_stream import extract_credit_report_fields, extract_credit_score_fields, CreditReportScanner, CreditScoreScanner
+    from .ubki_features import (UbkiFeature, FeaturePlan, register_feature, unregister_feature, get_features,
+                                get_features_version, compile_features)
+    from .ubki_batch import get_useful_ubki_fields_batch, UbkiFeatureBatch
+    from .ubki_timeline import CreditTimeline, ContactTimeline, get_deltatime, get_deltatimes
@@ -0,0 +1,333 @@
+from .ubki_request import (AUTH_HEADERS, REQTYPE_DOCUMENTS, get_ubki_url, get_auth_request_text, get_sessid,
+                           get_person_data, get_report_request_text, get_store_key, is_session_error,
+                           get_response_head, get_streamed_report)
+from .ubki_report import UbkiReport
+from .ubki_features import compile_features
+from .ubki_stream import StreamedResponse
+from .ubki_transport import AsyncUbkiTransport
+from .ubki_session_store import SessionStore
+from .ubki_report_cache import ReportCache, get_cache_key, is_cacheable
+from .ubki_single_flight import AsyncSingleFlight
+from .ubki_scheduler import AsyncRequestScheduler, PRIORITIES
+from .ubki_hedging import AsyncRequestHedger
+from .ubki_metrics import measure, get_metrics_sink
+
+from typing import Optional, Iterable, AsyncIterator, Tuple, Union
+import logging
+import asyncio
+import time
+
+logger = logging.getLogger(__name__)
+
+class AsyncUbkiRequest ():
+    """ Асинхронный класс подключения к УБКИ.
+    Повторяет UbkiRequest, но все сетевые вызовы выполняются в цикле событий asyncio,
+    а отчеты reqtype 10 и 11 запрашиваются одновременно. Один экземпляр можно
+    использовать для сотен параллельных запросов.
+
+    Parameters
+    ----------
+    login : str
+        Логин партнера для авторизации
+
+    password : str
+        Пароль партнера для авторизации
+
+    is_test : bool = False
+        Логическое выражения для опрделения запросов на тестовый сервер или оригинальный
+
+    transport : AsyncUbkiTransport = None
+        Транспорт с пулом соединений, таймаутами и повторами, по умолчанию AsyncUbkiTransport()
+
+    session_store : SessionStore = None
+        Хранилище сессионных ключей, общее для процессов, по умолчанию SessionStore()
+
+    cache : ReportCache = None
+        Дисковый кэш ответов УБКИ. При попадании отчет возвращается без обращения к сети,
+        по умолчанию кэш не используется
+
+    single_flight : AsyncSingleFlight = None
+        Объединение одновременных запросов одного шаблона отчета об одной персоне (по тем же
+        полям, что и ключ кэша) в один http запрос, по умолчанию AsyncSingleFlight()
+
+    scheduler : AsyncRequestScheduler = None
+        Планировщик с ограничением скорости запросов к адресам 'auth' и 'xml' и классами приоритета,
+        по умолчанию запросы не ограничиваются
+
+    base_url : str = None
+        Базовый адрес API (например, локального MockUbkiServer), по умолчанию адрес сервера УБКИ
+
+    hedger : AsyncRequestHedger = None
+        Дублирование запросов отчетов, не ответивших за перцентиль обычной задержки,
+        по умолчанию запросы не дублируются
+
+    stream : bool = False
+        Потоковый режим: части ответа разбираются по мере получения (см. UbkiRequest)
+
+    keep_xml : bool = False
+        Сохранять xml ответов в отчетах потокового режима
+
+    Examples
+    --------
+    >> async with AsyncUbkiRequest("login", "password", is_test = True) as connect:
+    >>     ubki = await connect.get_person_credit_report()
+    """
+    def __init__ (self, login:str, password:str, is_test:Optional[bool] = False,
+                  transport:Optional[AsyncUbkiTransport] = None, session_store:Optional[SessionStore] = None,
+                  cache:Optional[ReportCache] = None, single_flight:Optional[AsyncSingleFlight] = None,
+                  scheduler:Optional[AsyncRequestScheduler] = None, base_url:Optional[str] = None,
+                  hedger:Optional[AsyncRequestHedger] = None, stream:bool = False, keep_xml:bool = False):
+        self.is_test = is_test
+        self.base_url = base_url
+        self.ubki_url = get_ubki_url(is_test, base_url) + "/xml"
+        self.transport = transport or AsyncUbkiTransport()
+        self.session_store = session_store or SessionStore()
+        self.cache = cache
+        self.single_flight = single_flight or AsyncSingleFlight()
+        self.scheduler = scheduler
+        self.hedger = hedger
+        self.stream = stream
+        self.keep_xml = keep_xml
+        self.sessid = None
+        self._login = login
+        self._password = password
+        self._auth_lock = None
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def connect(self):
+        """ Метод получения сессионого ключа (при необходимости авторизации)
+        """
+        self.sessid = await self.get_sessid()
+
+    async def get_sessid(self, rejected:Optional[str] = None) -> str:
+        """ Метод получения действующего сессионого ключа из хранилища, при необходимости с авторизацией.
+        Одновременно выполняется не более одной авторизации, даже если запросы стартуют одновременно
+
+        Parameters
+        ----------
+        rejected : str = None
+            Сессионный ключ, отклоненный УБКИ
+
+        Returns
+        -------
+        sessid : Сессионный ключ
+        """
+        key = get_store_key(self.is_test, self._login, self.base_url)
+        sessid = await self._run_blocking(self.session_store.get_cached, key, rejected)
+        if sessid is not None:
+            return sessid
+        if self._auth_lock is None:
+            self._auth_lock = asyncio.Lock()
+        async with self._auth_lock:
+            lock = self.session_store.lock()
+            loop = asyncio.get_event_loop()
+            acquiring = loop.run_in_executor(None, lock.acquire) # Межпроцессная блокировка
+            try:
+                await asyncio.shield(acquiring)
+            except asyncio.CancelledError:
+                # Захват в потоке не отменяется: блокировка освобождается, как только будет захвачена
+                acquiring.add_done_callback(lambda future: future.cancelled() or future.exception() is not None
+                                            or lock.release())
+                raise
+            pending = None # Файловый ввод-вывод хранилища под блокировкой, выполняемый в потоке пула
+            try:
+                pending = loop.run_in_executor(None, self.session_store.get_cached, key, rejected)
+                sessid = await asyncio.shield(pending)
+                if sessid is None:
+                    sessid = await self.ubki_authorization(self._login, self._password)
+                    pending = loop.run_in_executor(None, self.session_store.save, key, sessid)
+                    await asyncio.shield(pending)
+                    logger.info("Успешная Авторизация!!!")
+            finally:
+                if pending is not None and not pending.done(): # Задачу отменили: освобождаем после записи
+                    pending.add_done_callback(lambda future: lock.release())
+                else:
+                    lock.release()
+        return sessid
+
+    async def close(self):
+        """ Метод закрытия всех соединений транспорта
+        """
+        if self.hedger is not None:
+            await self.hedger.close()
+        await self.transport.close()
+
+    async def ubki_authorization(self, login: str, password: str) -> str:
+        """ Метод авторизации и получения сессионого ключа
+
+        Parameters
+        ----------
+        login : str
+            Логин партнера для авторизации
+
+        password : str
+            Пароль партнера для авторизации
+
+        Returns
+        -------
+        sessid : Сессионный ключ
+        """
+        url = get_ubki_url(self.is_test, self.base_url) + "/auth"
+        await self._acquire('auth')
+        with measure('ubki.auth.duration'):
+            return get_sessid(await self.transport.post(url, get_auth_request_text(login, password), headers=AUTH_HEADERS))
+
+    async def get_person_credit_report(self, person_data:Optional[dict] = None, priority:str = PRIORITIES[0],
+                                       deadline:Optional[float] = None) -> UbkiReport:
+        """ Метод получения отчета убки об интересующей персоне.
+        Кредитный отчет и кредитный балл запрашиваются одновременно.
+
+        Parameters
+        ----------
+        person_data : dict = None
+            Словарь с необходимыми данными о искомой персоне
+
+        priority : str = 'interactive'
+            Класс приоритета запросов в планировщике (см. RequestScheduler)
+
+        deadline : float = None
+            Время в секундах, за которое нужен отчет. Если планировщик не успеет разрешить запрос,
+            вызывается RequestDropped без обращения к УБКИ
+
+        Returns
+        -------
+        ubki report : Отчет с получеными данными о искомой персоне
+        """
+        data = get_person_data(person_data, self.is_test)
+        deadline = None if deadline is None else time.monotonic() + deadline
+        report, score = await asyncio.gather(self._request(10, data, priority, deadline),
+                                             self._request(11, data, priority, deadline))
+        if self.stream:
+            return get_streamed_report(report, score, data, self.keep_xml)
+        return UbkiReport(report, score, data['cval'], data['email'])
+
+    async def get_person_credit_reports(self, persons:Iterable[dict], concurrency:int = 50,
+                                        priority:str = PRIORITIES[-1]) -> AsyncIterator[Tuple[str, Union[UbkiReport, Exception]]]:
+        """ Метод массового получения отчетов убки о списке персон.
+        Одновременно обрабатывается не более concurrency персон, новые берутся из persons
+        по мере завершения запросов, поэтому расход памяти не зависит от размера входа.
+
+        Parameters
+        ----------
+        persons : Iterable[dict]
+            Последовательность (в том числе генератор) словарей с данными о искомых персонах
+
+        concurrency : int = 50
+            Максимальное количество одновременно обрабатываемых персон
+
+        priority : str = 'batch'
+            Класс приоритета запросов в планировщике (см. RequestScheduler)
+
+        Returns
+        -------
+        reports : Асинхронный генератор пар (reqidout, отчет или исключение) в порядке завершения запросов.
+            Ошибка по одной персоне не прерывает обработку остальных
+        """
+        persons = iter(persons)
+        running = {}
+        try:
+            while True:
+                for person_data in persons:
+                    task = asyncio.ensure_future(self.get_person_credit_report(person_data, priority))
+                    running[task] = person_data.get('reqidout')
+                    if len(running) >= concurrency:
+                        break
+                if not running:
+                    return
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    reqidout = running.pop(task)
+                    error = task.exception()
+                    yield reqidout, (task.result() if error is None else error)
+        finally:
+            for task in running:
+                task.cancel()
+
+    async def _request(self, reqtype:int, data:dict, priority:str = PRIORITIES[0],
+                       deadline:Optional[float] = None) -> Union[str, StreamedResponse]:
+        """ Метод отправки запроса на получения убки отчета о искомой персоне.
+        Одновременные запросы того же шаблона о той же персоне объединяются в один
+
+        Parameters
+        ----------
+        reqtype : int
+            Номер шаблона отчета убки, который требуется получить
+
+        data : dict
+            Данные о искомой персоне, необходимые для запроса
+
+        priority : str = 'interactive'
+            Класс приоритета запроса в планировщике
+
+        deadline : float = None
+            Крайний срок по часам time.monotonic()
+
+        Returns
+        -------
+        response : Отчет убки полученный по запросу на искомою персону (в потоковом режиме - StreamedResponse)
+        """
+        key = get_cache_key(self.is_test, reqtype, data, self.base_url)
+        return await self.single_flight.do(key, lambda: self._fetch(reqtype, data, key, priority, deadline))
+
+    async def _acquire(self, endpoint:str, priority:str = PRIORITIES[0], deadline:Optional[float] = None):
+        if self.scheduler is not None:
+            await self.scheduler.acquire(endpoint, priority, deadline)
+
+    @staticmethod
+    async def _run_blocking(function, *args):
+        """ Выполнение блокирующего файлового ввода-вывода (хранилище ключей, кэш) в пуле потоков,
+        чтобы не останавливать цикл событий """
+        return await asyncio.get_event_loop().run_in_executor(None, function, *args)
+
+    def _create_response(self, reqtype:int) -> StreamedResponse:
+        document = REQTYPE_DOCUMENTS[reqtype]
+        return StreamedResponse(compile_features().create_scanner(document), self.keep_xml or self.cache is not None,
+                                document)
+
+    async def _post(self, reqtype:int, sessid:str, data:dict, priority:str, deadline:Optional[float]
+                    ) -> Tuple[int, Union[str, StreamedResponse]]:
+        body = get_report_request_text(sessid, reqtype, data).encode('utf-8')
+        if self.stream:
+            async def send():
+                response = await self.transport.post_stream(self.ubki_url, body, lambda: self._create_response(reqtype))
+                return response.status, response
+        else:
+            send = lambda: self.transport.post_response(self.ubki_url, body)
+        await self._acquire('xml', priority, deadline)
+        if self.hedger is None:
+            return await send()
+
+        async def hedge(): # Дубликат расходует квоту планировщика с самым низким приоритетом
+            if self.scheduler is not None:
+                await self.scheduler.acquire('xml', self.scheduler.priorities[-1], deadline)
+            return await send()
+        return await self.hedger.do(reqtype, send, hedge)
+
+    async def _fetch(self, reqtype:int, data:dict, key:str, priority:str = PRIORITIES[0],
+                     deadline:Optional[float] = None) -> Union[str, StreamedResponse]:
+        if self.cache is not None:
+            response = await self._run_blocking(self.cache.get, key)
+            if response is not None:
+                return self._create_response(reqtype).feed_text(response) if self.stream else response
+        if self.sessid is None:
+            await self.connect()
+        tags = {'reqtype': reqtype}
+        with measure('ubki.request.duration', tags):
+            sessid = self.sessid
+            status, response = await self._post(reqtype, sessid, data, priority, deadline)
+            # Ключ истек или отозван: обновляем его и повторяем запрос один раз
+            if is_session_error(get_response_head(response)):
+                get_metrics_sink().increment('ubki.request.session_retry', 1, tags)
+                self.sessid = sessid = await self.get_sessid(rejected=sessid)
+                status, response = await self._post(reqtype, sessid, data, priority, deadline)
+        size = len(response) if isinstance(response, str) else response.size
+        get_metrics_sink().observe('ubki.response.size', size, tags)
+        if self.cache is not None and is_cacheable(get_response_head(response), status):
+            await self._run_blocking(self.cache.put, key, response if isinstance(response, str) else response.get_xml())
+        return response
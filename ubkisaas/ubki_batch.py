@@ -0,0 +1,263 @@
+from .ubki_stream import TIME_FIELDS
+from .ubki_features import compile_features
+from .ubki_credit_report import CREDIT_REPORT_FIELDS
+from .ubki_credit_score import CREDIT_SCORE_FIELDS
+from .ubki_timeline import get_deltatimes
+from .ubki_report import UbkiReport, SHARED_FIELDS
+from .ubki_metrics import measure
+
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+import numpy as np
+import copy
+
+# Фиксированная схема столбцов: признаки кредитного отчета, затем признаки, которые есть только в кредитном балле
+BATCH_FIELDS = CREDIT_REPORT_FIELDS + ['req_credit'] + [k for k in CREDIT_SCORE_FIELDS if k not in CREDIT_REPORT_FIELDS]
+
+# Категориальные признаки блока cki/ident кредитного отчета, которые можно закодировать целыми числами
+# (аргумент categories в get_useful_ubki_fields_batch). Их значения - коды справочников УБКИ (гражданство - код
+# страны, социальный статус, семейный статус, образование) из документации к xml API УБКИ. Пакет эти справочники
+# не содержит, поэтому словарь значений передает вызывающий, а без словаря признак остается числовым, как в
+# UbkiReport.get_useful_ubki_fields
+CATEGORY_FIELDS = ['cgrag', 'sstate', 'family', 'ceduc']
+
+# Код отсутствующего значения категориального признака
+MISSING_CATEGORY = -1
+
+# Код значения, которого нет в словаре категорий
+UNKNOWN_CATEGORY = -2
+
+class UbkiFeatureBatch():
+    """ Столбцовый набор признаков для многих отчетов УБКИ
+
+    Attributes
+    ----------
+    size : int
+        Количество отчетов (строк)
+
+    fields : List[str]
+        Числовые признаки в порядке схемы BATCH_FIELDS (без закодированных категориальных и игнорируемых),
+        затем пользовательские признаки (register_feature)
+
+    values : Dict[str, np.ndarray]
+        Значения числовых признаков (float64), np.nan на месте отсутствующих
+
+    missing : Dict[str, np.ndarray]
+        Маски отсутствующих значений (bool) для всех признаков, включая категориальные
+
+    codes : Dict[str, np.ndarray]
+        Коды категориальных признаков, для которых передан словарь значений (int32), MISSING_CATEGORY (-1) на месте отсутствующих,
+        UNKNOWN_CATEGORY (-2) на месте значений, которых нет в словаре
+
+    categories : Dict[str, np.ndarray]
+        Словари значений категорий (float64), codes[field] - индекс в categories[field]
+
+    first_dates : Dict[str, np.ndarray]
+        Даты первого упоминания контакта (datetime64[D], NaT - упоминания нет) для признаков TIME_FIELDS,
+        по ним признаки пересчитываются на другие даты (as_of, get_deltatimes)
+
+    dated : np.ndarray
+        Маска строк, для которых известны first_dates (False - отчеты только с признаками старого формата)
+
+    our_date : datetime
+        Дата, на которую вычислены признаки TIME_FIELDS в values
+
+    shared_from_report : bool
+        Признаки SHARED_FIELDS в values вычислены по кредитному отчету (False - взяты из кредитного
+        балла и отсутствуют, как в UbkiReport.get_useful_ubki_fields по умолчанию)
+    """
+    def __init__(self, size: int, fields: List[str]):
+        self.size = size
+        self.fields = list(fields)
+        self.values = {k: np.full(size, np.nan) for k in fields}
+        self.missing = {k: np.ones(size, dtype=bool) for k in fields}
+        self.codes = {}
+        self.categories = {}
+        self.first_dates = {k: np.full(size, np.datetime64('NaT', 'D')) for k in TIME_FIELDS if k in fields}
+        self.dated = np.zeros(size, dtype=bool)
+        self.our_date = None
+        self.shared_from_report = False
+        self.row = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __setitem__(self, key: str, value):
+        """ Запись признака в текущую строку (self.row), используется сканерами вместо словаря
+        """
+        column = self.values.get(key)
+        if column is None:
+            return
+        if value is None:
+            column[self.row] = np.nan
+            self.missing[key][self.row] = True
+        else:
+            column[self.row] = value
+            self.missing[key][self.row] = False
+
+    def set_first_dates(self, first_dates: dict):
+        """ Запись дат первого упоминания контакта в текущую строку (self.row)
+
+        Parameters
+        ----------
+        first_dates : dict
+            Признак из TIME_FIELDS -> дата (np.datetime64, "%Y-%m-%d" или None). Отсутствующие признаки не определены
+        """
+        for key, column in self.first_dates.items():
+            first_date = first_dates.get(key)
+            column[self.row] = 'NaT' if first_date is None else first_date
+        self.dated[self.row] = True
+
+    def get_deltatimes(self, dates: Sequence) -> Dict[str, np.ndarray]:
+        """ Метод вычисления признаков TIME_FIELDS сразу на много дат, без повторного разбора отчетов
+
+        Parameters
+        ----------
+        dates : Sequence
+            Даты расчета (datetime, date, datetime64 или строки "%Y-%m-%d")
+
+        Returns
+        -------
+        deltatimes : Словарь признак -> массив (size, len(dates)) float64, np.nan на месте отсутствующих
+        """
+        result = {}
+        for key, first_dates in self.first_dates.items():
+            values = np.repeat(self.values[key][:, None], len(dates), axis=1) # Строки без дат не пересчитываются
+            values[self.dated] = get_deltatimes(first_dates[self.dated], dates)
+            result[key] = values
+        return result
+
+    def as_of(self, our_date: datetime) -> 'UbkiFeatureBatch':
+        """ Метод получения набора признаков на другую дату расчета. Пересчитываются только
+        признаки TIME_FIELDS (если shared_from_report), остальные массивы общие с исходным набором
+
+        Parameters
+        ----------
+        our_date : datetime
+            Дата расчета
+
+        Returns
+        -------
+        batch : Новый UbkiFeatureBatch
+        """
+        batch = copy.copy(self)
+        batch.values, batch.missing = dict(self.values), dict(self.missing)
+        batch._set_date(our_date)
+        return batch
+
+    def _set_date(self, our_date: datetime):
+        if self.shared_from_report: # Иначе признаки TIME_FIELDS берутся из кредитного балла и отсутствуют
+            for key, values in self.get_deltatimes([our_date]).items():
+                self.values[key] = values[:, 0]
+                self.missing[key] = np.isnan(self.values[key])
+        self.our_date = our_date
+
+    def _encode_categories(self, categories: Dict[str, Sequence]):
+        unknown = [key for key in categories if key not in CATEGORY_FIELDS]
+        if unknown:
+            raise ValueError("Словари значений заданы не для категориальных признаков: %s, ожидаются %s"
+                             % (unknown, CATEGORY_FIELDS))
+        for key in CATEGORY_FIELDS:
+            if key not in categories or key not in self.values:
+                continue
+            self.fields.remove(key)
+            column = self.values.pop(key)
+            vocabulary = np.asarray(categories[key], dtype=np.float64)
+            order = np.argsort(vocabulary, kind='stable')
+            known = np.isin(column, vocabulary)
+            codes = np.full(self.size, UNKNOWN_CATEGORY, dtype=np.int32)
+            codes[known] = order[np.searchsorted(vocabulary[order], column[known])]
+            codes[self.missing[key]] = MISSING_CATEGORY
+            self.codes[key] = codes
+            self.categories[key] = vocabulary
+
+    def to_matrix(self, fields: Optional[List[str]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """ Метод получения матрицы числовых признаков
+
+        Parameters
+        ----------
+        fields : List[str] = None
+            Нужные числовые признаки, по умолчанию self.fields
+
+        Returns
+        -------
+        matrix : Матрица (size, len(fields)) float64 и маска отсутствующих значений той же формы
+        """
+        fields = self.fields if fields is None else fields
+        return (np.column_stack([self.values[k] for k in fields]) if fields else np.empty((self.size, 0)),
+                np.column_stack([self.missing[k] for k in fields]) if fields else np.empty((self.size, 0), dtype=bool))
+
+def get_useful_ubki_fields_batch(reports: Sequence[Union[UbkiReport, Tuple[str, str, str, str]]],
+                                 fields_to_ignore: List[str] = [], our_date: Optional[datetime] = None,
+                                 categories: Optional[Dict[str, Sequence]] = None,
+                                 shared_from_report: bool = False) -> UbkiFeatureBatch:
+    """ Функция получения полезных признаков сразу для многих отчетов в столбцовом виде.
+    Признаки каждого отчета записываются прямо в массивы numpy, без промежуточных словарей на строку.
+
+    Parameters
+    ----------
+    reports : Sequence[UbkiReport | Tuple[str, str, str, str]]
+        Отчеты: объекты UbkiReport (в том числе компактные и только с признаками) или кортежи
+        (xml кредитного отчета, xml кредитного балла, телефон, почта)
+
+    fields_to_ignore : List[str] = []
+        Список не нужных параметров, группы которых не будут вычисляться. Пользовательские
+        признаки (register_feature) должны быть числовыми или игнорироваться
+
+    our_date : datetime = None
+        Дата, относительно которой считаются разницы дат, по умолчанию текущая
+
+    categories : Dict[str, Sequence] = None
+        Словари значений категориальных признаков CATEGORY_FIELDS (признак -> коды справочника УБКИ).
+        Код признака - индекс значения в словаре, поэтому, чтобы коды совпадали между наборами (обучение
+        и применение модели), словарь не должен меняться. Признаки без словаря остаются числовыми
+
+    shared_from_report : bool = False
+        Брать признаки SHARED_FIELDS из кредитного отчета (см. UbkiReport.get_useful_ubki_fields)
+
+    Returns
+    -------
+    batch : Столбцовый набор признаков UbkiFeatureBatch
+    """
+    if not hasattr(reports, '__len__'):
+        reports = list(reports)
+    our_date = datetime.now() if our_date is None else our_date
+    fields_to_ignore = set(fields_to_ignore)
+    plan = compile_features(fields_to_ignore)
+    fields = [k for k in BATCH_FIELDS if k not in fields_to_ignore] + \
+        [f.name for document in ('report', 'score') for f in plan.custom[document]]
+    report_groups, score_groups = plan.groups['report'], plan.groups['score']
+
+    batch = UbkiFeatureBatch(len(reports), fields)
+    batch.shared_from_report = shared_from_report
+    for row, report in enumerate(reports):
+        batch.row = row
+        if isinstance(report, UbkiReport) and report._features is not None: # Сохранены только признаки
+            for key, value in report._get_features(fields_to_ignore, our_date).items():
+                batch[key] = value
+            if report._first_dates is not None:
+                batch.set_first_dates(report._first_dates)
+            continue
+        elif isinstance(report, UbkiReport):
+            report_scanner, score_scanner = report._get_scanner('report', plan), report._get_scanner('score', plan)
+            phone, email = report.phone, report.email
+        else:
+            report_xml, score_xml, phone, email = report
+            with measure('ubki.parse.duration', {'document': 'report'}):
+                report_scanner = plan.create_scanner('report').feed(report_xml).close()
+            with measure('ubki.parse.duration', {'document': 'score'}):
+                score_scanner = plan.create_scanner('score').feed(score_xml).close()
+        if report_groups:
+            batch.set_first_dates(report_scanner.fill_static_fields(batch, phone, email, report_groups))
+        if score_groups:
+            score_scanner.fill_fields(batch, score_groups)
+        plan.fill_custom('report', report_scanner, batch, phone, email)
+        plan.fill_custom('score', score_scanner, batch, phone, email)
+    if not shared_from_report:
+        for key in SHARED_FIELDS:
+            if key in batch.values:
+                batch.values[key][:] = np.nan
+                batch.missing[key][:] = True
+    batch._set_date(our_date)
+    batch._encode_categories(categories or {})
+    return batch
@@ -0,0 +1,272 @@
+""" Бенчмарк получения признаков UbkiReport.get_useful_ubki_fields на синтетических отчетах разного размера.
+
+Запуск:
+    python -m ubkisaas.ubki_benchmark                              # вывести результаты
+    python -m ubkisaas.ubki_benchmark --save-baseline base.json    # сохранить базовые результаты
+    python -m ubkisaas.ubki_benchmark --baseline base.json         # сравнить с базовыми, код 1 при регрессии
+    python -m ubkisaas.ubki_benchmark --import-budget 20           # код 1, если import ubkisaas дольше 20 мс
+"""
+from .ubki_synthetic import generate_credit_report_xml, generate_credit_score_xml
+from .ubki_request import TEST_PERSON_DATA
+from .ubki_report import UbkiReport
+
+from typing import Dict, List, Optional
+import numpy as np
+import tracemalloc
+import argparse
+import subprocess
+import platform
+import json
+import os
+import time
+import sys
+
+# Размеры синтетических отчетов: параметры generate_credit_report_xml
+PROFILES = {
+    'empty':  dict(comps=0, crdeals=0, deallifes=0, conts=0, credres=0),
+    'small':  dict(comps=4, crdeals=2, deallifes=6, conts=3, credres=2),
+    'medium': dict(comps=8, crdeals=10, deallifes=24, conts=10, credres=10),
+    'large':  dict(comps=12, crdeals=50, deallifes=60, conts=50, credres=50),
+    'huge':   dict(comps=16, crdeals=200, deallifes=120, conts=300, credres=200),
+}
+
+# Импорты, время которых измеряется в новом интерпретаторе: пакет, ядро разбора и http клиенты
+IMPORTS = {
+    'import':        'import ubkisaas',
+    'import_parse':  'from ubkisaas import UbkiReport',
+    'import_client': 'from ubkisaas import UbkiRequest, UbkiTransport; UbkiTransport().close()',
+    'import_async':  'from ubkisaas import AsyncUbkiRequest, AsyncUbkiTransport; AsyncUbkiTransport()',
+}
+
+# Импорты необязательных http клиентов (extras client и async): без установленного клиента пропускаются
+OPTIONAL_IMPORTS = ['import_client', 'import_async']
+
+# Каталог, из которого импортируется измеряемый пакет (а не установленная в site-packages версия)
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Бюджет времени import ubkisaas в мс (холодный старт коротких процессов и cli)
+IMPORT_BUDGET_MS = 20
+
+# Тяжелые зависимости, загрузка которых отмечается в результатах замера импорта
+HEAVY_MODULES = ['numpy', 'requests', 'aiohttp']
+
+# Метрики: направление, в котором изменение считается регрессией, и множитель допуска (хвост задержек шумнее)
+METRICS = {'throughput': (-1, 1), 'p50_ms': (1, 1), 'p99_ms': (1, 2), 'peak_kb': (1, 1), 'import_ms': (1, 2)}
+
+def run_benchmark(profiles:Optional[List[str]] = None, number:int = 200, samples:int = 20, seed:int = 0
+                  ) -> Dict[str, dict]:
+    """ Функция измерения скорости и памяти получения признаков на синтетических отчетах
+
+    Parameters
+    ----------
+    profiles : List[str] = None
+        Имена размеров из PROFILES, по умолчанию все
+
+    number : int = 200
+        Количество измерений на каждый размер
+
+    samples : int = 20
+        Количество разных отчетов каждого размера (отчеты перебираются по кругу)
+
+    seed : int = 0
+        Зерно генератора отчетов
+
+    Returns
+    -------
+    results : Словарь размер -> {размер xml в кб, отчетов в секунду, p50 и p99 в мс, пик памяти в кб}
+    """
+    results = {}
+    for name in profiles or list(PROFILES):
+        documents = [(generate_credit_report_xml(seed + i, **PROFILES[name]), generate_credit_score_xml(seed + i))
+                     for i in range(samples)]
+        for report, score in documents[:5]: # Прогрев
+            _get_fields(report, score)
+        latencies = np.empty(number)
+        for i in range(number):
+            report, score = documents[i % samples]
+            start = time.perf_counter()
+            _get_fields(report, score)
+            latencies[i] = time.perf_counter() - start
+        peak = max(_get_peak_memory(report, score) for report, score in documents[:5])
+        results[name] = {
+            'xml_kb': round(sum(len(r.encode('utf-8')) + len(s.encode('utf-8')) for r, s in documents) / samples / 1024, 2),
+            'throughput': round(number / latencies.sum(), 1),
+            'p50_ms': round(float(np.percentile(latencies, 50)) * 1000, 4),
+            'p99_ms': round(float(np.percentile(latencies, 99)) * 1000, 4),
+            'peak_kb': round(peak / 1024, 1),
+        }
+    return results
+
+def run_import_benchmark(imports:Optional[List[str]] = None, number:int = 5) -> Dict[str, dict]:
+    """ Функция измерения времени импорта пакета: каждый замер выполняется в новом интерпретаторе,
+    поэтому учитываются все загружаемые модули, как при холодном старте
+
+    Parameters
+    ----------
+    imports : List[str] = None
+        Имена импортов из IMPORTS, по умолчанию все
+
+    number : int = 5
+        Количество замеров на импорт, берется минимальное время
+
+    Returns
+    -------
+    results : Словарь импорт -> {время в мс, загруженные тяжелые зависимости из HEAVY_MODULES}.
+        Неудачный импорт из OPTIONAL_IMPORTS (не установлен http клиент) пропускается,
+        для остальных неудачных импортов сохраняется {'error': stderr интерпретатора}
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [PACKAGE_ROOT, env.get('PYTHONPATH')]))
+    results = {}
+    for name in imports or list(IMPORTS):
+        code = ('import time, sys\nstart = time.perf_counter()\n%s\nprint(time.perf_counter() - start, '
+                '" ".join(m for m in %r if m in sys.modules))' % (IMPORTS[name], HEAVY_MODULES))
+        times = []
+        for _ in range(number):
+            process = subprocess.run([sys.executable, '-c', code], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                     universal_newlines=True, cwd=PACKAGE_ROOT, env=env)
+            if process.returncode != 0:
+                if name not in OPTIONAL_IMPORTS:
+                    results[name] = {'error': process.stderr.strip()}
+                break
+            seconds, *modules = process.stdout.split()
+            times.append(float(seconds))
+        if times:
+            results[name] = {'import_ms': round(min(times) * 1000, 2), 'modules': modules}
+    return results
+
+def check_import_budget(results:Dict[str, dict], budget:float = IMPORT_BUDGET_MS) -> List[str]:
+    """ Функция проверки бюджета времени import ubkisaas
+
+    Parameters
+    ----------
+    results : Dict[str, dict]
+        Результаты run_import_benchmark
+
+    budget : float = IMPORT_BUDGET_MS
+        Бюджет в мс
+
+    Returns
+    -------
+    violations : Список описаний превышений бюджета, тяжелых зависимостей, загруженных import ubkisaas,
+        и неудачных импортов (с stderr интерпретатора)
+    """
+    violations = ['%s failed:\n%s' % (name, result['error']) for name, result in results.items() if 'error' in result]
+    result = results.get('import')
+    if result is None or 'error' in result:
+        return violations
+    if result['import_ms'] > budget:
+        violations.append('import %s ms > %s ms' % (result['import_ms'], budget))
+    if result['modules']:
+        violations.append('import loads %s' % ', '.join(result['modules']))
+    return violations
+
+def compare_with_baseline(results:Dict[str, dict], baseline:Dict[str, dict], tolerance:float = 0.25) -> List[str]:
+    """ Функция сравнения результатов с базовыми
+
+    Parameters
+    ----------
+    results : Dict[str, dict]
+        Текущие результаты run_benchmark
+
+    baseline : Dict[str, dict]
+        Базовые результаты
+
+    tolerance : float = 0.25
+        Допустимое относительное ухудшение метрики (для p99 - вдвое больше)
+
+    Returns
+    -------
+    regressions : Список описаний метрик, ухудшившихся больше чем на tolerance
+    """
+    regressions = []
+    for name, result in results.items():
+        for metric, (sign, scale) in METRICS.items():
+            old, new = baseline.get(name, {}).get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if change * sign > tolerance * scale:
+                regressions.append('%s %s: %s -> %s (%+.1f%%)' % (name, metric, old, new, change * 100))
+    return regressions
+
+def save_baseline(results:Dict[str, dict], path:str):
+    """ Функция сохранения базовых результатов в json файл вместе с описанием окружения
+
+    Parameters
+    ----------
+    results : Dict[str, dict]
+        Результаты run_benchmark
+
+    path : str
+        Путь к файлу
+    """
+    with open(path, 'w') as file:
+        json.dump({'python': platform.python_version(), 'machine': platform.machine(),
+                   'created': time.strftime('%Y-%m-%d %H:%M:%S'), 'results': results}, file, indent=2)
+
+def load_baseline(path:str) -> Dict[str, dict]:
+    """ Функция загрузки базовых результатов, сохраненных save_baseline
+
+    Parameters
+    ----------
+    path : str
+        Путь к файлу
+
+    Returns
+    -------
+    baseline : Словарь размер -> метрики
+    """
+    with open(path, 'r') as file:
+        return json.load(file)['results']
+
+def main(argv:Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m ubkisaas.ubki_benchmark',
+                                     description='Бенчмарк UbkiReport.get_useful_ubki_fields на синтетических отчетах')
+    parser.add_argument('--profiles', nargs='+', choices=list(PROFILES), help='размеры отчетов (по умолчанию все)')
+    parser.add_argument('--number', type=int, default=200, help='количество измерений на размер')
+    parser.add_argument('--seed', type=int, default=0, help='зерно генератора отчетов')
+    parser.add_argument('--save-baseline', metavar='PATH', help='сохранить результаты как базовые')
+    parser.add_argument('--baseline', metavar='PATH', help='сравнить результаты с базовыми')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='допустимое относительное ухудшение')
+    parser.add_argument('--import-budget', type=float, default=IMPORT_BUDGET_MS, help='бюджет import ubkisaas в мс')
+    parser.add_argument('--no-import', action='store_true', help='не измерять время импорта')
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(args.profiles, args.number, seed=args.seed)
+    print('%-8s %10s %12s %10s %10s %10s' % ('profile', 'xml_kb', 'reports/s', 'p50_ms', 'p99_ms', 'peak_kb'))
+    for name, r in results.items():
+        print('%-8s %10s %12s %10s %10s %10s' % (name, r['xml_kb'], r['throughput'], r['p50_ms'], r['p99_ms'], r['peak_kb']))
+    violations = []
+    if not args.no_import:
+        imports = run_import_benchmark()
+        print('%-14s %10s  %s' % ('import', 'import_ms', 'modules'))
+        for name, r in imports.items():
+            if 'error' not in r:
+                print('%-14s %10s  %s' % (name, r['import_ms'], ' '.join(r['modules']) or '-'))
+        violations = check_import_budget(imports, args.import_budget)
+        for violation in violations:
+            print('BUDGET ' + violation)
+        results.update(imports)
+    if args.save_baseline:
+        save_baseline(results, args.save_baseline)
+    regressions = []
+    if args.baseline:
+        regressions = compare_with_baseline(results, load_baseline(args.baseline), args.tolerance)
+        for regression in regressions:
+            print('REGRESSION ' + regression)
+    return 1 if regressions or violations else 0
+
+def _get_fields(report:str, score:str) -> dict:
+    return UbkiReport(report, score, TEST_PERSON_DATA['cval'], TEST_PERSON_DATA['email']).get_useful_ubki_fields()
+
+def _get_peak_memory(report:str, score:str) -> int:
+    tracemalloc.start()
+    try:
+        _get_fields(report, score)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,8 +1,27 @@
+from .ubki_metrics import record_error
+
 from typing import List
 import datetime as dt
-import numpy as np
 import datetime
 
+CREDIT_REPORT_FIELDS = [
+    "median_day_credit",    # Медианна по дате начала соглашения
+    "mean_credit_summ",     # Средняя сумма по кредитам
+    "mean_credit_debt",     # Средння задолжность по кредитам
+    "cdolgn",               # Последняя зафиксированая должность на работе
+    "wdohod",               # Последний зафиксированый доход на работе
+    "wstag",                # Последний зафиксированый стаж на работе
+    "max_wdohod",           # Максимальный зафиксировынный доход
+    "cgrag",                # Код странны (категориальный)
+    "sstate",               # Социальный статус (категориальный)
+    "family",               # Симейный статус (категориальный)
+    "ceduc",                # Образование (категориальный)
+    "ubki_balance_value",   # Текущий баланс
+    "ubki_phone_deltatime", # Разница между первым упоминанием данного телефена и текущей датой
+    "ubki_email_deltatime", # Разница между первым упоминанием данного почты и текущей датой
+    "ubki_week_queries"     # Количество запросов в неделю
+]
+
 def get_useful_credit_report_fields(ubki: dict, phone: str, email: str, our_date: datetime) -> dict:
     """ Функция получения полезных параметров из кредитного отчета физического лица
 
@@ -24,26 +43,7 @@ def get_useful_credit_report_fields(ubki: dict, phone: str, email: str, our_date
     -------
     useful ubki fields : Словарь полезных параметром для скоринга из кредитного отчета
     """
-    res_dict = {
-        k: None
-        for k in [
-            "median_day_credit",    # Медианна по дате начала соглашения
-            "mean_credit_summ",     # Средняя сумма по кредитам
-            "mean_credit_debt",     # Средння задолжность по кредитам
-            "cdolgn",               # Последняя зафиксированая должность на работе
-            "wdohod",               # Последний зафиксированый доход на работе
-            "wstag",                # Последний зафиксированый стаж на работе
-            "max_wdohod",           # Максимальный зафиксировынный доход
-            "cgrag",                # Код странны (категориальный)
-            "sstate",               # Социальный статус (категориальный)
-            "family",               # Симейный статус (категориальный)
-            "ceduc",                # Образование (категориальный)
-            "ubki_balance_value",   # Текущий баланс
-            "ubki_phone_deltatime", # Разница между первым упоминанием данного телефена и текущей датой
-            "ubki_email_deltatime", # Разница между первым упоминанием данного почты и текущей датой
-            "ubki_week_queries"     # Количество запросов в неделю
-        ]
-    }
+    res_dict = {k: None for k in CREDIT_REPORT_FIELDS}
     try:
         if 'ubkidata' in ubki:
             ubki_response = ubki['ubkidata']
@@ -51,8 +51,8 @@ def get_useful_credit_report_fields(ubki: dict, phone: str, email: str, our_date
             if "tech" in ubki_response.keys() and "billing" in ubki_response['tech'].keys(): 
                 res_dict["ubki_balance_value"] = int(
                     float(ubki_response['tech']["billing"]["balance"]["@value"]))  # Баланс 
-        except:
-            pass
+        except Exception as error:
+            record_error('tech', error)
         # Персональные данные
         if "comp" in ubki_response.keys():
             for comp in ubki_response["comp"]:
@@ -67,8 +67,8 @@ def get_useful_credit_report_fields(ubki: dict, phone: str, email: str, our_date
                                 fill_dict_by_key(ident, ["@cgrag", '@sstate', '@family', '@ceduc'], res_dict)
                         else:
                             fill_dict_by_key(ident, ["@cgrag", '@sstate', '@family', '@ceduc'], res_dict)
-                    except:
-                        pass
+                    except Exception as error:
+                        record_error(comp_id, error)
                     
                     try: # Данные про роботу
                         comp_work = comp['cki']['work']
@@ -77,15 +77,15 @@ def get_useful_credit_report_fields(ubki: dict, phone: str, email: str, our_date
                                 fill_dict_by_key(work, ['@cdolgn', '@wdohod', '@wstag'], res_dict)
                         else:
                             fill_dict_by_key(comp_work, ['@cdolgn', '@wdohod', '@wstag'], res_dict)
-                    except :
-                        pass
+                    except Exception as error:
+                        record_error(comp_id, error)
 
                 elif comp_id == '2': # Блок информации про кредитные соглашения
                     try:
                         ubki_crdeal = comp['crdeal']
                         credit_sum = credits = 0        # Сумма кредита и количество кредитов
                         credit_debt = debts = 0         # Сумма задолжности по кредиту
-                        median_days = np.array([0, 0])  # Сумма по дням в половинах месяца
+                        median_days = [0, 0]            # Сумма по дням в половинах месяца
                         if type(ubki_crdeal) == list:   # Проверка на количество кредитов
                             for credit in ubki_crdeal:
                                 amount, debt, days = get_credit_ubki_fields(credit)
@@ -95,28 +95,28 @@ def get_useful_credit_report_fields(ubki: dict, phone: str, email: str, our_date
                                 if debt > 0:            # Проверка на наличие задолжности по кредитному соглашению
                                     credit_debt += debt
                                     debts += 1
-                                median_days += days
+                                median_days = [median_days[0] + days[0], median_days[1] + days[1]]
                         else:                           # Только один кредит
                             credit_sum, credit_debt, median_days = get_credit_ubki_fields(ubki_crdeal)
                             credits = 1 if (credit_sum > 0) else 0
                             debts = 1 if (credit_debt > 0) else 0
 
-                        res_dict['median_day_credit'] = int(np.argmax(median_days))
+                        res_dict['median_day_credit'] = 0 if median_days[0] >= median_days[1] else 1
                         res_dict['mean_credit_summ'] = int(credit_sum / credits)
                         res_dict['mean_credit_debt'] = int(credit_debt / debts)
-                    except:
-                        pass
+                    except Exception as error:
+                        record_error(comp_id, error)
 
                 elif comp_id == "4": # Блок регестрации запросов
                     try:
                         res_dict["ubki_week_queries"] = int(comp["reestrtime"]["@wk"])  # Количество запросов в неделю
                         res_dict["req_credit"] = sum([1 for i in comp['credres'] if i['@reqreason'] in ['2', '4']]) # Количество запросов на кредит
-                    except:
-                        pass
+                    except Exception as error:
+                        record_error(comp_id, error)
 
                 if comp_id == "10": # Блок истории контактных данных
                     try:
-                        big_datetime = dt.datetime(dt.datetime.today().year + 1, 1, 1)
+                        big_datetime = dt.datetime(our_date.year + 1, 1, 1)
                         first_datetime_phone = first_datetime_email = big_datetime
                         for contact in comp["cont"]:
                             cval = contact["@cval"]
@@ -136,10 +136,10 @@ def get_useful_credit_report_fields(ubki: dict, phone: str, email: str, our_date
                                 first_datetime_phone != big_datetime) else None
                         res_dict["ubki_email_deltatime"] = int((our_date - first_datetime_email).days) if (
                                 first_datetime_email != big_datetime) else None
-                    except:
-                        pass
-    except:
-        print("Ошибка УБКИ")
+                    except Exception as error:
+                        record_error(comp_id, error)
+    except Exception as error:
+        record_error('document', error)
     finally:
         return res_dict
 
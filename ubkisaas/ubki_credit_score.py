@@ -1,3 +1,19 @@
+from .ubki_metrics import record_error
+
+CREDIT_SCORE_FIELDS = [
+    "ubki_score",           # УБКИ очки
+    "ubki_scorelast",       # УБКИ последние очки
+    "ubki_scorelevel",      # УБКИ уровень очков
+    "ubki_all_credits",     # Все кредиты
+    "ubki_open_credits",    # Открытые кредиты
+    "ubki_closed_credits",  # Закрытые кредиты
+    "ubki_expyear",         # Просрочка по кредитам
+    "ubki_maxnowexp",       #
+    "ubki_phone_deltatime", # Разница между первым упоминанием данного телефена и текущей датой
+    "ubki_email_deltatime", # Разница между первым упоминанием данного почты и текущей датой
+    "ubki_week_queries"     # Количество запросов в неделю
+]
+
 def get_useful_credit_score_fields(ubki: dict) -> dict:
     """ Функция получения полезных параметров из кредитного балла
 
@@ -10,22 +26,7 @@ def get_useful_credit_score_fields(ubki: dict) -> dict:
     -------
     useful ubki fields : Словарь полезных параметром для скоринга из кредитного балла
     """
-    res_dict = {
-        k: None
-        for k in [
-            "ubki_score",           # УБКИ очки
-            "ubki_scorelast",       # УБКИ последние очки
-            "ubki_scorelevel",      # УБКИ уровень очков
-            "ubki_all_credits",     # Все кредиты
-            "ubki_open_credits",    # Открытые кредиты
-            "ubki_closed_credits",  # Закрытые кредиты
-            "ubki_expyear",         # Просрочка по кредитам
-            "ubki_maxnowexp",       #
-            "ubki_phone_deltatime", # Разница между первым упоминанием данного телефена и текущей датой
-            "ubki_email_deltatime", # Разница между первым упоминанием данного почты и текущей датой
-            "ubki_week_queries"     # Количество запросов в неделю
-        ]
-    }
+    res_dict = {k: None for k in CREDIT_SCORE_FIELDS}
     if not ubki:
         return res_dict
     try:
@@ -54,11 +55,13 @@ def get_useful_credit_score_fields(ubki: dict) -> dict:
                             if (check_null_value(dinfo["@expyear"])) else None
                         res_dict["ubki_maxnowexp"] = int(float(coding_maxnowexp(dinfo["@maxnowexp"]))) \
                             if (check_null_value(dinfo["@maxnowexp"])) else None
+                    except Exception as error:
+                        record_error(comp_id, error)
                     finally:
                         break
 
-    except:
-        pass
+    except Exception as error:
+        record_error('document', error)
     finally:
         return res_dict
 
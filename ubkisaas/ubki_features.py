@@ -0,0 +1,305 @@
+from .ubki_stream import CreditReportScanner, CreditScoreScanner, REPORT_FIELD_GROUPS, SCORE_FIELD_GROUPS
+from .ubki_metrics import measure, record_error
+
+from typing import Callable, Dict, Iterable, List, Optional
+from collections import OrderedDict
+import threading
+import hashlib
+
+DOCUMENTS = ('report', 'score')
+
+# Версия вычисления встроенных признаков: увеличивается при изменении их значений или формата запоминаемых групп
+# (например, группа '10' хранит даты первого упоминания контакта, а не признаки на дату)
+BUILTIN_FEATURES_VERSION = 2
+
+# Элементы и атрибуты, которые читают встроенные признаки каждого блока (пути относительно блока comp или tech)
+BUILTIN_ELEMENTS = {
+    ('report', '1'): {'cki/ident': ['cgrag', 'sstate', 'family', 'ceduc'], 'cki/work': ['cdolgn', 'wdohod', 'wstag']},
+    ('report', '2'): {'crdeal': ['dlamt'], 'crdeal/deallife': ['dlds', 'dlamtcur']},
+    ('report', '4'): {'reestrtime': ['wk'], 'credres': ['reqreason']},
+    ('report', '10'): {'cont': ['cval', 'vdate']},
+    ('report', 'tech'): {'billing/balance': ['value']},
+    ('score', '8'): {'urating': ['score', 'scorelast', 'scorelevel'],
+                     'urating/dinfo': ['all', 'open', 'close', 'expyear', 'maxnowexp']},
+}
+SCANNERS = {'report': CreditReportScanner, 'score': CreditScoreScanner}
+
+class UbkiFeature():
+    """ Описание признака УБКИ: документ и блок comp, из которых он вычисляется, и нужные ему элементы
+
+    Parameters
+    ----------
+    name : str
+        Имя признака
+
+    document : str
+        Документ: 'report' (кредитный отчет) или 'score' (кредитный балл)
+
+    comp : str
+        id блока comp ('tech' - системный блок кредитного отчета)
+
+    elements : Dict[str, List[str]]
+        Элементы блока (путь относительно блока, например 'crdeal/deallife') и их нужные атрибуты,
+        None вместо списка - все атрибуты
+
+    compute : Callable[[dict, str, str], Any] = None
+        Функция вычисления пользовательского признака compute(records, phone, email), где records -
+        словарь путь элемента -> список словарей атрибутов всех таких элементов блоков comp документа.
+        None - встроенный признак, вычисляемый сборщиком сканера
+    """
+    __slots__ = ('name', 'document', 'comp', 'elements', 'compute')
+
+    def __init__(self, name: str, document: str, comp: str, elements: Dict[str, Optional[List[str]]],
+                 compute: Optional[Callable] = None):
+        if document not in DOCUMENTS:
+            raise ValueError("Неизвестный документ %s, ожидается 'report' или 'score'" % document)
+        self.name = name
+        self.document = document
+        self.comp = str(comp)
+        self.elements = {path: None if attrs is None else tuple(attrs) for path, attrs in elements.items()}
+        self.compute = compute
+
+    def is_builtin(self) -> bool:
+        return self.compute is None
+
+    def __repr__(self) -> str:
+        return 'UbkiFeature(%r, %r, comp=%r)' % (self.name, self.document, self.comp)
+
+class FeaturePlan():
+    """ Скомпилированный набор признаков (см. compile_features): для каждого документа таблица
+    id блока comp -> сборщик, по которой сканер за один проход обходит каждый блок один раз
+    и пропускает блоки, не нужные ни одному признаку
+
+    Attributes
+    ----------
+    features : List[UbkiFeature]
+        Выбранные признаки
+
+    groups : Dict[str, set]
+        Группы встроенных признаков (id блоков, см. REPORT_FIELD_GROUPS) каждого документа
+
+    comp_blocks : Dict[str, dict]
+        Таблица id блока comp -> сборщик встроенных признаков каждого документа
+
+    comp_records : Dict[str, dict]
+        Таблица id блока comp -> {путь элемента: атрибуты} для пользовательских признаков каждого документа
+
+    custom : Dict[str, List[UbkiFeature]]
+        Пользовательские признаки каждого документа в порядке регистрации
+    """
+    def __init__(self, features: List[UbkiFeature]):
+        self.features = features
+        self.groups = {document: set() for document in DOCUMENTS}
+        self.comp_blocks = {document: {} for document in DOCUMENTS}
+        self.comp_records = {document: {} for document in DOCUMENTS}
+        self.custom = {document: [] for document in DOCUMENTS}
+        for feature in features:
+            document = feature.document
+            if feature.is_builtin():
+                self.groups[document].add(feature.comp)
+                block = SCANNERS[document].comp_blocks.get(feature.comp)
+                if block is not None:
+                    self.comp_blocks[document][feature.comp] = block
+                continue
+            self.custom[document].append(feature)
+            elements = self.comp_records[document].setdefault(feature.comp, {})
+            for path, attrs in feature.elements.items(): # Атрибуты элемента объединяются, None - все атрибуты
+                collected = elements.get(path, ())
+                elements[path] = None if attrs is None or collected is None else tuple(dict.fromkeys(collected + attrs))
+
+    def get_names(self, document: Optional[str] = None) -> List[str]:
+        """ Метод получения имен выбранных признаков (всех или одного документа) """
+        return [f.name for f in self.features if document is None or f.document == document]
+
+    def create_scanner(self, document: str):
+        """ Метод создания сканера документа, собирающего только нужные блоки
+
+        Parameters
+        ----------
+        document : str
+            'report' или 'score'
+
+        Returns
+        -------
+        scanner : CreditReportScanner или CreditScoreScanner
+        """
+        return SCANNERS[document](self.comp_blocks[document], self.comp_records[document])
+
+    def covers(self, scanner, document: str) -> bool:
+        """ Метод проверки, собрал ли сканер все блоки и элементы, нужные признакам документа """
+        if any(comp not in scanner.comp_blocks for comp in self.comp_blocks[document]):
+            return False
+        for comp, elements in self.comp_records[document].items():
+            collected = scanner.comp_records.get(comp, {})
+            for path, attrs in elements.items():
+                if path not in collected or collected[path] is not None and (
+                        attrs is None or not set(attrs) <= set(collected[path])):
+                    return False
+        return True
+
+    def fill_custom(self, document: str, scanner, res_dict, phone: str, email: str,
+                    names: Optional[Iterable[str]] = None):
+        """ Метод записи пользовательских признаков документа в res_dict (словарь или объект с __setitem__).
+        Ошибка вычисления признака учитывается метрикой ubki.extract.error, признак остается не записанным
+
+        Parameters
+        ----------
+        document : str
+            'report' или 'score'
+
+        scanner : CreditReportScanner | CreditScoreScanner
+            Сканер, созданный create_scanner, после разбора документа
+
+        res_dict : dict
+            Словарь (или объект с __setitem__), в который записываются признаки
+
+        phone, email : str
+            Телефон и почта персоны
+
+        names : Iterable[str] = None
+            Вычислить только эти признаки, по умолчанию все пользовательские признаки документа
+
+        Returns
+        -------
+        res dict : Тот же res_dict
+        """
+        if scanner.root != 'ubkidata' or not scanner.root_is_dict:
+            return res_dict
+        names = None if names is None else set(names)
+        for feature in self.custom[document]:
+            if names is not None and feature.name not in names:
+                continue
+            records = scanner.records.get(feature.comp)
+            records = records.get_records(feature.elements) if records else {path: [] for path in feature.elements}
+            with measure('ubki.extract.duration', {'comp': feature.comp}):
+                try:
+                    res_dict[feature.name] = feature.compute(records, phone, email)
+                except Exception as error:
+                    record_error(feature.comp, error)
+        return res_dict
+
+_features = {}  # Зарегистрированные признаки в порядке регистрации
+_plans = OrderedDict()          # Скомпилированные наборы по игнорируемым признакам, от давно использованных к недавним
+_plans_lock = threading.Lock()
+
+# Максимальное количество запомненных наборов: при большем наименее недавно использованные удаляются
+MAX_PLANS = 64
+
+def _register_builtin_features():
+    for document, field_groups in (('report', REPORT_FIELD_GROUPS), ('score', SCORE_FIELD_GROUPS)):
+        for name, comp in field_groups.items():
+            if comp is not None:
+                _features[name] = UbkiFeature(name, document, comp, BUILTIN_ELEMENTS[(document, comp)])
+
+_register_builtin_features()
+
+def register_feature(name: str, document: str, comp: str, elements: Dict[str, Optional[List[str]]],
+                     compute: Callable) -> UbkiFeature:
+    """ Функция регистрации пользовательского признака. Признак вычисляется вместе со встроенными
+    (UbkiReport.get_useful_ubki_fields, get_useful_ubki_fields_batch) без повторного разбора xml:
+    сканер дополнительно собирает только объявленные элементы и атрибуты нужного блока comp
+
+    Parameters
+    ----------
+    name : str
+        Имя признака, не совпадающее с уже зарегистрированными
+
+    document, comp, elements, compute
+        См. UbkiFeature
+
+    Returns
+    -------
+    feature : Зарегистрированный UbkiFeature
+
+    Examples
+    --------
+    >> register_feature('credits_count', 'report', '2', {'crdeal': ['dlamt']},
+    >>                  lambda records, phone, email: len(records['crdeal']))
+    >> ubki.get_useful_ubki_fields()['credits_count']
+    """
+    if name in _features or name in {f.comp for f in _features.values()}:
+        raise ValueError("Признак %s уже зарегистрирован" % name)
+    if compute is None or str(comp) == 'tech':
+        raise ValueError("Пользовательский признак должен иметь compute и вычисляться по блоку comp")
+    feature = UbkiFeature(name, document, comp, elements, compute)
+    _features[name] = feature
+    with _plans_lock:
+        _plans.clear()
+    return feature
+
+def unregister_feature(name: str):
+    """ Функция удаления пользовательского признака, зарегистрированного register_feature
+
+    Parameters
+    ----------
+    name : str
+        Имя признака
+    """
+    feature = _features.get(name)
+    if feature is None or feature.is_builtin():
+        raise ValueError("Пользовательский признак %s не зарегистрирован" % name)
+    del _features[name]
+    with _plans_lock:
+        _plans.clear()
+
+def get_features(document: Optional[str] = None, custom: Optional[bool] = None) -> List[UbkiFeature]:
+    """ Функция получения зарегистрированных признаков
+
+    Parameters
+    ----------
+    document : str = None
+        Только признаки документа 'report' или 'score'
+
+    custom : bool = None
+        True - только пользовательские, False - только встроенные, None - все
+
+    Returns
+    -------
+    features : Список UbkiFeature в порядке регистрации
+    """
+    return [f for f in _features.values() if (document is None or f.document == document)
+            and (custom is None or custom != f.is_builtin())]
+
+def get_features_version() -> str:
+    """ Функция получения версии реестра признаков: хэш версии встроенных признаков и описаний
+    пользовательских (имя, документ, блок, элементы, код compute). Признаки, запомненные при другой
+    версии, могли быть вычислены иначе
+
+    Returns
+    -------
+    version : Строка из 16 шестнадцатеричных цифр
+    """
+    digest = hashlib.sha1(str(BUILTIN_FEATURES_VERSION).encode('ascii'))
+    for feature in get_features(custom=True):
+        code = getattr(feature.compute, '__code__', None)
+        digest.update(repr((feature.name, feature.document, feature.comp, sorted(feature.elements.items()),
+                            getattr(feature.compute, '__qualname__', None))).encode('utf-8'))
+        digest.update(code.co_code if code is not None else b'')
+    return digest.hexdigest()[:16]
+
+def compile_features(fields_to_ignore: Iterable[str] = ()) -> FeaturePlan:
+    """ Функция компиляции набора признаков (всех зарегистрированных, кроме игнорируемых) в таблицы
+    сборщиков блоков comp. Результат запоминается до следующей регистрации признака (не более MAX_PLANS
+    наборов, ключ - только зарегистрированные игнорируемые признаки)
+
+    Parameters
+    ----------
+    fields_to_ignore : Iterable[str] = ()
+        Не нужные признаки
+
+    Returns
+    -------
+    plan : FeaturePlan
+    """
+    key = frozenset(name for name in fields_to_ignore if name in _features) # Остальные имена не меняют набор
+    with _plans_lock:
+        plan = _plans.get(key)
+        if plan is not None:
+            _plans.move_to_end(key)
+            return plan
+    plan = FeaturePlan([f for name, f in _features.items() if name not in key])
+    with _plans_lock:
+        _plans[key] = plan
+        while len(_plans) > MAX_PLANS:
+            _plans.popitem(last=False)
+    return plan
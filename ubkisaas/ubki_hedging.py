@@ -0,0 +1,265 @@
+from .ubki_metrics import get_metrics_sink
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Awaitable, Callable, Optional
+from collections import deque
+import threading
+import asyncio
+import time
+
+class _HedgerBase():
+    def __init__(self, percentile:float = 95, budget:float = 0.05, burst:float = 10, min_delay:float = 0.01,
+                 min_samples:int = 50, window:int = 1000):
+        self.percentile = percentile
+        self.budget = budget
+        self.burst = burst
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.window = window
+        self.requests = 0
+        self.hedged = 0
+        self.wins = 0
+        self.skipped = 0
+        self._credits = 0.0
+        self._latencies = {}
+        self._delays = {}
+        self._stale = {}
+        self._lock = threading.Lock()
+
+    def get_delay(self, reqtype:int) -> Optional[float]:
+        """ Метод получения задержки, после которой запрос дублируется
+
+        Parameters
+        ----------
+        reqtype : int
+            Номер шаблона отчета
+
+        Returns
+        -------
+        delay : Перцентиль percentile последних задержек шаблона (не меньше min_delay),
+            None - задержек еще меньше min_samples и запрос не дублируется
+        """
+        with self._lock:
+            return self._get_delay(reqtype)
+
+    def _get_delay(self, reqtype:int) -> Optional[float]:
+        latencies = self._latencies.get(reqtype)
+        if latencies is None or len(latencies) < self.min_samples:
+            return None
+        delay = self._delays.get(reqtype)
+        if delay is None or self._stale[reqtype] >= max(1, self.window // 10): # Перцентиль пересчитывается не на каждый ответ
+            ordered = sorted(latencies)
+            delay = self._delays[reqtype] = max(self.min_delay, ordered[min(len(ordered) - 1,
+                                                                           int(len(ordered) * self.percentile / 100))])
+            self._stale[reqtype] = 0
+        return delay
+
+    def _start(self, reqtype:int) -> Optional[float]:
+        with self._lock:
+            self.requests += 1
+            self._credits = min(self.burst, self._credits + self.budget)
+            return self._get_delay(reqtype)
+
+    def _record(self, reqtype:int, latency:float):
+        with self._lock:
+            latencies = self._latencies.get(reqtype)
+            if latencies is None:
+                latencies = self._latencies[reqtype] = deque(maxlen=self.window)
+                self._stale[reqtype] = 0
+            latencies.append(latency)
+            self._stale[reqtype] += 1
+
+    def _take(self, reqtype:int) -> bool:
+        """ Забор бюджета на дублирующий запрос """
+        with self._lock:
+            allowed = self._credits >= 1
+            if allowed:
+                self._credits -= 1
+                self.hedged += 1
+            else:
+                self.skipped += 1
+        get_metrics_sink().increment('ubki.hedge.sent' if allowed else 'ubki.hedge.skipped', 1, {'reqtype': reqtype})
+        return allowed
+
+    def _won(self, reqtype:int):
+        with self._lock:
+            self.wins += 1
+        get_metrics_sink().increment('ubki.hedge.won', 1, {'reqtype': reqtype})
+
+    def get_stats(self) -> dict:
+        """ Метод получения счетчиков дублирования
+
+        Returns
+        -------
+        stats : Словарь с количеством запросов, дублированных запросов, побед дубликата,
+            пропущенных из-за бюджета дублирований, долей дублирований и текущими задержками по шаблонам
+        """
+        with self._lock:
+            return {'requests': self.requests, 'hedged': self.hedged, 'wins': self.wins, 'skipped': self.skipped,
+                    'hedge_rate': self.hedged / self.requests if self.requests else 0.0,
+                    'delays': {reqtype: self._get_delay(reqtype) for reqtype in self._latencies}}
+
+class RequestHedger(_HedgerBase):
+    """ Дублирование медленных запросов отчетов для снижения хвостовых задержек (hedged requests).
+    Если запрос не получил ответ за перцентиль percentile недавних задержек своего шаблона,
+    отправляется второй такой же запрос, и используется ответ, пришедший первым.
+    Дубликаты ограничены бюджетом: не более budget от количества запросов (и не более burst подряд).
+    Запросы выполняются в собственном пуле потоков, проигравший запрос завершается в фоне.
+    В перцентиль попадают задержки только успешно завершенных запросов (и основных, и дублирующих).
+
+    Parameters
+    ----------
+    percentile : float = 95
+        Перцентиль задержек, после которого запрос дублируется
+
+    budget : float = 0.05
+        Максимальная доля дублирующих запросов
+
+    burst : float = 10
+        Максимальное количество дублирований, накопленных из бюджета
+
+    min_delay : float = 0.01
+        Минимальная задержка перед дублированием в секундах
+
+    min_samples : int = 50
+        Количество ответов шаблона, до накопления которого запросы не дублируются
+
+    window : int = 1000
+        Количество последних задержек, по которым считается перцентиль
+
+    max_workers : int = 64
+        Размер пула потоков, должен быть не меньше удвоенного количества одновременных запросов
+
+    Examples
+    --------
+    >> hedger = RequestHedger(percentile = 95, budget = 0.05)
+    >> connect = UbkiRequest("login", "password", hedger = hedger)
+    >> hedger.get_stats()
+    {'requests': 2000, 'hedged': 97, 'wins': 71, 'skipped': 3, 'hedge_rate': 0.0485, 'delays': {10: 0.41, 11: 0.22}}
+    """
+    def __init__(self, percentile:float = 95, budget:float = 0.05, burst:float = 10, min_delay:float = 0.01,
+                 min_samples:int = 50, window:int = 1000, max_workers:int = 64):
+        super().__init__(percentile, budget, burst, min_delay, min_samples, window)
+        self.max_workers = max_workers
+        self._executor = None
+
+    def do(self, reqtype:int, function:Callable[[], Any], hedge_function:Optional[Callable[[], Any]] = None) -> Any:
+        """ Метод выполнения запроса с дублированием
+
+        Parameters
+        ----------
+        reqtype : int
+            Номер шаблона отчета, задержки каждого шаблона учитываются отдельно
+
+        function : Callable[[], Any]
+            Функция запроса без аргументов
+
+        hedge_function : Callable[[], Any] = None
+            Функция дублирующего запроса, по умолчанию function
+
+        Returns
+        -------
+        result : Результат запроса, ответившего первым. Если первый завершился ошибкой,
+            ждется второй, а ошибка вызывается, только если не удались оба
+        """
+        delay = self._start(reqtype)
+        if delay is None:
+            return self._timed(reqtype, function)
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='ubki-hedge')
+        primary = self._executor.submit(self._timed, reqtype, function)
+        done, _ = wait([primary], timeout=delay)
+        if done or not self._take(reqtype):
+            return primary.result()
+        hedge = self._executor.submit(self._timed, reqtype, hedge_function or function)
+        done, pending = wait([primary, hedge], return_when=FIRST_COMPLETED)
+        first = primary if primary in done else hedge
+        if first.exception() is not None and pending: # Первый ответ - ошибка: ждем второй
+            second = pending.pop()
+            if second.exception() is None:
+                first = second
+        if first is hedge and hedge.exception() is None:
+            self._won(reqtype)
+        return first.result()
+
+    def close(self):
+        """ Метод остановки пула потоков (без ожидания проигравших запросов) """
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def _timed(self, reqtype:int, function:Callable[[], Any]) -> Any:
+        start = time.perf_counter()
+        result = function()
+        self._record(reqtype, time.perf_counter() - start)
+        return result
+
+class AsyncRequestHedger(_HedgerBase):
+    """ Асинхронный аналог RequestHedger для AsyncUbkiRequest (параметры те же, кроме max_workers).
+    Проигравший запрос отменяется
+
+    Examples
+    --------
+    >> async with AsyncUbkiRequest("login", "password", hedger = AsyncRequestHedger(budget = 0.1)) as connect:
+    >>     await connect.get_person_credit_report(data)
+    """
+    def __init__(self, percentile:float = 95, budget:float = 0.05, burst:float = 10, min_delay:float = 0.01,
+                 min_samples:int = 50, window:int = 1000):
+        super().__init__(percentile, budget, burst, min_delay, min_samples, window)
+        self._tasks = set()
+
+    async def do(self, reqtype:int, function:Callable[[], Awaitable[Any]],
+                 hedge_function:Optional[Callable[[], Awaitable[Any]]] = None) -> Any:
+        """ Метод выполнения запроса с дублированием (см. RequestHedger.do, функции возвращают корутины) """
+        delay = self._start(reqtype)
+        if delay is None:
+            return await self._timed(reqtype, function)
+        primary = self._submit(self._timed(reqtype, function))
+        hedge = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done or not self._take(reqtype):
+                return await primary
+            hedge = self._submit(self._timed(reqtype, hedge_function or function))
+            done, pending = await asyncio.wait({primary, hedge}, return_when=asyncio.FIRST_COMPLETED)
+            first = primary if primary in done else hedge
+            if first.exception() is not None and pending: # Первый ответ - ошибка: ждем второй
+                second = pending.pop()
+                await asyncio.wait({second})
+                if second.exception() is None:
+                    first = second
+            if first is hedge and hedge.exception() is None:
+                self._won(reqtype)
+            return first.result()
+        finally:
+            for task in (primary, hedge):
+                if task is None:
+                    continue
+                if task.done():
+                    if not task.cancelled():
+                        task.exception() # Ошибка проигравшего уже учтена
+                else:
+                    task.cancel()
+
+    async def close(self):
+        """ Метод отмены выполняющихся запросов (основных и дублирующих) """
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _submit(self, coroutine:Awaitable[Any]) -> asyncio.Future:
+        task = asyncio.ensure_future(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _timed(self, reqtype:int, function:Callable[[], Awaitable[Any]]) -> Any:
+        # Учитываются только завершенные запросы: время отмененного проигравшего занижало бы перцентиль
+        start = time.perf_counter()
+        result = await function()
+        self._record(reqtype, time.perf_counter() - start)
+        return result
@@ -0,0 +1,219 @@
+""" Нагрузочный тест всего конвейера: запрос отчетов через UbkiRequest (или AsyncUbkiRequest) и вычисление признаков.
+
+Запуск (после установки пакета):
+    ubki-loadgen --requests 2000 --concurrency 32 --latency 0.05 --error-rate 0.01   # со встроенным MockUbkiServer
+    ubki-loadgen --url http://127.0.0.1:8080/b2_api_xml/ubki --async --concurrency 200
+
+Без --url запускается MockUbkiServer в том же процессе. Для замера без влияния сервера на клиента
+сервер лучше запустить отдельно: python -m ubkisaas.ubki_mock_server
+"""
+from .ubki_request import UbkiRequest, TEST_PERSON_DATA
+from .ubki_transport import UbkiTransport
+from .ubki_session_store import SessionStore
+from .ubki_metrics import InMemoryMetrics, get_metrics_sink, set_metrics_sink
+from .ubki_mock_server import add_server_arguments, create_server
+from .ubki_hedging import RequestHedger
+
+from typing import Iterator, List, Optional
+import numpy as np
+import threading
+import tempfile
+import argparse
+import asyncio
+import time
+import sys
+import os
+
+def get_load_persons(count:int, seed:int = 0) -> Iterator[dict]:
+    """ Функция генерации данных о разных персонах для нагрузочного теста
+
+    Parameters
+    ----------
+    count : int
+        Количество персон
+
+    seed : int = 0
+        Смещение номеров персон
+
+    Returns
+    -------
+    persons : Генератор словарей данных о персонах (как TEST_PERSON_DATA, но с разными okpo и reqidout)
+    """
+    for i in range(count):
+        yield dict(TEST_PERSON_DATA, okpo='%010d' % (seed * count + i), reqidout='%05d' % i)
+
+def run_load(url:str, requests:int = 1000, concurrency:int = 16, use_async:bool = False,
+             login:str = 'loadgen', password:str = 'loadgen', seed:int = 0, hedge:Optional[float] = None,
+             hedge_budget:float = 0.05, stream:bool = False) -> dict:
+    """ Функция нагрузочного теста: requests персон обрабатываются с concurrency одновременных запросов,
+    для каждой замеряется время от запроса отчетов до получения признаков get_useful_ubki_fields
+
+    Parameters
+    ----------
+    url : str
+        Базовый адрес API (например, MockUbkiServer.url)
+
+    requests : int = 1000
+        Количество персон
+
+    concurrency : int = 16
+        Количество одновременно обрабатываемых персон (потоков или задач asyncio)
+
+    use_async : bool = False
+        Использовать AsyncUbkiRequest (требует aiohttp)
+
+    login, password : str
+        Логин и пароль для авторизации
+
+    seed : int = 0
+        Смещение номеров персон
+
+    hedge : float = None
+        Перцентиль задержки, после которого запрос отчета дублируется (см. RequestHedger),
+        по умолчанию без дублирования
+
+    hedge_budget : float = 0.05
+        Максимальная доля дублирующих запросов
+
+    stream : bool = False
+        Потоковый режим клиента: ответы разбираются по мере получения
+
+    Returns
+    -------
+    results : Словарь с количеством персон и ошибок, временем, персон в секунду, задержками p50/p90/p99/max в мс,
+        количеством ответов по кодам http, повторов http и повторов из-за отклоненного сессионного ключа,
+        а при дублировании - статистикой RequestHedger.get_stats
+    """
+    metrics = InMemoryMetrics()
+    previous = get_metrics_sink()
+    set_metrics_sink(metrics)
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            store = SessionStore(os.path.join(directory, 'ubki_keys.json'))
+            persons = get_load_persons(requests, seed)
+            hedger = None
+            if use_async:
+                if hedge is not None:
+                    from .ubki_hedging import AsyncRequestHedger
+                    hedger = AsyncRequestHedger(hedge, hedge_budget)
+                latencies, errors, elapsed = asyncio.run(
+                    _run_async(url, persons, concurrency, login, password, store, hedger, stream))
+            else:
+                if hedge is not None:
+                    hedger = RequestHedger(hedge, hedge_budget, max_workers=4 * concurrency)
+                latencies, errors, elapsed = _run_threads(url, persons, concurrency, login, password, store, hedger,
+                                                          stream)
+    finally:
+        set_metrics_sink(previous)
+    stats = metrics.get_stats()
+    latencies = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    results = {
+        'requests': requests,
+        'errors': errors,
+        'elapsed_s': round(elapsed, 3),
+        'throughput': round(requests / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(float(np.percentile(latencies, 50)), 2),
+        'p90_ms': round(float(np.percentile(latencies, 90)), 2),
+        'p99_ms': round(float(np.percentile(latencies, 99)), 2),
+        'max_ms': round(float(latencies.max()), 2),
+        'http': {key.rsplit('=', 1)[-1]: stat['count'] for key, stat in sorted(stats.items())
+                 if key.startswith('ubki.http.duration ')},
+        'http_retries': sum(stat['count'] for key, stat in stats.items() if key.startswith('ubki.http.retry')),
+        'session_retries': sum(stat['count'] for key, stat in stats.items()
+                               if key.startswith('ubki.request.session_retry')),
+    }
+    if hedger is not None:
+        results['hedge'] = hedger.get_stats()
+    return results
+
+def _run_threads(url:str, persons:Iterator[dict], concurrency:int, login:str, password:str, store:SessionStore,
+                 hedger:Optional[RequestHedger], stream:bool) -> tuple:
+    client = UbkiRequest(login, password, transport=UbkiTransport(pool_size=2 * concurrency), session_store=store,
+                         base_url=url, hedger=hedger, stream=stream)
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                person = next(persons, None)
+            if person is None:
+                return
+            start = time.perf_counter()
+            try:
+                client.get_person_credit_report(person).get_useful_ubki_fields()
+            except Exception:
+                with lock:
+                    errors[0] += 1
+                continue
+            latency = time.perf_counter() - start
+            with lock:
+                latencies.append(latency)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    client.close()
+    return latencies, errors[0], elapsed
+
+async def _run_async(url:str, persons:Iterator[dict], concurrency:int, login:str, password:str, store:SessionStore,
+                     hedger, stream:bool) -> tuple:
+    from .ubki_async_request import AsyncUbkiRequest
+    from .ubki_transport import AsyncUbkiTransport
+
+    latencies, errors = [], 0
+
+    async def worker():
+        nonlocal errors
+        for person in persons: # Общий генератор: каждая задача берет следующую персону
+            start = time.perf_counter()
+            try:
+                (await client.get_person_credit_report(person)).get_useful_ubki_fields()
+            except Exception:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    async with AsyncUbkiRequest(login, password, transport=AsyncUbkiTransport(pool_size=2 * concurrency),
+                                session_store=store, base_url=url, hedger=hedger, stream=stream) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return latencies, errors, elapsed
+
+def main(argv:Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog='ubki-loadgen', description='Нагрузочный тест запроса отчетов УБКИ и '
+                                     'вычисления признаков')
+    parser.add_argument('--url', help='базовый адрес API (по умолчанию запускается MockUbkiServer)')
+    parser.add_argument('--requests', type=int, default=1000, help='количество персон')
+    parser.add_argument('--concurrency', type=int, default=16, help='количество одновременных запросов')
+    parser.add_argument('--async', dest='use_async', action='store_true', help='использовать AsyncUbkiRequest')
+    parser.add_argument('--stream', action='store_true', help='разбирать ответы по мере получения')
+    parser.add_argument('--hedge', type=float, metavar='PERCENTILE', help='дублировать запросы медленнее перцентиля')
+    parser.add_argument('--hedge-budget', type=float, default=0.05, help='максимальная доля дублирующих запросов')
+    add_server_arguments(parser)
+    args = parser.parse_args(argv)
+
+    server = None if args.url else create_server(args).start()
+    try:
+        results = run_load(args.url or server.url, args.requests, args.concurrency, args.use_async, seed=args.seed,
+                           hedge=args.hedge, hedge_budget=args.hedge_budget, stream=args.stream)
+    finally:
+        if server is not None:
+            server.stop()
+    print('%10s %8s %10s %10s %10s %10s %10s' % ('requests', 'errors', 'persons/s', 'p50_ms', 'p90_ms', 'p99_ms', 'max_ms'))
+    print('%(requests)10d %(errors)8d %(throughput)10s %(p50_ms)10s %(p90_ms)10s %(p99_ms)10s %(max_ms)10s' % results)
+    print('http: %s, повторов http: %d, повторов сессии: %d' % (
+        ', '.join('%s=%d' % item for item in results['http'].items()) or '-',
+        results['http_retries'], results['session_retries']))
+    if 'hedge' in results:
+        print('дублировано: %(hedged)d (%(hedge_rate).1f%%), дубликат быстрее: %(wins)d, без бюджета: %(skipped)d' %
+              dict(results['hedge'], hedge_rate=results['hedge']['hedge_rate'] * 100))
+    return 1 if results['errors'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
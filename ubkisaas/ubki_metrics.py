@@ -0,0 +1,151 @@
+from typing import Optional, Union
+import threading
+import time
+
+class MetricsSink():
+    """ Приемник метрик библиотеки. Базовый класс ничего не делает (enabled = False), поэтому
+    без подключенного приемника замеры времени не выполняются. Для отправки метрик в свою
+    систему мониторинга достаточно унаследоваться, переопределить методы и вызвать set_metrics_sink.
+
+    Метрики библиотеки (теги в скобках):
+        ubki.auth.duration                      - авторизация
+        ubki.request.duration (reqtype)         - запрос отчета, включая повтор с новым сессионным ключом
+        ubki.request.session_retry (reqtype)    - повтор запроса из-за отклоненного сессионого ключа
+        ubki.response.size (reqtype)            - размер ответа в символах (в потоковом режиме - в байтах)
+        ubki.http.duration (status)             - одна попытка http запроса
+        ubki.http.retry (reason)                - повтор http запроса (код ответа или тип исключения)
+        ubki.parse.duration (document)          - разбор xml кредитного отчета (report) или балла (score),
+                                                  в потоковом режиме - суммарное время разбора частей
+        ubki.extract.duration (comp)            - вычисление признаков блока comp (или tech)
+        ubki.extract.error (comp, error)        - ошибка в данных блока, из-за которой его признаки не вычислены
+        ubki.scheduler.queue_depth (endpoint, priority) - глубина очереди планировщика при постановке запроса
+        ubki.scheduler.wait (endpoint, priority)        - ожидание разрешения планировщика
+        ubki.scheduler.dropped (endpoint, priority, reason) - запрос отклонен планировщиком (queue_full, deadline)
+        ubki.hedge.sent (reqtype)               - отправлен дублирующий запрос медленного отчета
+        ubki.hedge.won (reqtype)                - дублирующий запрос ответил раньше исходного
+        ubki.hedge.skipped (reqtype)            - запрос не дублирован из-за исчерпанного бюджета
+    """
+    enabled = False
+
+    def timing(self, name:str, seconds:float, tags:Optional[dict] = None):
+        """ Метод записи длительности операции в секундах """
+
+    def increment(self, name:str, value:int = 1, tags:Optional[dict] = None):
+        """ Метод увеличения счетчика """
+
+    def observe(self, name:str, value:float, tags:Optional[dict] = None):
+        """ Метод записи значения (например, размера ответа) """
+
+class InMemoryMetrics(MetricsSink):
+    """ Приемник метрик, накапливающий в памяти количество, сумму и максимум каждой метрики с набором тегов.
+    Удобен для отладки и тестов
+
+    Examples
+    --------
+    >> metrics = InMemoryMetrics()
+    >> set_metrics_sink(metrics)
+    >> ubki.get_useful_ubki_fields()
+    >> metrics.get_stats()['ubki.extract.duration comp=2']
+    {'count': 1, 'sum': 0.0012, 'max': 0.0012}
+    """
+    enabled = True
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def timing(self, name:str, seconds:float, tags:Optional[dict] = None):
+        self.observe(name, seconds, tags)
+
+    def increment(self, name:str, value:int = 1, tags:Optional[dict] = None):
+        self.observe(name, value, tags)
+
+    def observe(self, name:str, value:float, tags:Optional[dict] = None):
+        key = name if not tags else name + ' ' + ' '.join('%s=%s' % (k, tags[k]) for k in sorted(tags))
+        with self._lock:
+            stat = self._stats.get(key)
+            if stat is None:
+                self._stats[key] = {'count': 1, 'sum': value, 'max': value}
+            else:
+                stat['count'] += 1
+                stat['sum'] += value
+                stat['max'] = max(stat['max'], value)
+
+    def get_stats(self) -> dict:
+        """ Метод получения накопленных метрик
+
+        Returns
+        -------
+        stats : Словарь "имя тег=значение ..." -> {'count', 'sum', 'max'}
+        """
+        with self._lock:
+            return {key: dict(stat) for key, stat in self._stats.items()}
+
+    def clear(self):
+        """ Метод очистки накопленных метрик
+        """
+        with self._lock:
+            self._stats.clear()
+
+_sink = MetricsSink()
+
+def set_metrics_sink(sink:Optional[MetricsSink]):
+    """ Функция подключения приемника метрик для всей библиотеки
+
+    Parameters
+    ----------
+    sink : MetricsSink
+        Приемник метрик, None - отключить метрики
+    """
+    global _sink
+    _sink = sink if sink is not None else MetricsSink()
+
+def get_metrics_sink() -> MetricsSink:
+    """ Функция получения текущего приемника метрик """
+    return _sink
+
+def record_error(comp:str, error:Union[BaseException, str]):
+    """ Функция учета ошибки в данных блока comp, из-за которой его признаки не вычислены
+
+    Parameters
+    ----------
+    comp : str
+        id блока comp, tech или document (ошибка структуры всего документа)
+
+    error : BaseException | str
+        Исключение или имя его типа
+    """
+    if _sink.enabled:
+        _sink.increment('ubki.extract.error', 1, {'comp': comp, 'error': error if isinstance(error, str) else type(error).__name__})
+
+class measure():
+    """ Контекстный менеджер замера длительности блока кода. При отключенных метриках ничего не замеряет
+
+    Parameters
+    ----------
+    name : str
+        Имя метрики
+
+    tags : dict = None
+        Теги метрики
+
+    Examples
+    --------
+    >> with measure('ubki.parse.duration', {'document': 'report'}):
+    >>     scanner.feed(xml).close()
+    """
+    __slots__ = ('name', 'tags', 'sink', 'start')
+
+    def __init__(self, name:str, tags:Optional[dict] = None):
+        self.name = name
+        self.tags = tags
+        self.sink = _sink
+
+    def __enter__(self):
+        if self.sink.enabled:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.sink.enabled:
+            self.sink.timing(self.name, time.perf_counter() - self.start, self.tags)
@@ -0,0 +1,309 @@
+""" Локальный сервер, имитирующий API УБКИ (/auth и /xml), для нагрузочного тестирования без test.ubki.ua.
+
+Запуск:
+    python -m ubkisaas.ubki_mock_server --port 8080 --profile large --latency 0.2 --error-rate 0.01
+
+Отчеты синтетические (ubki_synthetic), задержка ответа, доля ошибок и размер отчетов настраиваются.
+"""
+from .ubki_synthetic import generate_credit_report_xml, generate_credit_score_xml
+from .ubki_benchmark import PROFILES
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from typing import List, Optional
+import threading
+import argparse
+import random
+import math
+import json
+import uuid
+import zlib
+import time
+import sys
+import re
+
+MOCK_PATH = '/b2_api_xml/ubki'
+
+# Распределения задержки ответа: (rnd, latency, spread) -> секунды. latency - медиана (fixed, uniform,
+# lognormal) или среднее (exponential), spread - относительный разброс (uniform) или sigma (lognormal)
+LATENCY_DISTRIBUTIONS = {
+    'fixed': lambda rnd, latency, spread: latency,
+    'uniform': lambda rnd, latency, spread: max(0.0, rnd.uniform(latency * (1 - spread), latency * (1 + spread))),
+    'lognormal': lambda rnd, latency, spread: latency * math.exp(rnd.gauss(0, spread)),
+    'exponential': lambda rnd, latency, spread: rnd.expovariate(1 / latency) if latency > 0 else 0.0,
+}
+
+SESSION_ERROR_XML = '<?xml version="1.0" encoding="utf-8"?><doc><ubki><error errtype="auth" ' \
+                    'errtext="Недійсний ідентифікатор сесії (sessid)"/></ubki></doc>'
+SERVER_ERROR_XML = '<?xml version="1.0" encoding="utf-8"?><doc><ubki><error errtype="server" ' \
+                   'errtext="Сервіс тимчасово недоступний"/></ubki></doc>'
+
+_SESSID = re.compile(r'sessid="([^"]*)"')
+_REQTYPE = re.compile(r'reqtype="([^"]*)"')
+_OKPO = re.compile(r'okpo="([^"]*)"')
+
+class MockUbkiServer():
+    """ Локальный http сервер с адресами /auth и /xml, как у API УБКИ. Отвечает синтетическими
+    кредитными отчетами и баллами (один и тот же отчет для одного okpo), проверяет сессионные ключи
+    и имитирует задержку, временные сбои (ответ 503) и отзыв сессионного ключа.
+    Каждый запрос обрабатывается в своем потоке.
+
+    Parameters
+    ----------
+    host : str = '127.0.0.1'
+        Адрес, на котором слушает сервер
+
+    port : int = 0
+        Порт, 0 - любой свободный (см. url)
+
+    profile : str = 'medium'
+        Размер отчетов из PROFILES бенчмарка
+
+    sizes : dict = None
+        Параметры generate_credit_report_xml, дополняющие профиль
+
+    samples : int = 20
+        Количество разных отчетов, которые раздает сервер
+
+    latency : float = 0.0
+        Задержка ответа в секундах (медиана или среднее, см. LATENCY_DISTRIBUTIONS)
+
+    distribution : str = 'lognormal'
+        Распределение задержки из LATENCY_DISTRIBUTIONS
+
+    spread : float = 0.5
+        Разброс задержки
+
+    error_rate : float = 0.0
+        Доля запросов, на которые сервер отвечает 503
+
+    session_error_rate : float = 0.0
+        Доля запросов отчетов, на которые сервер отзывает сессионный ключ и отвечает ошибкой сессии
+
+    session_ttl : float = None
+        Время жизни сессионного ключа в секундах, по умолчанию не ограничено
+
+    seed : int = 0
+        Зерно генератора отчетов, задержек и ошибок
+
+    Examples
+    --------
+    >> with MockUbkiServer(profile = 'large', latency = 0.05) as server:
+    >>     connect = UbkiRequest("login", "password", base_url = server.url)
+    >>     connect.get_person_credit_report(data).get_useful_ubki_fields()
+    """
+    def __init__(self, host:str = '127.0.0.1', port:int = 0, profile:str = 'medium', sizes:Optional[dict] = None,
+                 samples:int = 20, latency:float = 0.0, distribution:str = 'lognormal', spread:float = 0.5,
+                 error_rate:float = 0.0, session_error_rate:float = 0.0, session_ttl:Optional[float] = None,
+                 seed:int = 0):
+        if distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError("Неизвестное распределение %s, ожидается одно из %s" % (distribution, list(LATENCY_DISTRIBUTIONS)))
+        sizes = dict(PROFILES[profile], **(sizes or {}))
+        self.reports = [generate_credit_report_xml(seed + i, **sizes).encode('utf-8') for i in range(samples)]
+        self.scores = [generate_credit_score_xml(seed + i).encode('utf-8') for i in range(samples)]
+        self.latency = latency
+        self.distribution = distribution
+        self.spread = spread
+        self.error_rate = error_rate
+        self.session_error_rate = session_error_rate
+        self.session_ttl = session_ttl
+        self._sample_latency = LATENCY_DISTRIBUTIONS[distribution]
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._stats = {'auth': 0, 'xml': 0, 'server_errors': 0, 'session_errors': 0, 'bytes': 0}
+        self._thread = None
+        self._httpd = _ThreadingHTTPServer((host, port), _MockHandler)
+        self._httpd.mock = self
+
+    @property
+    def url(self) -> str:
+        """ Базовый адрес API для параметра base_url UbkiRequest """
+        host, port = self._httpd.server_address[:2]
+        return 'http://%s:%d%s' % (host, port, MOCK_PATH)
+
+    def start(self) -> 'MockUbkiServer':
+        """ Метод запуска сервера в фоновом потоке """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._httpd.serve_forever, name='MockUbkiServer', daemon=True)
+            self._thread.start()
+        return self
+
+    def serve_forever(self):
+        """ Метод запуска сервера в текущем потоке (до KeyboardInterrupt или stop из другого потока) """
+        self._httpd.serve_forever()
+
+    def stop(self):
+        """ Метод остановки сервера и закрытия сокета """
+        if self._thread is not None:
+            self._httpd.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def get_stats(self) -> dict:
+        """ Метод получения счетчиков сервера
+
+        Returns
+        -------
+        stats : Словарь с количеством запросов авторизации и отчетов, ответов 503,
+            ошибок сессии и отправленных байт тел ответов
+        """
+        with self._lock:
+            return dict(self._stats)
+
+    def handle(self, path:str, body:bytes) -> tuple:
+        """ Метод обработки запроса
+
+        Parameters
+        ----------
+        path : str
+            Путь запроса
+
+        body : bytes
+            Тело запроса
+
+        Returns
+        -------
+        response : (код ответа, тип содержимого, тело ответа в байтах)
+        """
+        endpoint = path.rstrip('/').rsplit('/', 1)[-1]
+        if endpoint not in ('auth', 'xml'):
+            return 404, 'text/plain', b'Not Found'
+        with self._lock:
+            self._stats[endpoint] += 1
+            delay = self._sample_latency(self._random, self.latency, self.spread) if self.latency > 0 else 0.0
+            failed = self._random.random() < self.error_rate
+            revoked = self._random.random() < self.session_error_rate
+        if delay > 0:
+            time.sleep(delay)
+        if failed:
+            return self._respond(503, 'application/xml', SERVER_ERROR_XML.encode('utf-8'), 'server_errors')
+        text = body.decode('utf-8', 'replace')
+        if endpoint == 'auth':
+            try:
+                login = json.loads(text)['doc']['auth']['login']
+            except (ValueError, KeyError, TypeError):
+                login = None
+            if not login:
+                return self._respond(400, 'text/plain', b'Bad Request')
+            sessid = uuid.uuid4().hex.upper()
+            with self._lock:
+                self._sessions[sessid] = time.monotonic()
+            return self._respond(200, 'application/json', json.dumps({'doc': {'auth': {'sessid': sessid}}}).encode('utf-8'))
+        match = _SESSID.search(text)
+        sessid = match.group(1) if match else None
+        with self._lock:
+            created = self._sessions.get(sessid)
+            if created is not None and (revoked or self.session_ttl is not None
+                                        and time.monotonic() - created > self.session_ttl):
+                del self._sessions[sessid]
+                created = None
+        if created is None:
+            return self._respond(200, 'application/xml', SESSION_ERROR_XML.encode('utf-8'), 'session_errors')
+        match = _OKPO.search(text)
+        index = zlib.crc32((match.group(1) if match else '').encode('utf-8')) % len(self.reports)
+        match = _REQTYPE.search(text)
+        documents = self.scores if match and match.group(1) == '11' else self.reports
+        return self._respond(200, 'application/xml', documents[index])
+
+    def _respond(self, status:int, content_type:str, data:bytes, counter:Optional[str] = None) -> tuple:
+        with self._lock:
+            self._stats['bytes'] += len(data)
+            if counter is not None:
+                self._stats[counter] += 1
+        return status, content_type, data
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], ConnectionError): # Клиент закрыл соединение (например, отменил запрос)
+            super().handle_error(request, client_address)
+
+class _MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # keep-alive, как у настоящего сервера
+    disable_nagle_algorithm = True # Заголовки и тело пишутся отдельно, без TCP_NODELAY ответ ждет задержанного ACK
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        status, content_type, data = self.server.mock.handle(self.path, body)
+        self.send_response(status)
+        self.send_header('Content-Type', content_type + '; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+def add_server_arguments(parser:argparse.ArgumentParser):
+    """ Функция добавления параметров MockUbkiServer в парсер аргументов командной строки
+
+    Parameters
+    ----------
+    parser : argparse.ArgumentParser
+        Парсер аргументов
+    """
+    parser.add_argument('--profile', choices=list(PROFILES), default='medium', help='размер отчетов')
+    parser.add_argument('--latency', type=float, default=0.0, help='задержка ответа в секундах')
+    parser.add_argument('--distribution', choices=list(LATENCY_DISTRIBUTIONS), default='lognormal',
+                        help='распределение задержки')
+    parser.add_argument('--spread', type=float, default=0.5, help='разброс задержки')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='доля ответов 503')
+    parser.add_argument('--session-error-rate', type=float, default=0.0, help='доля отзывов сессионного ключа')
+    parser.add_argument('--session-ttl', type=float, help='время жизни сессионного ключа в секундах')
+    parser.add_argument('--seed', type=int, default=0, help='зерно генератора')
+
+def create_server(args:argparse.Namespace, host:str = '127.0.0.1', port:int = 0) -> MockUbkiServer:
+    """ Функция создания MockUbkiServer по аргументам, добавленным add_server_arguments
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        Разобранные аргументы командной строки
+
+    host : str = '127.0.0.1'
+        Адрес сервера
+
+    port : int = 0
+        Порт сервера
+
+    Returns
+    -------
+    server : Не запущенный MockUbkiServer
+    """
+    return MockUbkiServer(host, port, args.profile, latency=args.latency, distribution=args.distribution,
+                          spread=args.spread, error_rate=args.error_rate, session_error_rate=args.session_error_rate,
+                          session_ttl=args.session_ttl, seed=args.seed)
+
+def main(argv:Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m ubkisaas.ubki_mock_server',
+                                     description='Локальный сервер, имитирующий API УБКИ')
+    parser.add_argument('--host', default='127.0.0.1', help='адрес сервера')
+    parser.add_argument('--port', type=int, default=8080, help='порт сервера')
+    add_server_arguments(parser)
+    args = parser.parse_args(argv)
+
+    server = create_server(args, args.host, args.port)
+    print("Сервер УБКИ запущен: %s" % server.url, file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+    print("Запросов: %(auth)d авторизаций, %(xml)d отчетов, ошибок 503: %(server_errors)d, "
+          "ошибок сессии: %(session_errors)d" % server.get_stats(), file=sys.stderr)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,20 +1,29 @@
-from .ubki_credit_report import get_useful_credit_report_fields
-from .ubki_credit_score import get_useful_credit_score_fields
+from .ubki_stream import REPORT_FIELD_GROUPS, SCORE_FIELD_GROUPS, TIME_FIELDS
+from .ubki_features import FeaturePlan, compile_features
+from .ubki_credit_report import CREDIT_REPORT_FIELDS
+from .ubki_credit_score import CREDIT_SCORE_FIELDS
+from .ubki_timeline import get_deltatime
+from .ubki_metrics import measure
 
 from datetime import datetime
-from typing import List
+from typing import List, Optional, Union
+import numpy as np
+import zlib
 
-import xmltodict
+# Признаки, которые есть и в кредитном отчете, и в кредитном балле. По умолчанию они, как в исходном
+# объединении {**отчет, **балл}, берутся из кредитного балла, в котором не заполняются (None)
+SHARED_FIELDS = [key for key in CREDIT_SCORE_FIELDS if key in CREDIT_REPORT_FIELDS]
 
 class UbkiReport():
     """ Класс отчет УБКИ
 
     Parameters
     ----------
-    xml_credit_report : str
-        Кредитный отчет физической особы, предпринимателя
+    xml_credit_report : str | bytes | CompressedXml
+        Кредитный отчет физической особы, предпринимателя (bytes - xml в utf-8,
+        CompressedXml - xml, сжатый compress_xml)
         
-    xml_credit_score : str
+    xml_credit_score : str | bytes | CompressedXml
         Кредитный балл 
 
     phone : str
@@ -22,11 +31,72 @@ class UbkiReport():
 
     email : str
         Электронная почта
+
+    compact : bool = False
+        Компактный режим для хранения многих отчетов в памяти: xml хранятся сжатыми (zlib)
+        и распаковываются при обращении, разобранные документы не запоминаются
+
+    Notes
+    -----
+    Каждый xml разбирается не более одного раза, при первом обращении к его признакам.
+    Признаки вычисляются и запоминаются по группам (блокам comp), поэтому группы,
+    все признаки которых попали в fields_to_ignore, не вычисляются. При первом разборе
+    собираются блоки всех зарегистрированных признаков, поэтому вызовы с другими
+    fields_to_ignore не разбирают xml повторно (в компактном режиме собираются только
+    блоки нужных признаков, см. compile_features). Пользовательские признаки (register_feature)
+    добавляются после встроенных. Признаки SHARED_FIELDS (давность контактов и ubki_week_queries)
+    по умолчанию берутся из кредитного балла, как и раньше, а с shared_from_report=True - из
+    кредитного отчета. Для признаков, зависящих от даты расчета (TIME_FIELDS), запоминаются даты
+    первого упоминания контакта, поэтому признаки на любую дату (our_date) вычисляются без
+    повторного разбора.
+    Отчет, полученный потоково (from_scanners), может не хранить xml: тогда признаки
+    вычисляются по уже разобранным документам.
     """
-    def __init__(self, xml_credit_report:str, xml_credit_score:str, phone:str, email:str):
+    __slots__ = ('xml', 'phone', 'email', 'compact', '_scanners', '_fields', '_features', '_first_dates')
+
+    def __init__(self, xml_credit_report:Union[str, bytes], xml_credit_score:Union[str, bytes], phone:str, email:str,
+                 compact:bool = False):
         self.xml = {'report': xml_credit_report, 'score': xml_credit_score}
         self.phone = phone
         self.email = email
+        self.compact = False
+        self._scanners = {}                     # Разобранные документы
+        self._fields = {'report': {}, 'score': {}}  # Вычисленные признаки по группам
+        self._features = None                   # Итоговые признаки отчета без xml (keep_features_only)
+        self._first_dates = None                # Даты первого упоминания контакта для отчета без xml
+        if compact:
+            self.compress()
+
+    @classmethod
+    def from_scanners(cls, report_scanner, score_scanner, phone:str, email:str,
+                      xml_credit_report:Optional[Union[str, bytes]] = None,
+                      xml_credit_score:Optional[Union[str, bytes]] = None) -> 'UbkiReport':
+        """ Метод создания отчета по уже разобранным документам (например, при потоковом получении)
+
+        Parameters
+        ----------
+        report_scanner : CreditReportScanner
+            Сканер, разобравший кредитный отчет
+
+        score_scanner : CreditScoreScanner
+            Сканер, разобравший кредитный балл
+
+        phone, email : str
+            Телефон и электронная почта
+
+        xml_credit_report, xml_credit_score : str = None
+            Xml документов, если они сохранены. Без них методы, которым нужен xml, вызывают ValueError,
+            а признаки, блоки которых сканеры не собрали, недоступны
+
+        Returns
+        -------
+        ubki report : UbkiReport
+        """
+        report = cls(xml_credit_report, xml_credit_score, phone, email)
+        if xml_credit_report is None or xml_credit_score is None:
+            report.xml = None
+        report._scanners = {'report': report_scanner, 'score': score_scanner}
+        return report
 
     def get_report_xml(self) -> str:
         """ Метод получения кредитного отчета физической особы, предпринимателя
@@ -35,7 +105,7 @@ class UbkiReport():
         -------
         ubki report : Кредитный отчет физической особы, предпринимателя
         """
-        return self.xml['report']
+        return self._get_xml('report')
     def get_score_xml(self) -> str:
         """ Метод получения кредитный балл
 
@@ -43,9 +113,44 @@ class UbkiReport():
         -------
         ubki report : Кредитний бал
         """
-        return self.xml['score']
+        return self._get_xml('score')
 
-    def get_useful_ubki_fields(self, fields_to_ignore: List[str] = []) -> dict:
+    def compress(self):
+        """ Метод перевода отчета в компактный режим: xml сжимаются, разобранные документы удаляются.
+        Уже вычисленные признаки сохраняются
+        """
+        if self.xml is not None: # Без xml разобранные документы - единственный источник признаков
+            self.xml = {name: compress_xml(xml) for name, xml in self.xml.items()}
+            self._scanners = {}
+        self.compact = True
+
+    def keep_features_only(self, fields_to_ignore: List[str] = []):
+        """ Метод вычисления признаков и удаления xml и промежуточных данных. После вызова
+        get_useful_ubki_fields возвращает вычисленные признаки, а методы, которым нужен xml, вызывают ValueError
+
+        Parameters
+        ----------
+        fields_to_ignore : List[str] = []
+            Список не нужных параметров, которые не будут вычислены и сохранены
+        """
+        self._features, self._first_dates = self._export_features(fields_to_ignore)
+        self.xml = None
+        self._scanners = {}
+        self._fields = None
+
+    def _export_features(self, fields_to_ignore: List[str] = []) -> tuple:
+        """ Метод получения признаков и дат первого упоминания контакта для хранения без xml """
+        report = self._get_fields('report', compile_features(fields_to_ignore))
+        first_dates = {key: report[key] for key in TIME_FIELDS if key in report}
+        return self._get_features(fields_to_ignore), first_dates
+
+    def has_xml(self) -> bool:
+        """ Метод проверки, хранит ли отчет xml (False после keep_features_only)
+        """
+        return self.xml is not None
+
+    def get_useful_ubki_fields(self, fields_to_ignore: List[str] = [], our_date: Optional[datetime] = None,
+                               shared_from_report: bool = False) -> dict:
         """ Метод получения полезных полей из УБКИ отчета
 
         Parameters
@@ -53,12 +158,159 @@ class UbkiReport():
         fields_to_ignore : List[str] = []
             Список не нужных параметров, который следует исключить из итогового набора
 
+        our_date : datetime = None
+            Дата расчета признаков, зависящих от даты (TIME_FIELDS), по умолчанию текущая.
+            Используется только с shared_from_report=True
+
+        shared_from_report : bool = False
+            Брать признаки SHARED_FIELDS из кредитного отчета. По умолчанию они, как и раньше,
+            берутся из кредитного балла и равны None
+
         Returns
         -------
         useful ubki fields : Словарь полезных параметром для скоринга
         """
-        ubki = {
-                **get_useful_credit_report_fields(xmltodict.parse(self.xml['report']), self.phone, self.email, datetime.now()),
-                **get_useful_credit_score_fields(xmltodict.parse(self.xml['score']))
-                }
-        return {key: ubki[key] for key in ubki if not key in fields_to_ignore}
\ No newline at end of file
+        ubki = self._get_features(fields_to_ignore, our_date)
+        if not shared_from_report:
+            for key in SHARED_FIELDS:
+                if key in ubki:
+                    ubki[key] = None
+        return ubki
+
+    def _get_features(self, fields_to_ignore: List[str] = [], our_date: Optional[datetime] = None) -> dict:
+        """ Метод получения признаков, в которых признаки SHARED_FIELDS вычислены по кредитному отчету
+        (признаки TIME_FIELDS - на дату our_date, по умолчанию текущую)
+        """
+        fields_to_ignore = set(fields_to_ignore)
+        our_date = datetime.now() if our_date is None else our_date
+        if self._features is not None:
+            features = {key: value for key, value in self._features.items() if key not in fields_to_ignore}
+            for key, first_date in (self._first_dates or {}).items():
+                if key in features:
+                    features[key] = get_deltatime(first_date, our_date)
+            return features
+        plan = compile_features(fields_to_ignore)
+        report = self._get_fields('report', plan)
+        score = self._get_fields('score', plan)
+        # Признаки, которые есть в обоих документах, берутся из кредитного отчета
+        ubki = {key: report.get(key) for key in CREDIT_REPORT_FIELDS}
+        for key in TIME_FIELDS: # Вместо признаков запомнены даты первого упоминания
+            if key in report:
+                ubki[key] = get_deltatime(report[key], our_date)
+        if 'req_credit' in report:
+            ubki['req_credit'] = report['req_credit']
+        for key in CREDIT_SCORE_FIELDS:
+            if key not in ubki:
+                ubki[key] = score.get(key)
+        for name, fields in (('report', report), ('score', score)):
+            for feature in plan.custom[name]:
+                ubki[feature.name] = fields.get(feature.name)
+        return {key: ubki[key] for key in ubki if not key in fields_to_ignore}
+
+    def get_credit_timelines(self) -> list:
+        """ Метод получения истории кредитных соглашений (блоки comp id=2) в виде массивов numpy
+
+        Returns
+        -------
+        timelines : Список CreditTimeline
+        """
+        return self._get_scanner('report').get_credit_timelines()
+
+    def get_contact_timelines(self) -> list:
+        """ Метод получения истории контактных данных (блоки comp id=10) в виде массивов numpy
+
+        Returns
+        -------
+        timelines : Список ContactTimeline
+        """
+        return self._get_scanner('report').get_contact_timelines()
+
+    def _get_xml(self, name: str) -> str:
+        if self.xml is None:
+            raise ValueError("xml отчета удален методом keep_features_only" if self._features is not None else
+                             "xml отчета не сохранен при потоковом получении (keep_xml = False)")
+        return decompress_xml(self.xml[name])
+
+    def _get_scanner(self, name: str, plan: Optional[FeaturePlan] = None):
+        """ Метод получения разобранного документа, xml разбирается только при первом обращении.
+        Запоминаемый документ собирает блоки всех зарегистрированных признаков, поэтому другие
+        fields_to_ignore не требуют повторного разбора (вычисляются признаки только нужных групп).
+        Повторный разбор нужен, только если после него зарегистрирован признак из несобранного блока.
+        В компактном режиме документ не запоминается и собираются только блоки признаков plan
+        """
+        plan = compile_features() if plan is None else plan
+        scanner = self._scanners.get(name)
+        if scanner is None or not plan.covers(scanner, name):
+            scanner = (plan if self.compact else compile_features()).create_scanner(name)
+            xml = self._get_xml(name)
+            with measure('ubki.parse.duration', {'document': name}):
+                scanner.feed(xml).close()
+            if not self.compact:
+                self._scanners[name] = scanner
+        return scanner
+
+    def _get_fields(self, name: str, plan: FeaturePlan) -> dict:
+        """ Метод получения признаков документа из групп, нужных хотя бы одному признаку plan
+        (пользовательский признак - отдельная группа с его именем).
+        Недостающие группы вычисляются за один вызов и запоминаются. Вместо признаков TIME_FIELDS
+        запоминаются даты первого упоминания контакта ("%Y-%m-%d" или None)
+        """
+        field_groups = REPORT_FIELD_GROUPS if name == 'report' else SCORE_FIELD_GROUPS
+        cache = self._fields[name]
+        custom = {feature.name for feature in plan.custom[name]}
+        groups = plan.groups[name] | custom
+        missing = groups - set(cache)
+        if missing:
+            scanner = self._get_scanner(name, plan)
+            if name == 'score':
+                fields = scanner.get_fields(missing - custom) if missing - custom else {}
+            elif missing - custom:
+                fields = {key: None for key in CREDIT_REPORT_FIELDS}
+                first_dates = scanner.fill_static_fields(fields, self.phone, self.email, missing - custom)
+                for key in TIME_FIELDS:
+                    first_date = first_dates.get(key)
+                    fields[key] = None if first_date is None or np.isnat(first_date) else str(first_date)
+            else:
+                fields = {}
+            plan.fill_custom(name, scanner, fields, self.phone, self.email, missing & custom)
+            for group in missing:
+                cache[group] = {group: fields.get(group)} if group in custom else \
+                    {key: fields[key] for key in fields if field_groups.get(key) == group}
+        return {key: value for group in groups for key, value in cache[group].items()}
+
+class CompressedXml(bytes):
+    """ Xml, сжатый compress_xml (zlib). Обычные bytes в UbkiReport и функциях модуля - несжатый xml в utf-8
+    """
+    __slots__ = ()
+
+def compress_xml(xml: Union[str, bytes]) -> CompressedXml:
+    """ Функция сжатия xml (zlib). Уже сжатый xml (CompressedXml) возвращается без изменений
+
+    Parameters
+    ----------
+    xml : str | bytes | CompressedXml
+        Xml (bytes - в utf-8) или сжатый xml
+
+    Returns
+    -------
+    compressed xml : Сжатый xml
+    """
+    if isinstance(xml, CompressedXml):
+        return xml
+    return CompressedXml(zlib.compress(xml if isinstance(xml, bytes) else xml.encode('utf-8')))
+
+def decompress_xml(xml: Union[str, bytes]) -> str:
+    """ Функция распаковки xml, сжатого compress_xml. Несжатый xml возвращается строкой
+
+    Parameters
+    ----------
+    xml : str | bytes | CompressedXml
+        Сжатый xml или xml (bytes - в utf-8)
+
+    Returns
+    -------
+    xml : Xml
+    """
+    if isinstance(xml, CompressedXml):
+        return zlib.decompress(xml).decode('utf-8')
+    return xml.decode('utf-8') if isinstance(xml, bytes) else xml
@@ -0,0 +1,228 @@
+from collections import OrderedDict
+from typing import Optional
+import threading
+import tempfile
+import hashlib
+import json
+import gzip
+import zlib
+import time
+import os
+
+# Поля данных о персоне, по которым определяется, что запрос уже выполнялся
+CACHE_KEY_FIELDS = ('okpo', 'dtype', 'dser', 'dnom')
+
+CACHE_FILE_SUFFIX = '.xml.gz'
+
+class ReportCache():
+    """ Дисковый кэш сырых ответов УБКИ (xml отчетов).
+    Каждый ответ хранится в отдельном сжатом gzip файле, запись файла атомарная, поэтому
+    один каталог можно использовать из нескольких процессов. Время записи хранится в mtime
+    файла (по нему считается ttl), время последнего обращения - в atime (по нему вытесняются
+    давно не использованные ответы, когда общий размер превышает max_size).
+
+    Parameters
+    ----------
+    directory : str
+        Каталог кэша, создается при необходимости
+
+    ttl : float = 24 * 3600
+        Время жизни ответа в секундах
+
+    max_size : int = 512 * 1024 * 1024
+        Максимальный общий размер сжатых файлов в байтах
+
+    compresslevel : int = 6
+        Уровень сжатия gzip
+
+    Attributes
+    ----------
+    hits : int
+        Количество попаданий в кэш
+
+    misses : int
+        Количество промахов (в том числе устаревших ответов)
+
+    evictions : int
+        Количество вытесненных ответов
+    """
+    def __init__(self, directory:str, ttl:float = 24 * 3600, max_size:int = 512 * 1024 * 1024, compresslevel:int = 6):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_size = max_size
+        self.compresslevel = compresslevel
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries = None # OrderedDict ключ -> размер файла, от давно использованных к недавним
+        self._size = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, key:str) -> Optional[str]:
+        """ Метод получения ответа из кэша
+
+        Parameters
+        ----------
+        key : str
+            Ключ ответа (см. get_cache_key)
+
+        Returns
+        -------
+        response : Текст ответа или None, если его нет или он устарел
+        """
+        path = self._get_path(key)
+        now = time.time()
+        try:
+            created = os.stat(path).st_mtime
+            if created + self.ttl <= now:
+                self._remove(key)
+                return self._miss()
+            with open(path, 'rb') as file:
+                response = gzip.decompress(file.read()).decode('utf-8')
+            os.utime(path, (now, created)) # Отмечаем обращение, сохраняя время записи
+        except (OSError, EOFError, zlib.error): # Нет файла, его удалил другой процесс или он поврежден
+            return self._miss()
+        with self._lock:
+            self.hits += 1
+            if self._entries is not None and key in self._entries:
+                self._entries.move_to_end(key)
+        return response
+
+    def put(self, key:str, response:str):
+        """ Метод сохранения ответа в кэш с вытеснением давно использованных ответов
+
+        Parameters
+        ----------
+        key : str
+            Ключ ответа (см. get_cache_key)
+
+        response : str
+            Текст ответа
+        """
+        data = gzip.compress(response.encode('utf-8'), compresslevel=self.compresslevel)
+        if len(data) > self.max_size:
+            return
+        with tempfile.NamedTemporaryFile('wb', dir=self.directory, delete=False, suffix='.tmp') as file:
+            file.write(data)
+        os.replace(file.name, self._get_path(key))
+        with self._lock:
+            entries = self._get_entries()
+            self._size += len(data) - entries.pop(key, 0)
+            entries[key] = len(data)
+            if self._size > self.max_size:
+                self._evict()
+
+    def clear(self):
+        """ Метод удаления всех ответов из кэша
+        """
+        with self._lock:
+            for key in list(self._scan()):
+                self._unlink(key)
+            self._entries = OrderedDict()
+            self._size = 0
+
+    def get_stats(self) -> dict:
+        """ Метод получения счетчиков кэша
+
+        Returns
+        -------
+        stats : Словарь с количеством попаданий, промахов, вытесненных ответов, ответов в кэше и их размером
+        """
+        with self._lock:
+            entries = self._get_entries()
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'entries': len(entries), 'size': self._size}
+
+    def _miss(self) -> None:
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _remove(self, key:str):
+        with self._lock:
+            self._unlink(key)
+            if self._entries is not None:
+                self._size -= self._entries.pop(key, 0)
+
+    def _evict(self):
+        # Каталог могли пополнить другие процессы, поэтому перед вытеснением читаем его заново
+        self._entries = self._scan()
+        self._size = sum(self._entries.values())
+        while self._size > self.max_size and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._unlink(key)
+            self._size -= size
+            self.evictions += 1
+
+    def _get_entries(self) -> OrderedDict:
+        if self._entries is None:
+            self._entries = self._scan()
+            self._size = sum(self._entries.values())
+        return self._entries
+
+    def _scan(self) -> OrderedDict:
+        files = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(CACHE_FILE_SUFFIX):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    files.append((stat.st_atime, entry.name[:-len(CACHE_FILE_SUFFIX)], stat.st_size))
+        files.sort()
+        return OrderedDict((key, size) for _, key, size in files)
+
+    def _unlink(self, key:str):
+        try:
+            os.remove(self._get_path(key))
+        except FileNotFoundError:
+            pass
+
+    def _get_path(self, key:str) -> str:
+        return os.path.join(self.directory, key + CACHE_FILE_SUFFIX)
+
+def get_cache_key(is_test:bool, reqtype:int, data:dict, base_url:Optional[str] = None) -> str:
+    """ Функция получения ключа кэша по идентифицирующим полям персоны
+
+    Parameters
+    ----------
+    is_test : bool
+        Логическое выражения для опрделения запросов на тестовый сервер или оригинальный
+
+    reqtype : int
+        Номер шаблона отчета убки
+
+    data : dict
+        Данные о искомой персоне
+
+    base_url : str = None
+        Свой базовый адрес API: ответы другого сервера кэшируются отдельно
+
+    Returns
+    -------
+    key : Хэш sha256 режима подключения (или адреса сервера), шаблона отчета и полей CACHE_KEY_FIELDS
+    """
+    server = base_url.rstrip('/') if base_url else "test" if is_test else "real"
+    fields = [server, str(reqtype)] + [str(data.get(k, '')).strip().upper() for k in CACHE_KEY_FIELDS]
+    return hashlib.sha256(json.dumps(fields, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+def is_cacheable(response_text:str, status:int) -> bool:
+    """ Функция проверки, можно ли сохранить ответ УБКИ в кэш. Сохраняются только успешные (2xx) ответы
+    с документом ubkidata без ошибки УБКИ: страницы ошибок прокси и сервера не сохраняются
+
+    Parameters
+    ----------
+    response_text : str
+        Ответ УБКИ (достаточно начала ответа)
+
+    status : int
+        Код http ответа
+
+    Returns
+    -------
+    is cacheable : True, если ответ можно сохранить
+    """
+    head = response_text[:2048].lower()
+    return 200 <= status < 300 and '<ubkidata' in head and '<error' not in head
@@ -0,0 +1,112 @@
+from .ubki_report import UbkiReport, CompressedXml, compress_xml, decompress_xml
+from .ubki_features import get_features_version
+
+from typing import Iterable, Iterator, List
+import struct
+import json
+
+# Заголовок файла отчетов и заголовок каждой записи: длины метаданных, сжатого отчета и сжатого балла
+REPORT_FILE_MAGIC = b'UBKIREP1'
+RECORD_HEADER = struct.Struct('<III')
+
+def save_reports(reports: Iterable[UbkiReport], path: str) -> int:
+    """ Функция сохранения отчетов в один бинарный файл.
+    Сохраняются сжатые xml (если они есть), телефон, почта и уже вычисленные признаки,
+    поэтому отчеты только с признаками (keep_features_only) и потоковые отчеты без xml тоже сохраняются. Отчеты
+    записываются по одному, весь набор в памяти не нужен. Вычисленные признаки отчетов с xml сохраняются вместе
+    с версией реестра признаков (get_features_version) и при чтении с другой версией вычисляются заново.
+
+    Parameters
+    ----------
+    reports : Iterable[UbkiReport]
+        Отчеты (в том числе генератор)
+
+    path : str
+        Путь к файлу
+
+    Returns
+    -------
+    count : Количество сохраненных отчетов
+    """
+    count = 0
+    version = get_features_version()
+    with open(path, 'wb') as file:
+        file.write(REPORT_FILE_MAGIC)
+        for report in reports:
+            if report.has_xml():
+                meta = {'phone': report.phone, 'email': report.email, 'fields': report._fields,
+                        'fields_version': version}
+            else: # Отчет без xml (в том числе полученный потоково) сохраняется только с признаками
+                features, first_dates = (report._features, report._first_dates) if report._features is not None \
+                    else report._export_features()
+                meta = {'phone': report.phone, 'email': report.email, 'features': features,
+                        'first_dates': first_dates}
+            meta = json.dumps(meta, ensure_ascii=False).encode('utf-8')
+            xml = [compress_xml(report.xml[name]) for name in ('report', 'score')] if report.has_xml() else [b'', b'']
+            file.write(RECORD_HEADER.pack(len(meta), len(xml[0]), len(xml[1])))
+            file.write(meta)
+            file.write(xml[0])
+            file.write(xml[1])
+            count += 1
+    return count
+
+def iter_reports(path: str, compact: bool = True) -> Iterator[UbkiReport]:
+    """ Функция последовательного чтения отчетов из файла, сохраненного save_reports
+
+    Parameters
+    ----------
+    path : str
+        Путь к файлу
+
+    compact : bool = True
+        Создавать отчеты в компактном режиме (xml остаются сжатыми)
+
+    Returns
+    -------
+    reports : Генератор отчетов UbkiReport
+    """
+    version = get_features_version()
+    with open(path, 'rb') as file:
+        if file.read(len(REPORT_FILE_MAGIC)) != REPORT_FILE_MAGIC:
+            raise ValueError("Файл %s не является файлом отчетов УБКИ" % path)
+        while True:
+            header = file.read(RECORD_HEADER.size)
+            if not header:
+                return
+            if len(header) != RECORD_HEADER.size:
+                raise ValueError("Файл %s поврежден" % path)
+            meta_size, report_size, score_size = RECORD_HEADER.unpack(header)
+            meta, report_xml, score_xml = file.read(meta_size), file.read(report_size), file.read(score_size)
+            if len(meta) + len(report_xml) + len(score_xml) != meta_size + report_size + score_size:
+                raise ValueError("Файл %s поврежден" % path)
+            meta = json.loads(meta.decode('utf-8'))
+            if 'features' in meta: # Отчет только с признаками
+                report = UbkiReport(None, None, meta['phone'], meta['email'])
+                report.xml, report._fields, report._features = None, None, meta['features']
+                report._first_dates = meta.get('first_dates')
+            else:
+                report_xml, score_xml = CompressedXml(report_xml), CompressedXml(score_xml)
+                if not compact:
+                    report_xml, score_xml = decompress_xml(report_xml), decompress_xml(score_xml)
+                report = UbkiReport(report_xml, score_xml, meta['phone'], meta['email'], compact=compact)
+                # Запомненные признаки восстанавливаются, только если реестр признаков не изменился
+                if meta.get('fields_version') == version:
+                    report._fields = meta['fields']
+            yield report
+
+def load_reports(path: str, compact: bool = True) -> List[UbkiReport]:
+    """ Функция загрузки всех отчетов из файла, сохраненного save_reports
+
+    Parameters
+    ----------
+    path : str
+        Путь к файлу
+
+    compact : bool = True
+        Создавать отчеты в компактном режиме (xml остаются сжатыми)
+
+    Returns
+    -------
+    reports : Список отчетов UbkiReport
+    """
+    return list(iter_reports(path, compact))
@@ -1,13 +1,40 @@
-from dotenv import dotenv_values, load_dotenv, set_key, find_dotenv
 from .ubki_report import UbkiReport
+from .ubki_features import compile_features
+from .ubki_stream import StreamedResponse, RESPONSE_HEAD_SIZE
+from .ubki_transport import UbkiTransport
+from .ubki_session_store import SessionStore
+from .ubki_report_cache import ReportCache, get_cache_key, is_cacheable
+from .ubki_single_flight import SingleFlight
+from .ubki_scheduler import RequestScheduler, PRIORITIES
+from .ubki_hedging import RequestHedger
+from .ubki_metrics import measure, get_metrics_sink
 
 from datetime import datetime
 from ast import literal_eval
-from typing import Optional
-import requests
-import pickle
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Optional, Iterable, Iterator, Tuple, Union
+import logging
 import json
-import os
+import time
+
+logger = logging.getLogger(__name__)
+
+UBKI_TEST_URL = "https://test.ubki.ua/b2_api_xml/ubki"
+UBKI_REAL_URL = "https://secure.ubki.ua/b2_api_xml/ubki"
+AUTH_HEADERS = {'Content-Type': 'application/json', 'Accept': 'application/json'}
+
+# Документ, который возвращает каждый шаблон отчета
+REQTYPE_DOCUMENTS = {10: 'report', 11: 'score'}
+
+# Фрагменты текста ошибки УБКИ, по которым ответ считается отказом из-за недействительного сессионого ключа
+SESSION_ERROR_MARKERS = ('sessid', 'session', 'сесі', 'сесси')
+
+# Тестовая персона, данные о которой отдает тестовый сервер УБКИ
+TEST_PERSON_DATA = \
+    {"okpo":"2111118724", 
+    "lname":"РИБАЧКА", "fname":"АННА", "mname":"ІГОРЕВНА", "bdate":"1957-10-19", 
+    "dtype":"1", "dser":"ВВ", "dnom":"142228", 
+    "cval":"+380111656411", "ctype":"3", 'email':"email@gmail.com", 'reqidout':'00001'}
 
 class UbkiRequest ():
     """ Класс инициализатор подключения к УБКИ.
@@ -24,29 +51,91 @@ class UbkiRequest ():
     
     is_test : bool = False
         Логическое выражения для опрделения запросов на тестовый сервер или оригинальный
+
+    transport : UbkiTransport = None
+        Транспорт с пулом соединений, таймаутами и повторами, по умолчанию UbkiTransport()
+
+    session_store : SessionStore = None
+        Хранилище сессионных ключей, общее для процессов, по умолчанию SessionStore()
+
+    cache : ReportCache = None
+        Дисковый кэш ответов УБКИ. При попадании отчет возвращается без обращения к сети,
+        по умолчанию кэш не используется
+
+    single_flight : SingleFlight = None
+        Объединение одновременных запросов одного шаблона отчета об одной персоне (по тем же
+        полям, что и ключ кэша) в один http запрос, по умолчанию SingleFlight()
+
+    scheduler : RequestScheduler = None
+        Планировщик с ограничением скорости запросов к адресам 'auth' и 'xml' и классами приоритета,
+        по умолчанию запросы не ограничиваются
+
+    base_url : str = None
+        Базовый адрес API (например, локального MockUbkiServer), к которому добавляются /auth и /xml,
+        по умолчанию адрес тестового или оригинального сервера УБКИ
+
+    hedger : RequestHedger = None
+        Дублирование запросов отчетов, не ответивших за перцентиль обычной задержки,
+        по умолчанию запросы не дублируются
+
+    stream : bool = False
+        Потоковый режим: части ответа разбираются по мере получения, текст ответа целиком не собирается,
+        а UbkiReport создается по разобранным документам
+
+    keep_xml : bool = False
+        Сохранять xml ответов в отчетах потокового режима (с кэшем ответы сохраняются для кэша всегда)
     """
-    def __init__ (self, login:str, password:str, is_test:Optional[bool] = False):
+    def __init__ (self, login:str, password:str, is_test:Optional[bool] = False,
+                  transport:Optional[UbkiTransport] = None, session_store:Optional[SessionStore] = None,
+                  cache:Optional[ReportCache] = None, single_flight:Optional[SingleFlight] = None,
+                  scheduler:Optional[RequestScheduler] = None, base_url:Optional[str] = None,
+                  hedger:Optional[RequestHedger] = None, stream:bool = False, keep_xml:bool = False):
         self.is_test = is_test
-        if is_test:
-            self.ubki_url = "https://test.ubki.ua/b2_api_xml/ubki/xml"
-        else: 
-            self.ubki_url = "https://secure.ubki.ua/b2_api_xml/ubki/xml"
+        self.base_url = base_url
+        self.transport = transport or UbkiTransport()
+        self.session_store = session_store or SessionStore()
+        self.cache = cache
+        self.single_flight = single_flight or SingleFlight()
+        self.scheduler = scheduler
+        self.hedger = hedger
+        self.stream = stream
+        self.keep_xml = keep_xml
+        self.ubki_url = get_ubki_url(is_test, base_url) + "/xml"
+        self._login = login
+        self._password = password
+        self.sessid = self.get_sessid()
 
-        config = self.get_keys()
-        pref = "test" if is_test else "real"
-        
-        last_key = datetime.strptime(config[pref + '_last_key'],'%Y-%m-%d')
-        now = datetime.now().date()
-        # print(pref + '_last_key')
-        # print(last_key)
-        if last_key.date() == now:
-            self.sessid = config[pref + '_key']
-        else:
-            self.sessid = self.ubki_authorization(login, password)
-            config[pref + "_last_key"] = now.strftime('%Y-%m-%d')
-            config[pref + "_key"] = self.sessid
-            self.save_keys(config)
-            print("Успешная Авторизация!!!")
+    def get_sessid(self, rejected:Optional[str] = None) -> str:
+        """ Метод получения действующего сессионого ключа из хранилища, при необходимости с авторизацией
+
+        Parameters
+        ----------
+        rejected : str = None
+            Сессионный ключ, отклоненный УБКИ
+
+        Returns
+        -------
+        sessid : Сессионный ключ
+        """
+        return self.session_store.get_sessid(get_store_key(self.is_test, self._login, self.base_url), self._authorize, rejected)
+
+    def _authorize(self) -> str:
+        sessid = self.ubki_authorization(self._login, self._password)
+        logger.info("Успешная Авторизация!!!")
+        return sessid
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        """ Метод закрытия всех соединений транспорта
+        """
+        if self.hedger is not None:
+            self.hedger.close()
+        self.transport.close()
 
     def ubki_authorization(self, login: str, password: str) -> str:
         """ Метод авторизации и получения сессионого ключа
@@ -63,24 +152,13 @@ class UbkiRequest ():
         -------
         sessid : Сессионный ключ
         """
-        if self.is_test:
-            url = "https://test.ubki.ua/b2_api_xml/ubki/auth"
-        else:
-            url = "https://secure.ubki.ua/b2_api_xml/ubki/auth"
-        request_text = json.dumps(
-        {
-            "doc": {
-                "auth": {
-                    "login": login,
-                    "pass": password
-                }
-            }
-        })
-        headers = {'Content-Type': 'application/json', 'Accept': 'application/json'}
-        response = requests.request("POST", url, headers=headers, data=request_text)
-        return literal_eval(response.text)['doc']['auth']['sessid']
+        url = get_ubki_url(self.is_test, self.base_url) + "/auth"
+        self._acquire('auth')
+        with measure('ubki.auth.duration'):
+            return get_sessid(self.transport.post(url, get_auth_request_text(login, password), headers=AUTH_HEADERS))
 
-    def get_person_credit_report(self, person_data:Optional[dict] = None) -> UbkiReport:
+    def get_person_credit_report(self, person_data:Optional[dict] = None, priority:str = PRIORITIES[0],
+                                 deadline:Optional[float] = None) -> UbkiReport:
         """ Метод получения отчета убки об интересующей персоне
 
         Parameters
@@ -88,24 +166,72 @@ class UbkiRequest ():
         person_data : dict = None
             Словарь с необходимыми данными о искомой персоне
 
+        priority : str = 'interactive'
+            Класс приоритета запросов в планировщике (см. RequestScheduler)
+
+        deadline : float = None
+            Время в секундах, за которое нужен отчет. Если планировщик не успеет разрешить запрос,
+            вызывается RequestDropped без обращения к УБКИ
+
         Returns
         -------
         ubki report : Отчет с получеными данными о искомой персоне
         """
-        if person_data != None and not self.is_test:
-            data = person_data
-        elif person_data == None and self.is_test:
-            data = \
-            {"okpo":"2111118724", 
-            "lname":"РИБАЧКА", "fname":"АННА", "mname":"ІГОРЕВНА", "bdate":"1957-10-19", 
-            "dtype":"1", "dser":"ВВ", "dnom":"142228", 
-            "cval":"+380111656411", "ctype":"3", 'email':"email@gmail.com", 'reqidout':'00001'}
-        else:
-            raise Exception("ERROR, mode mismatch!!")
-        return UbkiReport(self._request(10, data), self._request(11, data), data['cval'], data['email'])
+        data = get_person_data(person_data, self.is_test)
+        deadline = None if deadline is None else time.monotonic() + deadline
+        report, score = self._request(10, data, priority, deadline), self._request(11, data, priority, deadline)
+        if self.stream:
+            return get_streamed_report(report, score, data, self.keep_xml)
+        return UbkiReport(report, score, data['cval'], data['email'])
+
+    def get_person_credit_reports(self, persons:Iterable[dict], concurrency:int = 8, priority:str = PRIORITIES[-1]
+                                  ) -> Iterator[Tuple[str, Union[UbkiReport, Exception]]]:
+        """ Метод массового получения отчетов убки о списке персон.
+        Запросы выполняются параллельно, но одновременно не более concurrency запросов, а персоны
+        берутся из persons по мере освобождения мест, поэтому расход памяти не зависит от размера входа.
+
+        Parameters
+        ----------
+        persons : Iterable[dict]
+            Последовательность (в том числе генератор) словарей с данными о искомых персонах
+
+        concurrency : int = 8
+            Максимальное количество одновременно обрабатываемых персон
 
-    def _request(self, reqtype:int, data:dict) -> str:
-        """ Метод отправки запроса на получения убки отчета о искомой персоне
+        priority : str = 'batch'
+            Класс приоритета запросов в планировщике (см. RequestScheduler)
+
+        Returns
+        -------
+        reports : Генератор пар (reqidout, отчет или исключение) в порядке завершения запросов.
+            Ошибка по одной персоне не прерывает обработку остальных
+        """
+        persons = iter(persons)
+        executor = ThreadPoolExecutor(max_workers=concurrency)
+        running = {}
+        try:
+            while True:
+                for person_data in persons:
+                    future = executor.submit(self.get_person_credit_report, person_data, priority)
+                    running[future] = person_data.get('reqidout')
+                    if len(running) >= concurrency:
+                        break
+                if not running:
+                    return
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    reqidout = running.pop(future)
+                    error = future.exception()
+                    yield reqidout, (future.result() if error is None else error)
+        finally:
+            for future in running:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def _request(self, reqtype:int, data:dict, priority:str = PRIORITIES[0], deadline:Optional[float] = None
+                 ) -> Union[str, StreamedResponse]:
+        """ Метод отправки запроса на получения убки отчета о искомой персоне.
+        Одновременные запросы того же шаблона о той же персоне объединяются в один
 
         Parameters
         ----------
@@ -115,52 +241,259 @@ class UbkiRequest ():
         data : dict
             Данные о искомой персоне, необходимые для запроса
 
+        priority : str = 'interactive'
+            Класс приоритета запроса в планировщике
+
+        deadline : float = None
+            Крайний срок по часам time.monotonic()
+
         Returns
         -------
-        response : Отчет убки полученный по запросу на искомою персону
-        """
-        request_text =  "<?xml version=\"1.0\" encoding=\"utf-8\" ?>"\
-        "<doc>"\
-            f"<ubki sessid=\"{self.sessid}\">"\
-                "<req_envelope descr=\"Конверт запиту\">"\
-                    "<req_xml descr=\"Об'єкт запиту\">"\
-                         f"<request version=\"1.0\" reqtype=\"{reqtype}\" reqreason=\"2\" "\
-                                                   f"reqdate=\"{datetime.now().strftime('%Y-%m-%d')}\" "\
-                                                   f"reqidout=\"{data['reqidout']}\" reqsource=\"1\">"\
-                            "<i reqlng=\"1\">"\
-                                f"<ident okpo=\"{data['okpo']}\" lname=\"{data['lname']}\" "\
-                                    f"fname=\"{data['fname']}\" mname=\"{data['mname']}\" bdate=\"{data['bdate']}\" />"\
-                                f"<spd inn=\"{data['okpo']}\" />"\
-                                "<docs>"\
-                                    f"<doc dtype=\"{data['dtype']}\" dser=\"{data['dser']}\" dnom=\"{data['dnom']}\" />"\
-                                "</docs>"\
-                                "<contacts>"\
-                                    f"<cont cval=\"{data['cval']}\" ctype=\"{data['ctype']}\" />"\
-                                "</contacts>"\
-                            "</i>"\
-                        "</request>"\
-                    "</req_xml>"\
-                "</req_envelope>"\
-            "</ubki>"\
-        "</doc>"
-        return requests.request("POST", self.ubki_url, data=request_text.encode('utf-8')).text
-
-    def get_keys(self) -> dict:
-        """ 
-        Метод подключения к .env и получения необходимых переменных среды, для работы
+        response : Отчет убки полученный по запросу на искомою персону (в потоковом режиме - StreamedResponse)
         """
-        if not os.path.exists('keys'): # Создание .env файла в случае отсуствия оного
-            keys = {"test_key":"", "real_key":"", "test_last_key":"2000-01-01", "real_last_key":"2000-01-01"}
-            with open('keys', 'wb') as file:
-                pickle.dump(keys, file)
+        key = get_cache_key(self.is_test, reqtype, data, self.base_url)
+        return self.single_flight.do(key, lambda: self._fetch(reqtype, data, key, priority, deadline))
+
+    def _acquire(self, endpoint:str, priority:str = PRIORITIES[0], deadline:Optional[float] = None):
+        if self.scheduler is not None:
+            self.scheduler.acquire(endpoint, priority, deadline)
+
+    def _create_response(self, reqtype:int) -> StreamedResponse:
+        document = REQTYPE_DOCUMENTS[reqtype]
+        return StreamedResponse(compile_features().create_scanner(document), self.keep_xml or self.cache is not None,
+                                document)
+
+    def _post(self, reqtype:int, sessid:str, data:dict, priority:str, deadline:Optional[float]
+              ) -> Tuple[int, Union[str, StreamedResponse]]:
+        body = get_report_request_text(sessid, reqtype, data).encode('utf-8')
+        if self.stream:
+            def send():
+                response = self.transport.post_stream(self.ubki_url, body, lambda: self._create_response(reqtype))
+                return response.status, response
         else:
-            with open('keys', 'rb') as file:
-                keys = pickle.load(file)
-        return keys
+            send = lambda: self.transport.post_response(self.ubki_url, body)
+        self._acquire('xml', priority, deadline)
+        if self.hedger is None:
+            return send()
+
+        def hedge(): # Дубликат расходует квоту планировщика с самым низким приоритетом
+            if self.scheduler is not None:
+                self.scheduler.acquire('xml', self.scheduler.priorities[-1], deadline)
+            return send()
+        return self.hedger.do(reqtype, send, hedge)
+
+    def _fetch(self, reqtype:int, data:dict, key:str, priority:str = PRIORITIES[0],
+               deadline:Optional[float] = None) -> Union[str, StreamedResponse]:
+        if self.cache is not None:
+            response = self.cache.get(key)
+            if response is not None:
+                return self._create_response(reqtype).feed_text(response) if self.stream else response
+        tags = {'reqtype': reqtype}
+        with measure('ubki.request.duration', tags):
+            sessid = self.sessid
+            status, response = self._post(reqtype, sessid, data, priority, deadline)
+            # Ключ истек или отозван: обновляем его и повторяем запрос один раз
+            if is_session_error(get_response_head(response)):
+                get_metrics_sink().increment('ubki.request.session_retry', 1, tags)
+                self.sessid = sessid = self.get_sessid(rejected=sessid)
+                status, response = self._post(reqtype, sessid, data, priority, deadline)
+        size = len(response) if isinstance(response, str) else response.size
+        get_metrics_sink().observe('ubki.response.size', size, tags)
+        if self.cache is not None and is_cacheable(get_response_head(response), status):
+            self.cache.put(key, response if isinstance(response, str) else response.get_xml())
+        return response
+
+def get_ubki_url(is_test:bool, base_url:Optional[str] = None) -> str:
+    """ Функция получения адреса API УБКИ
+
+    Parameters
+    ----------
+    is_test : bool
+        Логическое выражения для опрделения запросов на тестовый сервер или оригинальный
+
+    base_url : str = None
+        Свой базовый адрес API, заменяющий адрес сервера УБКИ
+
+    Returns
+    -------
+    url : Базовый адрес API, к которому добавляется /auth или /xml
+    """
+    if base_url:
+        return base_url.rstrip('/')
+    return UBKI_TEST_URL if is_test else UBKI_REAL_URL
+
+def get_auth_request_text(login: str, password: str) -> str:
+    """ Функция формирования тела запроса авторизации
+
+    Parameters
+    ----------
+    login : str
+        Логин партнера для авторизации
     
-    def save_keys(self, keys:dict):
-        """ 
-        """
-        with open('keys', 'wb') as file:
-            pickle.dump(keys, file)
-        return keys
\ No newline at end of file
+    password : str
+        Пароль партнера для авторизации
+
+    Returns
+    -------
+    request text : JSON запроса авторизации
+    """
+    return json.dumps(
+    {
+        "doc": {
+            "auth": {
+                "login": login,
+                "pass": password
+            }
+        }
+    })
+
+def get_sessid(response_text: str) -> str:
+    """ Функция получения сессионого ключа из ответа на запрос авторизации
+
+    Parameters
+    ----------
+    response_text : str
+        Ответ УБКИ на запрос авторизации
+
+    Returns
+    -------
+    sessid : Сессионный ключ
+    """
+    return literal_eval(response_text)['doc']['auth']['sessid']
+
+def get_person_data(person_data:Optional[dict], is_test:bool) -> dict:
+    """ Функция выбора данных о искомой персоне с учетом режима подключения.
+    Без данных о персоне в тестовом режиме запрашивается тестовая персона TEST_PERSON_DATA
+
+    Parameters
+    ----------
+    person_data : dict
+        Словарь с необходимыми данными о искомой персоне
+
+    is_test : bool
+        Логическое выражения для опрделения запросов на тестовый сервер или оригинальный
+
+    Returns
+    -------
+    person data : Данные, с которыми будет выполнен запрос
+    """
+    if person_data != None:
+        return person_data
+    elif is_test:
+        return TEST_PERSON_DATA
+    raise Exception("ERROR, mode mismatch!!")
+
+def get_report_request_text(sessid:str, reqtype:int, data:dict) -> str:
+    """ Функция формирования xml запроса на получения убки отчета о искомой персоне
+
+    Parameters
+    ----------
+    sessid : str
+        Сессионный ключ
+
+    reqtype : int
+        Номер шаблона отчета убки, который требуется получить
+
+    data : dict
+        Данные о искомой персоне, необходимые для запроса
+
+    Returns
+    -------
+    request text : Текст xml запроса
+    """
+    return "<?xml version=\"1.0\" encoding=\"utf-8\" ?>"\
+    "<doc>"\
+        f"<ubki sessid=\"{sessid}\">"\
+            "<req_envelope descr=\"Конверт запиту\">"\
+                "<req_xml descr=\"Об'єкт запиту\">"\
+                     f"<request version=\"1.0\" reqtype=\"{reqtype}\" reqreason=\"2\" "\
+                                               f"reqdate=\"{datetime.now().strftime('%Y-%m-%d')}\" "\
+                                               f"reqidout=\"{data['reqidout']}\" reqsource=\"1\">"\
+                        "<i reqlng=\"1\">"\
+                            f"<ident okpo=\"{data['okpo']}\" lname=\"{data['lname']}\" "\
+                                f"fname=\"{data['fname']}\" mname=\"{data['mname']}\" bdate=\"{data['bdate']}\" />"\
+                            f"<spd inn=\"{data['okpo']}\" />"\
+                            "<docs>"\
+                                f"<doc dtype=\"{data['dtype']}\" dser=\"{data['dser']}\" dnom=\"{data['dnom']}\" />"\
+                            "</docs>"\
+                            "<contacts>"\
+                                f"<cont cval=\"{data['cval']}\" ctype=\"{data['ctype']}\" />"\
+                            "</contacts>"\
+                        "</i>"\
+                    "</request>"\
+                "</req_xml>"\
+            "</req_envelope>"\
+        "</ubki>"\
+    "</doc>"
+
+def get_store_key(is_test:bool, login:str, base_url:Optional[str] = None) -> str:
+    """ Функция получения ключа хранилища сессионных ключей
+
+    Parameters
+    ----------
+    is_test : bool
+        Логическое выражения для опрделения запросов на тестовый сервер или оригинальный
+
+    login : str
+        Логин партнера
+
+    base_url : str = None
+        Свой базовый адрес API: ключи другого сервера хранятся отдельно
+
+    Returns
+    -------
+    key : Ключ хранилища
+    """
+    if base_url:
+        return base_url.rstrip('/') + ":" + login
+    return ("test" if is_test else "real") + ":" + login
+
+def get_response_head(response:Union[str, StreamedResponse]) -> str:
+    """ Функция получения начала ответа УБКИ, по которому определяются ошибки
+
+    Parameters
+    ----------
+    response : str | StreamedResponse
+        Ответ УБКИ или приемник потокового ответа
+
+    Returns
+    -------
+    head : Начало ответа
+    """
+    return response[:RESPONSE_HEAD_SIZE] if isinstance(response, str) else response.get_head()
+
+def get_streamed_report(report:StreamedResponse, score:StreamedResponse, data:dict, keep_xml:bool) -> UbkiReport:
+    """ Функция создания UbkiReport по потоковым ответам
+
+    Parameters
+    ----------
+    report, score : StreamedResponse
+        Ответы reqtype 10 и 11
+
+    data : dict
+        Данные о искомой персоне
+
+    keep_xml : bool
+        Сохранить xml ответов в отчете
+
+    Returns
+    -------
+    ubki report : Отчет по разобранным документам
+    """
+    return UbkiReport.from_scanners(report.scanner, score.scanner, data['cval'], data['email'],
+                                    report.get_xml() if keep_xml else None, score.get_xml() if keep_xml else None)
+
+def is_session_error(response_text:str) -> bool:
+    """ Функция проверки, является ли ответ УБКИ отказом из-за недействительного сессионого ключа
+
+    Parameters
+    ----------
+    response_text : str
+        Ответ УБКИ
+
+    Returns
+    -------
+    is session error : True, если в ответе есть ошибка, связанная с сессией
+    """
+    head = response_text[:RESPONSE_HEAD_SIZE].lower()
+    return '<error' in head and any(marker in head for marker in SESSION_ERROR_MARKERS)
\ No newline at end of file
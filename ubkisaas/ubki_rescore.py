@@ -0,0 +1,431 @@
+""" Пересчет признаков по архиву xml ответов УБКИ в несколько процессов.
+
+Запуск (после установки пакета):
+    ubki-rescore archive/ reports-2023.tar.gz -o features.csv --date 2024-01-01 --contacts contacts.csv
+    ubki-rescore archive/ -o features.npz --resume
+
+Входные данные - каталоги, tar (в том числе сжатые) и zip архивы с парами файлов
+<ключ>_report.xml (кредитный отчет) и <ключ>_score.xml (кредитный балл).
+"""
+from .ubki_stream import REPORT_FIELD_GROUPS
+from .ubki_features import compile_features, get_features
+from .ubki_batch import BATCH_FIELDS
+from .ubki_report import SHARED_FIELDS
+
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
+from typing import Iterable, Iterator, List, Optional, Tuple
+import numpy as np
+import argparse
+import tarfile
+import zipfile
+import zlib
+import shutil
+import posixpath
+import mmap
+import json
+import csv
+import sys
+import os
+
+try:
+    import lzma
+except ImportError: # Python без поддержки xz: такие архивы tarfile не откроет
+    lzma = None
+
+REPORT_SUFFIX = '_report.xml'
+SCORE_SUFFIX = '_score.xml'
+
+# Ошибки чтения поврежденного или обрезанного архива (в том числе потока сжатия)
+_ARCHIVE_ERRORS = (tarfile.TarError, zipfile.BadZipFile, EOFError, OSError, zlib.error) + \
+    ((lzma.LZMAError,) if lzma is not None else ())
+
+# Открытые в процессе-обработчике архивы: путь -> mmap (tar без сжатия) или ZipFile
+_archives = {}
+
+def find_pairs(inputs: Iterable[str], report_suffix: str = REPORT_SUFFIX, score_suffix: str = SCORE_SUFFIX
+               ) -> Iterator[Tuple[str, tuple, tuple]]:
+    """ Функция поиска пар (кредитный отчет, кредитный балл) в каталогах и архивах.
+    Пара - файлы с одинаковым путем без суффикса, ключ пары - этот путь относительно каталога или
+    корня архива (с разделителем '/'), поэтому одноименные файлы в разных подкаталогах не смешиваются.
+    Файлы без пары пропускаются с предупреждением в stderr, повторяющийся ключ, а также поврежденный
+    или обрезанный архив - ошибка ValueError.
+
+    Parameters
+    ----------
+    inputs : Iterable[str]
+        Каталоги и архивы (.tar, .tar.gz, .tgz, .tar.bz2, .tar.xz, .zip)
+
+    report_suffix : str = REPORT_SUFFIX
+        Суффикс файлов кредитного отчета
+
+    score_suffix : str = SCORE_SUFFIX
+        Суффикс файлов кредитного балла
+
+    Returns
+    -------
+    pairs : Генератор (ключ, источник отчета, источник балла). Источник - описание, по которому
+        обработчик читает xml (путь к файлу, смещение в tar, имя в zip или сами данные)
+    """
+    keys = set()
+    for path in inputs:
+        pending = {}
+        for name, source in _list_sources(path):
+            for suffix, index in ((report_suffix, 0), (score_suffix, 1)):
+                if name.endswith(suffix):
+                    stem = posixpath.normpath(name[:-len(suffix)].replace(os.sep, '/')).lstrip('/')
+                    pair = pending.setdefault(stem, [None, None])
+                    if stem in keys or pair[index] is not None:
+                        raise ValueError("Повторяющийся ключ пары %s в %s" % (stem, path))
+                    pair[index] = source
+                    if pair[0] is not None and pair[1] is not None:
+                        del pending[stem]
+                        keys.add(stem)
+                        yield stem, pair[0], pair[1]
+                    break
+        for stem in pending:
+            print("Нет пары для %s в %s" % (stem, path), file=sys.stderr)
+
+def _list_sources(path: str) -> Iterator[Tuple[str, tuple]]:
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                full = os.path.join(root, name)
+                yield os.path.relpath(full, path), ('file', full)
+        return
+    if not os.path.isfile(path):
+        raise ValueError("Вход %s не найден" % path)
+    try:
+        if zipfile.is_zipfile(path):
+            with zipfile.ZipFile(path) as archive:
+                for name in archive.namelist():
+                    yield name, ('zip', path, name)
+            return
+        try: # tar без сжатия: обработчик читает файлы прямо из отображения архива в память
+            archive = tarfile.open(path, 'r:')
+        except tarfile.ReadError: # Сжатый tar читается только последовательно
+            archive = None
+        if archive is not None:
+            size = os.path.getsize(path)
+            with archive:
+                for member in archive:
+                    if member.isfile():
+                        if member.offset_data + member.size > size:
+                            raise EOFError("файл %s обрезан" % member.name)
+                        yield member.name, ('slice', path, member.offset_data, member.size)
+            return
+        try:
+            archive = tarfile.open(path, 'r:*')
+        except tarfile.ReadError:
+            raise ValueError("Вход %s не является каталогом, tar или zip архивом, либо архив поврежден" % path) from None
+        with archive:
+            for member in archive:
+                if member.isfile():
+                    yield member.name, ('bytes', archive.extractfile(member).read())
+    except _ARCHIVE_ERRORS as error:
+        raise ValueError("Архив %s поврежден или обрезан (%s: %s)" % (path, type(error).__name__, error)) from None
+
+def _read_source(source: tuple):
+    kind = source[0]
+    if kind == 'bytes':
+        return source[1]
+    if kind == 'zip':
+        archive = _archives.get(source[1])
+        if archive is None:
+            archive = _archives[source[1]] = zipfile.ZipFile(source[1])
+        return archive.read(source[2])
+    if kind == 'slice':
+        data = _archives.get(source[1])
+        if data is None:
+            with open(source[1], 'rb') as file:
+                data = _archives[source[1]] = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        return memoryview(data)[source[2]:source[2] + source[3]]
+    with open(source[1], 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+def get_pair_fields(report_xml, score_xml, phone: str, email: str, our_date: datetime, fields: List[str],
+                    shared_from_report: bool = False) -> list:
+    """ Функция получения значений признаков пары xml в порядке fields (как UbkiReport.get_useful_ubki_fields)
+
+    Parameters
+    ----------
+    report_xml, score_xml : str | bytes | буфер
+        Кредитный отчет и кредитный балл
+
+    phone, email : str
+        Телефон и почта персоны
+
+    our_date : datetime
+        Дата, относительно которой считаются разницы дат
+
+    fields : List[str]
+        Нужные признаки из BATCH_FIELDS
+
+    shared_from_report : bool = False
+        Брать признаки SHARED_FIELDS из кредитного отчета, по умолчанию из кредитного балла
+
+    Returns
+    -------
+    values : Список значений признаков (None для отсутствующих)
+    """
+    plan = compile_features([f.name for f in get_features() if f.name not in fields])
+    report_groups, score_groups = plan.groups['report'], plan.groups['score']
+    report = plan.create_scanner('report').feed(report_xml).close().get_fields(phone, email, our_date, report_groups) \
+        if report_groups else {}
+    score = plan.create_scanner('score').feed(score_xml).close().get_fields(score_groups) if score_groups else {}
+    return [report.get(k) if k in REPORT_FIELD_GROUPS and (shared_from_report or k not in SHARED_FIELDS)
+            else score.get(k) for k in fields]
+
+def _score_chunk(chunk: list, fields: List[str], our_date: datetime, shared_from_report: bool = False) -> list:
+    rows = []
+    for key, report_source, score_source, phone, email in chunk:
+        report_xml = score_xml = None
+        try:
+            report_xml, score_xml = _read_source(report_source), _read_source(score_source)
+            rows.append((key, get_pair_fields(report_xml, score_xml, phone, email, our_date, fields,
+                                                   shared_from_report), None))
+        except Exception as error:
+            rows.append((key, None, '%s: %s' % (type(error).__name__, error)))
+        finally:
+            for data in (report_xml, score_xml):
+                if isinstance(data, mmap.mmap):
+                    data.close()
+    return rows
+
+class _CsvWriter():
+    """ Запись строк признаков в csv по мере готовности. При продолжении дописывает файл,
+    отбрасывая недописанную последнюю строку
+    """
+    def __init__(self, path: str, fields: List[str], resume: bool):
+        self.done = set()
+        header = ['key'] + fields
+        if resume and os.path.exists(path) and os.path.getsize(path) > 0:
+            _truncate_partial_line(path)
+            with open(path, 'r', newline='', encoding='utf-8') as file:
+                reader = csv.reader(file)
+                if next(reader, None) != header:
+                    raise ValueError("Столбцы %s не совпадают с текущими признаками" % path)
+                self.done = {row[0] for row in reader if row}
+            self.file = open(path, 'a', newline='', encoding='utf-8')
+            self.writer = csv.writer(self.file)
+        else:
+            self.file = open(path, 'w', newline='', encoding='utf-8')
+            self.writer = csv.writer(self.file)
+            self.writer.writerow(header)
+
+    def write(self, key: str, values: list):
+        self.writer.writerow([key] + ['' if v is None else v for v in values])
+
+    def flush(self):
+        self.file.flush()
+
+    def abort(self):
+        self.file.close()
+
+    def close(self):
+        self.file.close()
+
+class _NpzWriter():
+    """ Запись строк признаков в npz (keys, fields, values). Строки по мере готовности дописываются
+    во временный каталог <path>.parts, из которого npz собирается в конце без загрузки значений в память
+    """
+    def __init__(self, path: str, fields: List[str], resume: bool):
+        self.path = path
+        self.fields = fields
+        self.parts = path + '.parts'
+        self.row_size = 8 * len(fields)
+        self.done = set()
+        if resume and os.path.isdir(self.parts):
+            with open(os.path.join(self.parts, 'fields.json'), 'r') as file:
+                if json.load(file) != fields:
+                    raise ValueError("Признаки %s не совпадают с текущими" % self.parts)
+            keys_path = os.path.join(self.parts, 'keys.txt')
+            _truncate_partial_line(keys_path)
+            with open(keys_path, 'r', encoding='utf-8') as file:
+                keys = file.read().splitlines()
+            rows = min(len(keys), os.path.getsize(os.path.join(self.parts, 'values.bin')) // max(self.row_size, 1)) \
+                if self.row_size else len(keys)
+            keys = keys[:rows]
+            with open(keys_path, 'w', encoding='utf-8') as file:
+                file.writelines(key + '\n' for key in keys)
+            os.truncate(os.path.join(self.parts, 'values.bin'), rows * self.row_size)
+            self.done = set(keys)
+        else:
+            shutil.rmtree(self.parts, ignore_errors=True)
+            os.makedirs(self.parts)
+            with open(os.path.join(self.parts, 'fields.json'), 'w') as file:
+                json.dump(fields, file)
+            open(os.path.join(self.parts, 'keys.txt'), 'w').close()
+            open(os.path.join(self.parts, 'values.bin'), 'wb').close()
+        self.keys = open(os.path.join(self.parts, 'keys.txt'), 'a', encoding='utf-8')
+        self.values = open(os.path.join(self.parts, 'values.bin'), 'ab')
+
+    def write(self, key: str, values: list):
+        self.values.write(np.array([np.nan if v is None else v for v in values], dtype='<f8').tobytes())
+        self.keys.write(key + '\n')
+
+    def flush(self):
+        self.values.flush()
+        self.keys.flush()
+
+    def abort(self):
+        """ Метод закрытия без сборки npz: записанные строки остаются в <path>.parts для продолжения """
+        self.values.close()
+        self.keys.close()
+
+    def close(self):
+        self.abort()
+        with open(os.path.join(self.parts, 'keys.txt'), 'r', encoding='utf-8') as file:
+            keys = file.read().splitlines()
+        with zipfile.ZipFile(self.path, 'w', allowZip64=True) as archive:
+            with archive.open('values.npy', 'w', force_zip64=True) as member, \
+                    open(os.path.join(self.parts, 'values.bin'), 'rb') as values:
+                np.lib.format.write_array_header_1_0(
+                    member, {'descr': '<f8', 'fortran_order': False, 'shape': (len(keys), len(self.fields))})
+                shutil.copyfileobj(values, member, 1 << 20)
+            for name, array in (('keys', np.array(keys, dtype=str)), ('fields', np.array(self.fields, dtype=str))):
+                with archive.open(name + '.npy', 'w') as member:
+                    np.lib.format.write_array(member, array)
+        shutil.rmtree(self.parts)
+
+def _truncate_partial_line(path: str):
+    with open(path, 'rb+') as file:
+        data = file.read()
+        end = data.rfind(b'\n') + 1
+        if end != len(data):
+            file.truncate(end)
+
+def _read_contacts(path: Optional[str]) -> dict:
+    if path is None:
+        return {}
+    with open(path, 'r', newline='', encoding='utf-8') as file:
+        return {row['key']: (row.get('phone') or '', row.get('email') or '') for row in csv.DictReader(file)}
+
+def _iter_chunks(pairs: Iterator[tuple], contacts: dict, done: set, chunk_size: int, stats: dict) -> Iterator[list]:
+    chunk = []
+    for key, report_source, score_source in pairs:
+        if key in done:
+            stats['skipped'] += 1
+            continue
+        phone, email = contacts.get(key, ('', ''))
+        chunk.append((key, report_source, score_source, phone, email))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def rescore(inputs: List[str], output: str, fields: Optional[List[str]] = None, our_date: Optional[datetime] = None,
+            contacts: Optional[dict] = None, workers: Optional[int] = None, chunk_size: int = 64, resume: bool = False,
+            report_suffix: str = REPORT_SUFFIX, score_suffix: str = SCORE_SUFFIX, shared_from_report: bool = False
+            ) -> dict:
+    """ Функция пересчета признаков всех пар xml из каталогов и архивов в csv или npz файл.
+    Пары делятся на порции по chunk_size, порции обрабатываются пулом процессов, а готовые строки
+    сразу дописываются в файл, поэтому прерванный запуск можно продолжить (resume).
+
+    Parameters
+    ----------
+    inputs : List[str]
+        Каталоги и архивы с парами xml (см. find_pairs)
+
+    output : str
+        Файл результата, формат по расширению: .csv или .npz
+
+    fields : List[str] = None
+        Признаки из BATCH_FIELDS, по умолчанию все
+
+    our_date : datetime = None
+        Дата, относительно которой считаются разницы дат, по умолчанию текущая
+
+    contacts : dict = None
+        Ключ пары -> (телефон, почта) для признаков истории контактов
+
+    workers : int = None
+        Количество процессов, по умолчанию количество процессоров
+
+    chunk_size : int = 64
+        Количество пар в одной порции
+
+    resume : bool = False
+        Продолжить прерванный запуск: пары, уже записанные в output, пропускаются
+
+    report_suffix, score_suffix : str
+        Суффиксы файлов кредитного отчета и кредитного балла
+
+    shared_from_report : bool = False
+        Брать признаки SHARED_FIELDS из кредитного отчета (см. get_pair_fields)
+
+    Returns
+    -------
+    stats : Словарь с количеством обработанных, пропущенных (готовых ранее) пар и ошибок
+    """
+    fields = list(BATCH_FIELDS) if fields is None else fields
+    our_date = datetime.now() if our_date is None else our_date
+    writer = (_NpzWriter if output.endswith('.npz') else _CsvWriter)(output, fields, resume)
+    stats = {'processed': 0, 'skipped': 0, 'errors': 0}
+    pairs = find_pairs(inputs, report_suffix, score_suffix)
+    chunks = _iter_chunks(pairs, contacts or {}, writer.done, chunk_size, stats)
+    workers = workers or os.cpu_count() or 1
+    executor = ProcessPoolExecutor(max_workers=workers)
+    window = 2 * workers # Порций в работе: процессы не простаивают, а пары не читаются наперед целиком
+    running = set()
+    try:
+        while True:
+            for chunk in chunks:
+                running.add(executor.submit(_score_chunk, chunk, fields, our_date, shared_from_report))
+                if len(running) >= window:
+                    break
+            if not running:
+                break
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                for key, values, error in future.result():
+                    if error is None:
+                        writer.write(key, values)
+                        stats['processed'] += 1
+                    else:
+                        print("%s: %s" % (key, error), file=sys.stderr)
+                        stats['errors'] += 1
+            writer.flush()
+    except BaseException:
+        for future in running:
+            future.cancel()
+        writer.abort()
+        raise
+    finally:
+        executor.shutdown(wait=True)
+    writer.close()
+    return stats
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog='ubki-rescore', description='Пересчет признаков по архиву xml ответов УБКИ')
+    parser.add_argument('inputs', nargs='+', help='каталоги и tar/zip архивы с парами xml')
+    parser.add_argument('-o', '--output', required=True, help='файл результата (.csv или .npz)')
+    parser.add_argument('--date', help='дата расчета YYYY-MM-DD (по умолчанию текущая)')
+    parser.add_argument('--contacts', help='csv со столбцами key, phone, email')
+    parser.add_argument('--ignore', nargs='+', default=[], help='не вычислять эти признаки')
+    parser.add_argument('--workers', type=int, help='количество процессов')
+    parser.add_argument('--chunk-size', type=int, default=64, help='количество пар в порции')
+    parser.add_argument('--resume', action='store_true', help='продолжить прерванный запуск')
+    parser.add_argument('--report-suffix', default=REPORT_SUFFIX, help='суффикс файлов кредитного отчета')
+    parser.add_argument('--score-suffix', default=SCORE_SUFFIX, help='суффикс файлов кредитного балла')
+    parser.add_argument('--shared-from-report', action='store_true',
+                        help='брать давность контактов и ubki_week_queries из кредитного отчета')
+    args = parser.parse_args(argv)
+
+    try:
+        stats = rescore(args.inputs, args.output, [k for k in BATCH_FIELDS if k not in args.ignore],
+                        datetime.strptime(args.date, '%Y-%m-%d') if args.date else None,
+                        _read_contacts(args.contacts), args.workers, args.chunk_size, args.resume,
+                        args.report_suffix, args.score_suffix, args.shared_from_report)
+    except ValueError as error: # Повторяющийся ключ, поврежденный архив, несовпадение столбцов при --resume
+        print("ubki-rescore: %s" % error, file=sys.stderr)
+        return 2
+    print("Обработано: %(processed)d, пропущено готовых: %(skipped)d, ошибок: %(errors)d" % stats, file=sys.stderr)
+    return 1 if stats['errors'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
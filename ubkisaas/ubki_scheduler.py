@@ -0,0 +1,231 @@
+from .ubki_metrics import get_metrics_sink
+
+from typing import Dict, Optional, Sequence, Tuple, Union
+from collections import deque
+import threading
+import asyncio
+import time
+
+# Классы приоритета по умолчанию: интерактивные решения по кредитам важнее ночных пакетных загрузок
+PRIORITIES = ('interactive', 'batch')
+
+class RequestDropped(Exception):
+    """ Запрос отклонен планировщиком без обращения к УБКИ
+
+    Attributes
+    ----------
+    reason : str
+        'queue_full' - очередь класса приоритета заполнена, 'deadline' - токен не успеет освободиться до крайнего срока
+    """
+    def __init__(self, reason:str, endpoint:str, priority:str):
+        super().__init__("Запрос к %s (%s) отклонен: %s" % (endpoint, priority, reason))
+        self.reason = reason
+        self.endpoint = endpoint
+        self.priority = priority
+
+class TokenBucket():
+    """ Ведро токенов: в среднем не более rate запросов в секунду, но не более burst подряд
+
+    Parameters
+    ----------
+    rate : float
+        Скорость пополнения, токенов в секунду
+
+    burst : float = None
+        Емкость ведра, по умолчанию max(1, rate)
+    """
+    def __init__(self, rate:float, burst:Optional[float] = None):
+        self.rate = rate
+        self.burst = max(1.0, rate) if burst is None else burst
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def get_delay(self, now:float, tokens:float = 1) -> float:
+        """ Метод получения времени в секундах, через которое в ведре будет tokens токенов (0 - уже есть) """
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return max(0.0, (tokens - self.tokens) / self.rate)
+
+    def take(self):
+        """ Метод забора одного токена (после get_delay, вернувшего 0) """
+        self.tokens -= 1
+
+class _Endpoint():
+    def __init__(self, bucket:TokenBucket, priorities:Sequence[str]):
+        self.bucket = bucket
+        self.queues = {priority: deque() for priority in priorities}
+
+class _SchedulerBase():
+    def __init__(self, rates:Optional[Dict[str, Union[float, Tuple[float, float]]]] = None, max_queue:int = 1000,
+                 priorities:Sequence[str] = PRIORITIES):
+        self.priorities = tuple(priorities)
+        self.max_queue = max_queue
+        self.granted = 0
+        self.dropped = 0
+        self._endpoints = {}
+        for endpoint, rate in (rates or {}).items():
+            rate, burst = rate if isinstance(rate, tuple) else (rate, None)
+            self._endpoints[endpoint] = _Endpoint(TokenBucket(rate, burst), self.priorities)
+
+    def _enqueue(self, endpoint:str, priority:str) -> Tuple[Optional[_Endpoint], Optional[object]]:
+        if priority not in self.priorities:
+            raise ValueError("Неизвестный класс приоритета %s, ожидается один из %s" % (priority, self.priorities))
+        state = self._endpoints.get(endpoint)
+        if state is None: # Для адреса нет ограничения скорости
+            return None, None
+        queue = state.queues[priority]
+        if len(queue) >= self.max_queue:
+            self._drop('queue_full', endpoint, priority)
+        waiter = object()
+        queue.append(waiter)
+        sink = get_metrics_sink()
+        if sink.enabled:
+            sink.observe('ubki.scheduler.queue_depth', len(queue), {'endpoint': endpoint, 'priority': priority})
+        return state, waiter
+
+    def _poll(self, state:_Endpoint, endpoint:str, priority:str, waiter:object, deadline:Optional[float]
+              ) -> Tuple[bool, Optional[float]]:
+        """ Шаг ожидания: (получен ли токен, сколько ждать до следующей проверки; None - до изменения очереди).
+        Токен получает только первый в очереди высшего из ожидающих классов приоритета
+        """
+        now = time.monotonic()
+        ahead = 0
+        for name in self.priorities:
+            queue = state.queues[name]
+            if name == priority:
+                ahead += queue.index(waiter)
+                break
+            ahead += len(queue)
+        delay = state.bucket.get_delay(now, ahead + 1)
+        if ahead == 0 and delay <= 0:
+            state.bucket.take()
+            self.granted += 1
+            return True, None
+        if deadline is not None and now + delay > deadline: # Токен не успеет освободиться: не ждем зря
+            self._drop('deadline', endpoint, priority)
+        return False, delay if ahead == 0 else (None if deadline is None else deadline - now)
+
+    def _drop(self, reason:str, endpoint:str, priority:str):
+        self.dropped += 1
+        get_metrics_sink().increment('ubki.scheduler.dropped', 1, {'endpoint': endpoint, 'priority': priority,
+                                                                    'reason': reason})
+        raise RequestDropped(reason, endpoint, priority)
+
+    def _record_wait(self, endpoint:str, priority:str, start:float):
+        sink = get_metrics_sink()
+        if sink.enabled:
+            sink.timing('ubki.scheduler.wait', time.monotonic() - start, {'endpoint': endpoint, 'priority': priority})
+
+    def get_stats(self) -> dict:
+        """ Метод получения состояния планировщика
+
+        Returns
+        -------
+        stats : Словарь с количеством выданных токенов, отклоненных запросов и глубиной очередей
+            (адрес -> класс приоритета -> количество ожидающих)
+        """
+        return {'granted': self.granted, 'dropped': self.dropped,
+                'queued': {endpoint: {name: len(queue) for name, queue in state.queues.items()}
+                           for endpoint, state in self._endpoints.items()}}
+
+class RequestScheduler(_SchedulerBase):
+    """ Планировщик запросов к УБКИ для потоков: ограничение скорости ведром токенов для каждого адреса,
+    классы приоритета, ограниченные очереди и отказ по крайнему сроку.
+    Пока ждет запрос более важного класса, запросы менее важных классов токены не получают.
+
+    Parameters
+    ----------
+    rates : Dict[str, float | Tuple[float, float]] = None
+        Адрес -> скорость в запросах в секунду или (скорость, емкость ведра). UbkiRequest использует
+        адреса 'auth' (авторизация) и 'xml' (отчеты). Адреса без скорости не ограничиваются
+
+    max_queue : int = 1000
+        Максимальное количество ожидающих запросов одного адреса и класса приоритета,
+        при переполнении запрос сразу отклоняется (RequestDropped с reason='queue_full')
+
+    priorities : Sequence[str] = PRIORITIES
+        Классы приоритета от самого важного к наименее важному
+
+    Examples
+    --------
+    >> scheduler = RequestScheduler({'xml': (5, 10), 'auth': 1})
+    >> connect = UbkiRequest("login", "password", scheduler = scheduler)
+    >> connect.get_person_credit_report(data, priority = 'interactive', deadline = 3.0)
+    """
+    def __init__(self, rates:Optional[Dict[str, Union[float, Tuple[float, float]]]] = None, max_queue:int = 1000,
+                 priorities:Sequence[str] = PRIORITIES):
+        super().__init__(rates, max_queue, priorities)
+        self._condition = threading.Condition()
+
+    def acquire(self, endpoint:str, priority:str = PRIORITIES[0], deadline:Optional[float] = None):
+        """ Метод ожидания разрешения на запрос
+
+        Parameters
+        ----------
+        endpoint : str
+            Адрес запроса
+
+        priority : str = 'interactive'
+            Класс приоритета
+
+        deadline : float = None
+            Крайний срок по часам time.monotonic(), после которого ответ уже не нужен. Запрос отклоняется
+            (RequestDropped с reason='deadline'), как только становится ясно, что токен не успеет освободиться
+        """
+        start = time.monotonic()
+        with self._condition:
+            state, waiter = self._enqueue(endpoint, priority)
+            if state is None:
+                return
+            try:
+                while True:
+                    granted, timeout = self._poll(state, endpoint, priority, waiter, deadline)
+                    if granted:
+                        break
+                    self._condition.wait(timeout)
+            finally:
+                state.queues[priority].remove(waiter)
+                self._condition.notify_all()
+        self._record_wait(endpoint, priority, start)
+
+    def get_stats(self) -> dict:
+        with self._condition:
+            return super().get_stats()
+
+class AsyncRequestScheduler(_SchedulerBase):
+    """ Асинхронный аналог RequestScheduler для AsyncUbkiRequest (параметры те же)
+
+    Examples
+    --------
+    >> scheduler = AsyncRequestScheduler({'xml': (5, 10)})
+    >> async with AsyncUbkiRequest("login", "password", scheduler = scheduler) as connect:
+    >>     await connect.get_person_credit_report(data, priority = 'batch')
+    """
+    def __init__(self, rates:Optional[Dict[str, Union[float, Tuple[float, float]]]] = None, max_queue:int = 1000,
+                 priorities:Sequence[str] = PRIORITIES):
+        super().__init__(rates, max_queue, priorities)
+        self._changed = None
+
+    async def acquire(self, endpoint:str, priority:str = PRIORITIES[0], deadline:Optional[float] = None):
+        """ Метод ожидания разрешения на запрос (см. RequestScheduler.acquire) """
+        start = time.monotonic()
+        state, waiter = self._enqueue(endpoint, priority)
+        if state is None:
+            return
+        try:
+            while True:
+                granted, timeout = self._poll(state, endpoint, priority, waiter, deadline)
+                if granted:
+                    break
+                if self._changed is None:
+                    self._changed = asyncio.Event()
+                try:
+                    await asyncio.wait_for(self._changed.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            state.queues[priority].remove(waiter)
+            if self._changed is not None: # Очередь изменилась: ожидающие проверяют, не их ли очередь
+                self._changed.set()
+                self._changed = None
+        self._record_wait(endpoint, priority, start)
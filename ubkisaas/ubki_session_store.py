@@ -0,0 +1,170 @@
+from typing import Callable, Optional
+import threading
+import tempfile
+import json
+import time
+import os
+
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+    import msvcrt
+
+DEFAULT_STORE_PATH = os.environ.get("UBKI_SESSION_STORE", "ubki_keys.json")
+
+class SessionStore():
+    """ Хранилище сессионных ключей УБКИ, общее для потоков и процессов.
+    Ключи кэшируются в памяти и в json файле, запись файла атомарная (через временный файл и
+    os.replace), а авторизация выполняется под межпроцессной блокировкой, поэтому при
+    одновременном старте многих процессов новый ключ получает только один из них.
+
+    Parameters
+    ----------
+    path : str = DEFAULT_STORE_PATH
+        Путь к файлу хранилища (по умолчанию переменная среды UBKI_SESSION_STORE или ubki_keys.json).
+        Рядом создается файл блокировки path + '.lock'
+
+    ttl : float = 6 * 3600
+        Время жизни сессионого ключа в секундах
+    """
+    def __init__(self, path:str = DEFAULT_STORE_PATH, ttl:float = 6 * 3600):
+        self.path = path
+        self.ttl = ttl
+        self._tokens = {}
+        self._thread_lock = threading.Lock()
+
+    def get_sessid(self, key:str, authorize:Callable[[], str], rejected:Optional[str] = None) -> str:
+        """ Метод получения действующего сессионого ключа, при необходимости с авторизацией
+
+        Parameters
+        ----------
+        key : str
+            Ключ хранилища (режим подключения и логин)
+
+        authorize : Callable[[], str]
+            Функция авторизации, возвращающая новый сессионный ключ
+
+        rejected : str = None
+            Сессионный ключ, отклоненный УБКИ. Он не будет возвращен повторно
+
+        Returns
+        -------
+        sessid : Сессионный ключ
+        """
+        sessid = self.get_cached(key, rejected)
+        if sessid is not None:
+            return sessid
+        with self.lock():
+            sessid = self.get_cached(key, rejected) # Ключ мог обновить другой поток или процесс
+            if sessid is None:
+                sessid = authorize()
+                self.save(key, sessid)
+        return sessid
+
+    def get_cached(self, key:str, rejected:Optional[str] = None) -> Optional[str]:
+        """ Метод получения действующего сессионого ключа из памяти или файла без авторизации
+
+        Parameters
+        ----------
+        key : str
+            Ключ хранилища
+
+        rejected : str = None
+            Сессионный ключ, отклоненный УБКИ
+
+        Returns
+        -------
+        sessid : Сессионный ключ или None
+        """
+        token = self._tokens.get(key)
+        if not self._is_valid(token, rejected):
+            token = self._load().get(key)
+            if not self._is_valid(token, rejected):
+                self._tokens.pop(key, None)
+                return None
+            self._tokens[key] = token
+        return token['sessid']
+
+    def save(self, key:str, sessid:str):
+        """ Метод сохранения нового сессионого ключа. Вызывается под блокировкой lock()
+
+        Parameters
+        ----------
+        key : str
+            Ключ хранилища
+
+        sessid : str
+            Сессионный ключ
+        """
+        token = {'sessid': sessid, 'expires_at': time.time() + self.ttl}
+        self._tokens[key] = token
+        tokens = self._load()
+        tokens[key] = token
+        directory = os.path.dirname(os.path.abspath(self.path))
+        with tempfile.NamedTemporaryFile('w', dir=directory, delete=False, suffix='.tmp') as file:
+            json.dump(tokens, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(file.name, self.path)
+
+    def lock(self):
+        """ Метод получения блокировки хранилища (внутри процесса и между процессами)
+
+        Returns
+        -------
+        lock : Блокировка с методами acquire/release, поддерживает with
+        """
+        return _StoreLock(self.path + '.lock', self._thread_lock)
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path, 'r') as file:
+                return json.load(file)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    @staticmethod
+    def _is_valid(token:Optional[dict], rejected:Optional[str]) -> bool:
+        return token is not None and token['sessid'] != rejected and token['expires_at'] > time.time()
+
+class _StoreLock():
+    """ Блокировка файла хранилища: threading.Lock внутри процесса и flock (msvcrt.locking) между процессами """
+    def __init__(self, path:str, thread_lock:threading.Lock):
+        self.path = path
+        self.thread_lock = thread_lock
+        self.file = None
+
+    def acquire(self):
+        self.thread_lock.acquire()
+        try:
+            self.file = open(self.path, 'a+b')
+            if fcntl is not None:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+            else:
+                self.file.seek(0)
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_LOCK, 1)
+        except BaseException:
+            if self.file is not None:
+                self.file.close()
+            self.thread_lock.release()
+            raise
+
+    def release(self):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+            else:
+                self.file.seek(0)
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self.file.close()
+            self.file = None
+            self.thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
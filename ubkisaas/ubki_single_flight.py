@@ -0,0 +1,132 @@
+from typing import Any, Awaitable, Callable
+import threading
+import asyncio
+
+class SingleFlight():
+    """ Объединение одновременных одинаковых вызовов в потоках.
+    Пока вызов с ключом key выполняется, остальные вызовы с тем же ключом не запускают функцию,
+    а ждут и получают ее результат (или то же исключение).
+
+    Attributes
+    ----------
+    calls : int
+        Общее количество вызовов do
+
+    coalesced : int
+        Количество вызовов, получивших результат уже выполнявшегося вызова
+    """
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def do(self, key:str, function:Callable[[], Any]) -> Any:
+        """ Метод выполнения функции с объединением одновременных вызовов
+
+        Parameters
+        ----------
+        key : str
+            Ключ вызова, вызовы с одинаковым ключом объединяются
+
+        function : Callable[[], Any]
+            Функция без аргументов
+
+        Returns
+        -------
+        result : Результат функции
+        """
+        with self._lock:
+            self.calls += 1
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self.coalesced += 1
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            flight.result = function()
+        except BaseException as error:
+            flight.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.result
+
+    def get_stats(self) -> dict:
+        """ Метод получения счетчиков объединения вызовов
+
+        Returns
+        -------
+        stats : Словарь с общим количеством вызовов, количеством объединенных и выполняющихся сейчас
+        """
+        with self._lock:
+            return {'calls': self.calls, 'coalesced': self.coalesced, 'in_flight': len(self._flights)}
+
+class _Flight():
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class AsyncSingleFlight():
+    """ Объединение одновременных одинаковых вызовов в цикле событий asyncio.
+    Вызов выполняется отдельной задачей, поэтому отмена одного из ожидающих не отменяет его для остальных
+
+    Attributes
+    ----------
+    calls : int
+        Общее количество вызовов do
+
+    coalesced : int
+        Количество вызовов, получивших результат уже выполнявшегося вызова
+    """
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+        self._flights = {}
+
+    async def do(self, key:str, function:Callable[[], Awaitable[Any]]) -> Any:
+        """ Метод выполнения корутины с объединением одновременных вызовов
+
+        Parameters
+        ----------
+        key : str
+            Ключ вызова, вызовы с одинаковым ключом объединяются
+
+        function : Callable[[], Awaitable[Any]]
+            Функция без аргументов, возвращающая корутину
+
+        Returns
+        -------
+        result : Результат корутины
+        """
+        self.calls += 1
+        task = self._flights.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = self._flights[key] = asyncio.ensure_future(function())
+            task.add_done_callback(lambda _: self._release(key, task))
+        return await asyncio.shield(task)
+
+    def _release(self, key:str, task:asyncio.Future):
+        self._flights.pop(key, None)
+        if not task.cancelled():
+            task.exception() # Ошибка уже передана ожидающим, а если все они отменены, не попадает в лог asyncio
+
+    def get_stats(self) -> dict:
+        """ Метод получения счетчиков объединения вызовов
+
+        Returns
+        -------
+        stats : Словарь с общим количеством вызовов, количеством объединенных и выполняющихся сейчас
+        """
+        return {'calls': self.calls, 'coalesced': self.coalesced, 'in_flight': len(self._flights)}
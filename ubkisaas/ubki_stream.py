@@ -0,0 +1,797 @@
+from .ubki_credit_report import CREDIT_REPORT_FIELDS, check_null_value
+from .ubki_credit_score import CREDIT_SCORE_FIELDS, coding_no_yes, coding_maxnowexp
+
+from .ubki_timeline import CreditTimeline, ContactTimeline, get_deltatime
+from .ubki_metrics import measure, record_error, get_metrics_sink
+
+from xml.parsers import expat
+from typing import Union, Optional, Iterable, List
+import numpy as np
+import datetime
+import time
+
+# Группа (id блока comp или tech), из которой вычисляется каждый признак. None - признак не вычисляется
+REPORT_FIELD_GROUPS = {
+    "median_day_credit": '2', "mean_credit_summ": '2', "mean_credit_debt": '2',
+    "cdolgn": '1', "wdohod": '1', "wstag": '1', "max_wdohod": None,
+    "cgrag": '1', "sstate": '1', "family": '1', "ceduc": '1',
+    "ubki_balance_value": 'tech',
+    "ubki_phone_deltatime": '10', "ubki_email_deltatime": '10',
+    "ubki_week_queries": '4', "req_credit": '4',
+}
+SCORE_FIELD_GROUPS = {
+    "ubki_score": '8', "ubki_scorelast": '8', "ubki_scorelevel": '8',
+    "ubki_all_credits": '8', "ubki_open_credits": '8', "ubki_closed_credits": '8',
+    "ubki_expyear": '8', "ubki_maxnowexp": '8',
+    "ubki_phone_deltatime": None, "ubki_email_deltatime": None, "ubki_week_queries": None,
+}
+# Признаки, зависящие от даты расчета: давность первого упоминания контакта (см. get_deltatime)
+TIME_FIELDS = ["ubki_phone_deltatime", "ubki_email_deltatime"]
+# Количество первых байт ответа, по которым определяются ошибки УБКИ (см. is_session_error)
+RESPONSE_HEAD_SIZE = 2048
+
+class _XmlScanner():
+    """ Базовый потоковый сканер УБКИ отчета.
+    Разбирает xml событиями expat за один проход, не строя дерево документа, и передает
+    события внутри блоков comp сборщикам, зарегистрированным в comp_blocks по id блока.
+    Повторяет поведение xmltodict + get_useful_*_fields, включая особенности обработки
+    единичных элементов (xmltodict возвращает словарь вместо списка).
+
+    Parameters
+    ----------
+    comp_blocks : dict = None
+        Таблица id блока comp -> сборщик встроенных признаков, по умолчанию все сборщики сканера.
+        Блоки, которых нет в таблице, пропускаются
+
+    comp_records : dict = None
+        Таблица id блока comp -> {путь элемента: атрибуты} для пользовательских признаков (см. compile_features)
+    """
+    comp_blocks = {}
+
+    def __init__(self, comp_blocks: Optional[dict] = None, comp_records: Optional[dict] = None):
+        if comp_blocks is not None:
+            self.comp_blocks = comp_blocks
+        self.comp_records = comp_records or {}
+        self.records = {}           # Сборщики записей пользовательских признаков по id блока
+        self.parser = expat.ParserCreate()
+        self.parser.StartElementHandler = self._start_element
+        self.parser.EndElementHandler = self._end_element
+        self.depth = 0
+        self.root = None            # Имя корневого элемента
+        self.root_is_dict = False   # Корень содержит атрибуты или дочерние элементы
+        self.comp_count = 0         # Количество блоков comp
+        self.comp_error = None      # Тип ошибки блока comp без id, последующие блоки не обрабатываются
+        self.blocks = []            # Собранные блоки (id, сборщик) в порядке документа
+        self._top = None
+        self._block = None
+
+    def feed(self, data: Union[str, bytes]):
+        """ Метод передачи очередной части xml документа
+
+        Parameters
+        ----------
+        data : str | bytes
+            Часть xml документа
+
+        Returns
+        -------
+        scanner : Этот же сканер
+        """
+        self.parser.Parse(data, False)
+        return self
+
+    def close(self):
+        """ Метод завершения разбора документа
+
+        Returns
+        -------
+        scanner : Этот же сканер
+        """
+        self.parser.Parse(b'', True)
+        return self
+
+    def _start_element(self, name: str, attrs: dict):
+        self.depth += 1
+        if self.depth == 1:
+            self.root = name
+            self.root_is_dict = bool(attrs)
+        elif self.root != 'ubkidata':
+            return
+        elif self.depth == 2:
+            self.root_is_dict = True
+            self._top = name
+            if name == 'comp':
+                self._start_comp(attrs)
+            else:
+                self._start_top(name, attrs)
+        elif self._top != 'comp':
+            self._start_top(name, attrs)
+        elif self._block is not None:
+            self._block.start(self.depth - 2, name, attrs)
+
+    def _end_element(self, name: str):
+        if self._block is not None:
+            if self.depth == 2:
+                self._block = None
+            else:
+                self._block.end(self.depth - 2, name)
+        self.depth -= 1
+
+    def _start_comp(self, attrs: dict):
+        self.comp_count += 1
+        if self.comp_error:
+            return
+        comp_id = attrs.get('id')
+        if comp_id is None: # Пустой блок xmltodict возвращает как None, блок с атрибутами - словарем без @id
+            self.comp_error = 'KeyError' if attrs else 'TypeError'
+            self._block = _NoIdBlock(self)
+            return
+        self._block = self._create_block(comp_id, self.comp_blocks.get(comp_id))
+
+    def _create_block(self, comp_id: str, factory):
+        block = None
+        if factory is not None:
+            block = factory()
+            self.blocks.append((comp_id, block))
+        elements = self.comp_records.get(comp_id)
+        if elements is not None: # Записи всех блоков с одним id собираются вместе
+            records = self.records.get(comp_id)
+            if records is None:
+                records = self.records[comp_id] = _RecordsBlock(elements)
+            block = records if block is None else _TeeBlock(block, records)
+        return block
+
+    def _start_top(self, name: str, attrs: dict):
+        pass
+
+class _NoIdBlock():
+    """ Блок comp без id: дочерний элемент превращает пустой блок в словарь без @id """
+    def __init__(self, scanner: _XmlScanner):
+        self.scanner = scanner
+
+    def start(self, depth: int, name: str, attrs: dict):
+        self.scanner.comp_error = 'KeyError'
+
+    def end(self, depth: int, name: str):
+        pass
+
+class _RecordsBlock():
+    """ Сборщик записей для пользовательских признаков: атрибуты элементов блока comp по путям
+    относительно блока (например, 'crdeal/deallife')
+    """
+    def __init__(self, elements: dict):
+        self.elements = elements    # Путь -> нужные атрибуты (None - все атрибуты)
+        self.records = {path: [] for path in elements}
+        self._path = []
+
+    def start(self, depth: int, name: str, attrs: dict):
+        self._path.append(name)
+        path = '/'.join(self._path)
+        if path in self.elements:
+            keys = self.elements[path]
+            self.records[path].append(dict(attrs) if keys is None else {k: attrs.get(k) for k in keys})
+
+    def end(self, depth: int, name: str):
+        self._path.pop()
+
+    def get_records(self, paths: Iterable[str]) -> dict:
+        return {path: self.records[path] for path in paths}
+
+class _TeeBlock():
+    """ Передача событий блока comp двум сборщикам """
+    def __init__(self, first, second):
+        self.first = first
+        self.second = second
+
+    def start(self, depth: int, name: str, attrs: dict):
+        self.first.start(depth, name, attrs)
+        self.second.start(depth, name, attrs)
+
+    def end(self, depth: int, name: str):
+        self.first.end(depth, name)
+        self.second.end(depth, name)
+
+class _PersonBlock():
+    """ Сборщик блока персональных данных (comp id=1) """
+    def __init__(self):
+        self.cki = 0
+        self.idents = []
+        self.works = []
+        self._child = None
+
+    def start(self, depth: int, name: str, attrs: dict):
+        if depth == 1:
+            self._child = name
+            if name == 'cki':
+                self.cki += 1
+        elif depth == 2 and self._child == 'cki':
+            if name == 'ident':
+                self.idents.append(attrs)
+            elif name == 'work':
+                self.works.append(attrs)
+
+    def end(self, depth: int, name: str):
+        pass
+
+    def fill(self, res_dict: dict):
+        if self.cki != 1: # Нет cki или их несколько (список вместо словаря): не вычисляются ни ident, ни work
+            for _ in range(2):
+                record_error('1', 'KeyError' if self.cki == 0 else 'TypeError')
+            return
+        try: # Данные про субьект (единичный ident в исходной реализации не обрабатывается)
+            if len(self.idents) > 1:
+                for ident in self.idents:
+                    fill_dict_by_attrs(ident, ['cgrag', 'sstate', 'family', 'ceduc'], res_dict)
+            else:
+                record_error('1', 'KeyError' if not self.idents else 'UnboundLocalError')
+        except (KeyError, ValueError) as error:
+            record_error('1', error)
+        try: # Данные про роботу
+            if not self.works:
+                record_error('1', 'KeyError')
+            for work in self.works:
+                fill_dict_by_attrs(work, ['cdolgn', 'wdohod', 'wstag'], res_dict)
+        except (KeyError, ValueError) as error:
+            record_error('1', error)
+
+class _CreditsBlock():
+    """ Сборщик блока кредитных соглашений (comp id=2).
+    Во время разбора только запоминает строки атрибутов, а в массивы (CreditTimeline)
+    они преобразуются за один шаг при первом обращении.
+    """
+    def __init__(self):
+        self.crdeal = 0
+        self._dlamt = []
+        self._offsets = [0]
+        self._dlds = []
+        self._dlamtcur = []
+        self._missing = set()   # (атрибут или элемент, номер) отсутствующих значений - для типа ошибки (см. _get_error)
+        self._child = None
+        self._timeline = None
+
+    def start(self, depth: int, name: str, attrs: dict):
+        if depth == 1:
+            self._child = name
+            if name == 'crdeal':
+                self.crdeal += 1
+                self._append(self._dlamt, 'dlamt', attrs)
+                if not attrs: # Пустой crdeal xmltodict возвращает как None
+                    self._missing.add(('crdeal', len(self._dlamt) - 1))
+        elif self._child != 'crdeal':
+            return
+        elif depth == 2:
+            self._missing.discard(('crdeal', len(self._dlamt) - 1))
+            if name == 'deallife':
+                self._append(self._dlds, 'dlds', attrs)
+                self._append(self._dlamtcur, 'dlamtcur', attrs)
+                if not attrs:
+                    self._missing.add(('deallife', len(self._dlds) - 1))
+        elif depth == 3 and self._missing:
+            self._missing.discard(('deallife', len(self._dlds) - 1))
+
+    def _append(self, values: list, key: str, attrs: dict):
+        value = attrs.get(key)
+        if value is None:
+            self._missing.add((key, len(values)))
+        values.append(value)
+
+    def end(self, depth: int, name: str):
+        if depth == 1 and name == 'crdeal':
+            self._offsets.append(len(self._dlds))
+
+    def get_timeline(self) -> CreditTimeline:
+        if self._timeline is None:
+            self._timeline = CreditTimeline(self._dlamt, self._offsets, self._dlds, self._dlamtcur)
+            self._dlamt = self._dlds = self._dlamtcur = None
+        return self._timeline
+
+    def fill(self, res_dict: dict):
+        if self.crdeal == 0:
+            record_error('2', 'KeyError')
+            return
+        timeline = self.get_timeline()
+        valid = timeline.get_valid_credits()
+        if not valid.all(): # Некорректная сумма, дата или пустая история кредита
+            record_error('2', self._get_error(timeline, int(np.argmin(valid))))
+            return
+        credit_sum = credits = 0        # Сумма кредита и количество кредитов
+        credit_debt = debts = 0         # Сумма задолжности по кредиту
+        for amount, debt in zip(timeline.dlamt.tolist(), timeline.get_max_amounts().tolist()):
+            if amount > 0:
+                credit_sum += amount
+                credits += 1
+            if debt > 0:
+                credit_debt += debt
+                debts += 1
+        median_days = timeline.get_month_halves() # Сумма по дням в половинах месяца
+        try:
+            res_dict['median_day_credit'] = 0 if median_days[0] >= median_days[1] else 1
+            res_dict['mean_credit_summ'] = int(credit_sum / credits)
+            res_dict['mean_credit_debt'] = int(credit_debt / debts)
+        except (ZeroDivisionError, ValueError, OverflowError) as error:
+            record_error('2', error)
+
+    def _get_error(self, timeline: CreditTimeline, i: int) -> str:
+        """ Тип ошибки, на которой get_credit_ubki_fields прерывает обработку кредита i """
+        missing = self._missing
+        if ('crdeal', i) in missing:
+            return 'TypeError'
+        if not timeline.dlamt_valid[i]:
+            return 'KeyError' if ('dlamt', i) in missing else 'ValueError'
+        start, end = int(timeline.offsets[i]), int(timeline.offsets[i + 1])
+        if start == end:
+            return 'KeyError'
+        if ('deallife', start) in missing:
+            return 'TypeError'
+        if np.isnat(timeline.dates[start]):
+            return 'KeyError' if ('dlds', start) in missing else 'ValueError'
+        for j in range(start, end):
+            if ('deallife', j) in missing:
+                return 'TypeError'
+            if not timeline.amounts_valid[j]:
+                return 'KeyError' if ('dlamtcur', j) in missing else 'ValueError'
+        return 'ValueError'
+
+class _QueriesBlock():
+    """ Сборщик блока регистрации запросов (comp id=4) """
+    def __init__(self):
+        self.reestrtime = 0
+        self.wk = None
+        self.credres = 0
+        self.req_credit = 0
+        self.credres_valid = True
+
+    def start(self, depth: int, name: str, attrs: dict):
+        if depth != 1:
+            return
+        if name == 'reestrtime':
+            self.reestrtime += 1
+            self.wk = attrs.get('wk')
+        elif name == 'credres':
+            self.credres += 1
+            reqreason = attrs.get('reqreason')
+            if reqreason is None:
+                self.credres_valid = False
+            elif reqreason in ['2', '4']:
+                self.req_credit += 1
+
+    def end(self, depth: int, name: str):
+        pass
+
+    def fill(self, res_dict: dict):
+        if self.reestrtime != 1 or self.wk is None:
+            record_error('4', 'TypeError' if self.reestrtime > 1 else 'KeyError')
+            return
+        try:
+            res_dict["ubki_week_queries"] = int(self.wk)
+        except ValueError as error:
+            record_error('4', error)
+            return
+        if self.credres > 1 and self.credres_valid:
+            res_dict["req_credit"] = self.req_credit
+        else: # Нет credres, единичный credres или запись без reqreason
+            record_error('4', 'TypeError' if self.credres == 1 else 'KeyError')
+
+class _ContactsBlock():
+    """ Сборщик блока истории контактных данных (comp id=10) """
+    def __init__(self):
+        self._cvals = []
+        self._vdates = []
+        self._timeline = None
+
+    def start(self, depth: int, name: str, attrs: dict):
+        if depth == 1 and name == 'cont':
+            self._cvals.append(attrs.get('cval'))
+            self._vdates.append(attrs.get('vdate'))
+
+    def end(self, depth: int, name: str):
+        pass
+
+    def get_timeline(self) -> ContactTimeline:
+        if self._timeline is None:
+            self._missing = None in self._cvals or None in self._vdates
+            self._timeline = ContactTimeline(self._cvals, self._vdates)
+            self._cvals = self._vdates = None
+        return self._timeline
+
+    def get_first_dates(self, phone: str, email: str) -> Optional[dict]:
+        """ Метод получения дат первого упоминания телефона и почты (NaT - упоминания нет)
+
+        Returns
+        -------
+        first dates : Словарь признак из TIME_FIELDS -> np.datetime64, None при ошибке в данных блока
+        """
+        timeline = self.get_timeline()
+        if len(timeline) < 2 or self._missing: # Записи без cval или vdate прерывают обработку блока
+            record_error('10', 'TypeError' if len(timeline) == 1 and not self._missing else 'KeyError')
+            return None
+        phone_mask = timeline.get_phone_mask(phone)
+        email_mask = timeline.get_email_mask(email) & ~phone_mask
+        if np.isnat(timeline.dates[phone_mask | email_mask]).any(): # Некорректная дата у искомого контакта
+            record_error('10', 'ValueError')
+            return None
+        return {"ubki_phone_deltatime": timeline.get_first_date(phone_mask),
+                "ubki_email_deltatime": timeline.get_first_date(email_mask)}
+
+class _RatingBlock():
+    """ Сборщик блока кредитного рейтинга УБКИ (comp id=8) """
+    def __init__(self):
+        self.uratings = []
+        self.dinfos = []
+        self._child = None
+
+    def start(self, depth: int, name: str, attrs: dict):
+        if depth == 1:
+            self._child = name
+            if name == 'urating':
+                self.uratings.append(attrs)
+        elif depth == 2 and self._child == 'urating' and name == 'dinfo':
+            self.dinfos.append(attrs)
+
+    def end(self, depth: int, name: str):
+        pass
+
+    def fill(self, res_dict: dict):
+        if len(self.uratings) != 1:
+            record_error('8', 'KeyError' if not self.uratings else 'TypeError')
+            return
+        rating = self.uratings[0]
+        try:
+            for i in ["score", "scorelast", "scorelevel"]:
+                res_dict["ubki_" + i] = int(float(rating[i])) \
+                    if (check_null_value(rating[i])) else None
+            if len(self.dinfos) != 1:
+                record_error('8', 'KeyError' if not self.dinfos else 'TypeError')
+                return
+            dinfo = self.dinfos[0]
+            res_dict["ubki_all_credits"] = int(float(dinfo["all"])) \
+                if (check_null_value(rating["scorelevel"])) else None
+            res_dict["ubki_open_credits"] = int(float(dinfo["open"])) \
+                if (check_null_value(dinfo["open"])) else None
+            res_dict["ubki_closed_credits"] = int(float(dinfo["close"])) \
+                if (check_null_value(dinfo["close"])) else None
+            res_dict["ubki_expyear"] = int(coding_no_yes(dinfo["expyear"])) \
+                if (check_null_value(dinfo["expyear"])) else None
+            res_dict["ubki_maxnowexp"] = int(float(coding_maxnowexp(dinfo["maxnowexp"]))) \
+                if (check_null_value(dinfo["maxnowexp"])) else None
+        except (KeyError, ValueError, OverflowError) as error:
+            record_error('8', error)
+
+class CreditReportScanner(_XmlScanner):
+    """ Потоковый сканер кредитного отчета физической особы (reqtype 10)
+
+    Examples
+    --------
+    >> scanner = CreditReportScanner()
+    >> for chunk in chunks:
+    >>     scanner.feed(chunk)
+    >> scanner.close().get_fields(phone, email, datetime.now())
+    """
+    comp_blocks = {'1': _PersonBlock, '2': _CreditsBlock, '4': _QueriesBlock, '10': _ContactsBlock}
+
+    def __init__(self, comp_blocks: Optional[dict] = None, comp_records: Optional[dict] = None):
+        super().__init__(comp_blocks, comp_records)
+        self.tech = 0
+        self.tech_empty = True  # Блок tech без атрибутов и дочерних элементов (xmltodict возвращает None)
+        self.billing = 0
+        self.balance = 0
+        self.balance_value = None
+        self._child = None
+
+    def _start_top(self, name: str, attrs: dict):
+        if self.depth == 2:
+            if name == 'tech':
+                self.tech += 1
+                self.tech_empty = self.tech_empty and not attrs
+        elif self._top != 'tech':
+            return
+        elif self.depth == 3:
+            self.tech_empty = False
+            self._child = name
+            if name == 'billing':
+                self.billing += 1
+        elif self.depth == 4 and self._child == 'billing' and name == 'balance':
+            self.balance += 1
+            self.balance_value = attrs.get('value')
+
+    def get_credit_timelines(self) -> List[CreditTimeline]:
+        """ Метод получения истории кредитных соглашений каждого блока comp id=2 в виде массивов
+
+        Returns
+        -------
+        timelines : Список CreditTimeline в порядке блоков документа
+        """
+        return [block.get_timeline() for comp_id, block in self.blocks if comp_id == '2']
+
+    def get_contact_timelines(self) -> List[ContactTimeline]:
+        """ Метод получения истории контактных данных каждого блока comp id=10 в виде массивов
+
+        Returns
+        -------
+        timelines : Список ContactTimeline в порядке блоков документа
+        """
+        return [block.get_timeline() for comp_id, block in self.blocks if comp_id == '10']
+
+    def get_fields(self, phone: str, email: str, our_date: datetime, groups: Optional[Iterable[str]] = None) -> dict:
+        """ Метод получения полезных параметров из разобранного кредитного отчета.
+        Результат совпадает с get_useful_credit_report_fields(xmltodict.parse(xml), ...)
+
+        Parameters
+        ----------
+        phone : str
+            Телефон, для вычисления самой раннего упоминания даного контакта
+
+        email : str
+            Электронная почта, для вычисления самой раннего упоминания даного контакта
+
+        our_date : datetime
+            Дата получения отчета
+
+        groups : Iterable[str] = None
+            Группы признаков (см. REPORT_FIELD_GROUPS), которые нужно вычислить. None - все группы,
+            признаки остальных групп остаются None
+
+        Returns
+        -------
+        useful ubki fields : Словарь полезных параметром для скоринга из кредитного отчета
+        """
+        return self.fill_fields({k: None for k in CREDIT_REPORT_FIELDS}, phone, email, our_date, groups)
+
+    def fill_fields(self, res_dict, phone: str, email: str, our_date: datetime,
+                    groups: Optional[Iterable[str]] = None):
+        """ Метод записи полезных параметров кредитного отчета в res_dict.
+        Записываются только вычисленные признаки, поэтому вместо словаря можно передать любой
+        объект с __setitem__ (например, строку столбцового набора признаков)
+
+        Parameters
+        ----------
+        res_dict : dict
+            Словарь (или объект с __setitem__), в который записываются признаки
+
+        phone, email, our_date, groups
+            См. get_fields
+
+        Returns
+        -------
+        res dict : Тот же res_dict
+        """
+        for key, first_date in self.fill_static_fields(res_dict, phone, email, groups).items():
+            res_dict[key] = get_deltatime(first_date, our_date)
+        return res_dict
+
+    def fill_static_fields(self, res_dict, phone: str, email: str, groups: Optional[Iterable[str]] = None) -> dict:
+        """ Метод записи в res_dict признаков, не зависящих от даты расчета. Для признаков TIME_FIELDS
+        возвращаются даты первого упоминания контакта, по которым признаки вычисляются на любую дату
+        (get_deltatime, get_deltatimes) без повторного разбора отчета
+
+        Parameters
+        ----------
+        res_dict : dict
+            Словарь (или объект с __setitem__), в который записываются признаки
+
+        phone, email, groups
+            См. get_fields
+
+        Returns
+        -------
+        first dates : Словарь признак из TIME_FIELDS -> np.datetime64 (NaT - упоминания нет).
+            Признаков нет в словаре, если блок comp id=10 не обработан
+        """
+        first_dates = {}
+        groups = set(REPORT_FIELD_GROUPS.values()) if groups is None else set(groups)
+        if self.root != 'ubkidata' or not self.root_is_dict: # Нет корня ubkidata
+            error = 'UnboundLocalError' if self.root != 'ubkidata' else 'AttributeError'
+            if 'tech' in groups:
+                record_error('tech', error)
+            record_error('document', error)
+            return first_dates
+        if 'tech' in groups and self.tech == 1 and self.billing == 1 and self.balance == 1 \
+                and self.balance_value is not None:
+            try: # Системные данные
+                res_dict["ubki_balance_value"] = int(float(self.balance_value))  # Баланс
+            except (ValueError, OverflowError) as error:
+                record_error('tech', error)
+        elif 'tech' in groups and (self.tech > 1 or self.tech_empty and self.tech): # Несколько tech или пустой tech
+            record_error('tech', 'AttributeError')
+        elif 'tech' in groups and self.billing: # billing без единственного balance с value
+            record_error('tech', 'KeyError' if self.billing == 1 and self.balance == 1 else 'TypeError')
+        if self.comp_count == 1: # Единичный comp xmltodict возвращает словарем, а не списком
+            record_error('document', 'TypeError')
+            return first_dates
+        for comp_id, block in self.blocks:
+            if comp_id not in groups:
+                continue
+            with measure('ubki.extract.duration', {'comp': comp_id}):
+                if comp_id == '10':
+                    first_dates.update(block.get_first_dates(phone, email) or {})
+                else:
+                    block.fill(res_dict)
+        if self.comp_error: # Блок comp без id
+            record_error('document', self.comp_error)
+        return first_dates
+
+class CreditScoreScanner(_XmlScanner):
+    """ Потоковый сканер кредитного балла (reqtype 11).
+    Как и в get_useful_credit_score_fields, учитывается только первый блок comp id=8.
+    """
+    comp_blocks = {'8': _RatingBlock}
+
+    def _start_comp(self, attrs: dict):
+        if not self.blocks:
+            super()._start_comp(attrs)
+        elif not self.comp_records: # Первый блок рейтинга найден, остальные блоки не нужны
+            self.comp_count += 1
+        else: # Остальные блоки нужны только пользовательским признакам
+            self.comp_count += 1
+            if attrs.get('id') is not None:
+                self._block = self._create_block(attrs['id'], None)
+
+    def get_fields(self, groups: Optional[Iterable[str]] = None) -> dict:
+        """ Метод получения полезных параметров из разобранного кредитного балла.
+        Результат совпадает с get_useful_credit_score_fields(xmltodict.parse(xml))
+
+        Parameters
+        ----------
+        groups : Iterable[str] = None
+            Группы признаков (см. SCORE_FIELD_GROUPS), которые нужно вычислить. None - все группы
+
+        Returns
+        -------
+        useful ubki fields : Словарь полезных параметром для скоринга из кредитного балла
+        """
+        return self.fill_fields({k: None for k in CREDIT_SCORE_FIELDS}, groups)
+
+    def fill_fields(self, res_dict, groups: Optional[Iterable[str]] = None):
+        """ Метод записи полезных параметров кредитного балла в res_dict (словарь или объект с __setitem__)
+
+        Parameters
+        ----------
+        res_dict : dict
+            Словарь (или объект с __setitem__), в который записываются признаки
+
+        groups : Iterable[str] = None
+            Группы признаков (см. SCORE_FIELD_GROUPS), которые нужно вычислить. None - все группы
+
+        Returns
+        -------
+        res dict : Тот же res_dict
+        """
+        if self.root != 'ubkidata' or not self.root_is_dict or self.comp_count == 1:
+            record_error('document', 'TypeError' if self.root_is_dict else 'AttributeError')
+            return res_dict
+        if self.comp_count == 0:
+            return res_dict
+        for comp_id, block in self.blocks:
+            if groups is None or comp_id in groups:
+                with measure('ubki.extract.duration', {'comp': comp_id}):
+                    block.fill(res_dict)
+        if self.comp_error: # Блок comp без id до блока рейтинга
+            record_error('document', self.comp_error)
+        return res_dict
+
+class StreamedResponse():
+    """ Приемник ответа УБКИ при потоковом получении (UbkiTransport.post_stream): каждая часть ответа
+    сразу передается сканеру, поэтому разбор идет одновременно с загрузкой, а текст ответа целиком
+    не собирается. Сохраняются только первые RESPONSE_HEAD_SIZE байт для проверки ошибок УБКИ
+    и, если нужно, исходные байты ответа
+
+    Parameters
+    ----------
+    scanner : CreditReportScanner | CreditScoreScanner
+        Сканер документа
+
+    keep_xml : bool = False
+        Сохранять исходные байты ответа (для get_xml и кэша)
+
+    document : str = None
+        Документ ('report' или 'score') для метрики ubki.parse.duration
+
+    Attributes
+    ----------
+    size : int
+        Количество полученных байт
+
+    status : int
+        Код http ответа (записывается транспортом, None - ответ не из сети)
+    """
+    __slots__ = ('scanner', 'keep_xml', 'document', 'size', 'status', 'parse_time', '_head', '_chunks')
+
+    def __init__(self, scanner, keep_xml: bool = False, document: Optional[str] = None):
+        self.scanner = scanner
+        self.keep_xml = keep_xml
+        self.document = document
+        self.size = 0
+        self.status = None
+        self.parse_time = 0.0
+        self._head = b''
+        self._chunks = []
+
+    def feed(self, chunk: bytes):
+        """ Метод передачи очередной части ответа """
+        if len(self._head) < RESPONSE_HEAD_SIZE:
+            self._head += chunk[:RESPONSE_HEAD_SIZE - len(self._head)]
+        if self.keep_xml:
+            self._chunks.append(chunk)
+        self.size += len(chunk)
+        start = time.perf_counter()
+        self.scanner.feed(chunk)
+        self.parse_time += time.perf_counter() - start
+
+    def close(self):
+        """ Метод завершения ответа и разбора
+
+        Returns
+        -------
+        response : Этот же приемник
+        """
+        start = time.perf_counter()
+        self.scanner.close()
+        self.parse_time += time.perf_counter() - start
+        sink = get_metrics_sink()
+        if sink.enabled and self.document is not None:
+            sink.timing('ubki.parse.duration', self.parse_time, {'document': self.document})
+        return self
+
+    def feed_text(self, text: str):
+        """ Метод передачи и разбора всего ответа сразу (например, ответа из кэша)
+
+        Returns
+        -------
+        response : Этот же приемник
+        """
+        self.feed(text.encode('utf-8'))
+        return self.close()
+
+    def get_head(self) -> str:
+        """ Метод получения начала ответа """
+        return self._head.decode('utf-8', 'replace')
+
+    def get_xml(self) -> Optional[str]:
+        """ Метод получения текста ответа, None - ответ не сохранялся (keep_xml = False) """
+        return b''.join(self._chunks).decode('utf-8') if self.keep_xml else None
+
+def extract_credit_report_fields(xml: Union[str, bytes], phone: str, email: str, our_date: datetime) -> dict:
+    """ Функция получения полезных параметров из кредитного отчета физического лица за один
+    потоковый проход по xml, без построения словаря всего документа
+
+    Parameters
+    ----------
+    xml : str | bytes
+        УБКИ отчет в виде xml
+
+    phone : str
+        Телефон, для вычисления самой раннего упоминания даного контакта
+
+    email : str
+        Электронная почта, для вычисления самой раннего упоминания даного контакта
+
+    our_date : datetime
+        Дата получения отчета
+
+    Returns
+    -------
+    useful ubki fields : Словарь полезных параметром для скоринга из кредитного отчета
+    """
+    return CreditReportScanner().feed(xml).close().get_fields(phone, email, our_date)
+
+def extract_credit_score_fields(xml: Union[str, bytes]) -> dict:
+    """ Функция получения полезных параметров из кредитного балла за один потоковый проход по xml,
+    без построения словаря всего документа
+
+    Parameters
+    ----------
+    xml : str | bytes
+        Кредитный балл в виде xml
+
+    Returns
+    -------
+    useful ubki fields : Словарь полезных параметром для скоринга из кредитного балла
+    """
+    return CreditScoreScanner().feed(xml).close().get_fields()
+
+def fill_dict_by_attrs(attrs: dict, keys: list, full_dict: dict) -> dict:
+    """ Аналог fill_dict_by_key для атрибутов expat (без префикса @) """
+    for key in keys:
+        if check_null_value(attrs[key]):
+            full_dict[key] = float(attrs[key])
+    return full_dict
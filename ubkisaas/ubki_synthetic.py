@@ -0,0 +1,166 @@
+from .ubki_request import TEST_PERSON_DATA
+from .ubki_report import UbkiReport
+
+from xml.sax.saxutils import quoteattr
+from datetime import date, timedelta
+import random
+
+# Блоки comp, из которых извлекаются признаки, и блоки без признаков, которыми дополняется отчет
+FEATURE_COMP_IDS = ['1', '2', '4', '10']
+FILLER_COMP_IDS = ['3', '5', '6', '7', '9', '11', '12', '13', '14', '15']
+
+POSITIONS = ['1', '2', '3', '5', '8', 'Менеджер', 'Водій', 'NA', '']
+MAXNOWEXP = ['нет', '30 дней', '60 дней', '90 дней', '120 дней']
+
+def generate_credit_report_xml(seed:int = 0, comps:int = 6, crdeals:int = 10, deallifes:int = 12, conts:int = 8,
+                               credres:int = 5, works:int = 2, phone:str = TEST_PERSON_DATA['cval'],
+                               email:str = TEST_PERSON_DATA['email']) -> str:
+    """ Функция генерации правдоподобного xml кредитного отчета (reqtype 10).
+    При одинаковых параметрах всегда возвращает одинаковый документ
+
+    Parameters
+    ----------
+    seed : int = 0
+        Зерно генератора случайных чисел
+
+    comps : int = 6
+        Количество блоков comp. Первые блоки - блоки с признаками (1, 2, 4, 10), остальные - блоки без признаков
+
+    crdeals : int = 10
+        Количество кредитных соглашений crdeal в блоке comp id=2
+
+    deallifes : int = 12
+        Количество записей deallife в каждом кредитном соглашении
+
+    conts : int = 8
+        Количество записей cont в блоке comp id=10
+
+    credres : int = 5
+        Количество записей credres в блоке comp id=4
+
+    works : int = 2
+        Количество записей work в блоке comp id=1
+
+    phone : str = TEST_PERSON_DATA['cval']
+        Телефон персоны, часть записей cont содержит его
+
+    email : str = TEST_PERSON_DATA['email']
+        Электронная почта персоны, часть записей cont содержит ее
+
+    Returns
+    -------
+    report xml : Текст xml кредитного отчета
+    """
+    rnd = random.Random(seed)
+    blocks = []
+    for i in range(comps):
+        comp_id = FEATURE_COMP_IDS[i] if i < len(FEATURE_COMP_IDS) else FILLER_COMP_IDS[i % len(FILLER_COMP_IDS)]
+        if comp_id == '1':
+            blocks.append(_get_person_comp(rnd, works))
+        elif comp_id == '2':
+            blocks.append(_get_credits_comp(rnd, crdeals, deallifes))
+        elif comp_id == '4':
+            blocks.append(_get_queries_comp(rnd, credres))
+        elif comp_id == '10':
+            blocks.append(_get_contacts_comp(rnd, conts, phone, email))
+        else:
+            blocks.append(_element('comp', {'id': comp_id}, [
+                _element('row', {'n': str(j), 'val': _get_amount(rnd), 'date': _get_date(rnd)}) for j in range(3)]))
+    tech = _element('tech', {}, [_element('billing', {}, [
+        _element('balance', {'value': '%.2f' % rnd.uniform(0, 5000), 'currency': 'UAH'})])])
+    return '<?xml version="1.0" encoding="utf-8"?>' + _element('ubkidata', {}, [tech] + blocks)
+
+def generate_credit_score_xml(seed:int = 0, comps:int = 2) -> str:
+    """ Функция генерации правдоподобного xml кредитного балла (reqtype 11)
+
+    Parameters
+    ----------
+    seed : int = 0
+        Зерно генератора случайных чисел
+
+    comps : int = 2
+        Количество блоков comp, первый из них - кредитный рейтинг comp id=8
+
+    Returns
+    -------
+    score xml : Текст xml кредитного балла
+    """
+    rnd = random.Random(seed)
+    total = rnd.randint(0, 40)
+    opened = rnd.randint(0, total)
+    dinfo = _element('dinfo', {'all': str(total), 'open': str(opened), 'close': str(total - opened),
+                               'expyear': rnd.choice(['нет', 'да']), 'maxnowexp': rnd.choice(MAXNOWEXP)})
+    rating = _element('urating', {'score': str(rnd.randint(100, 800)), 'scorelast': str(rnd.randint(100, 800)),
+                                  'scorelevel': str(rnd.randint(1, 5))}, [dinfo])
+    blocks = [_element('comp', {'id': '8'}, [rating])]
+    blocks += [_element('comp', {'id': FILLER_COMP_IDS[i % len(FILLER_COMP_IDS)]}, []) for i in range(comps - 1)]
+    return '<?xml version="1.0" encoding="utf-8"?>' + _element('ubkidata', {}, blocks)
+
+def generate_ubki_report(seed:int = 0, **sizes) -> UbkiReport:
+    """ Функция генерации отчета UbkiReport из синтетических кредитного отчета и кредитного балла
+
+    Parameters
+    ----------
+    seed : int = 0
+        Зерно генератора случайных чисел
+
+    sizes : dict
+        Размеры кредитного отчета, параметры generate_credit_report_xml
+
+    Returns
+    -------
+    ubki report : Отчет о тестовой персоне
+    """
+    phone = sizes.setdefault('phone', TEST_PERSON_DATA['cval'])
+    email = sizes.setdefault('email', TEST_PERSON_DATA['email'])
+    return UbkiReport(generate_credit_report_xml(seed, **sizes), generate_credit_score_xml(seed), phone, email)
+
+def _get_person_comp(rnd:random.Random, works:int) -> str:
+    ident = _element('ident', {'okpo': TEST_PERSON_DATA['okpo'], 'lname': TEST_PERSON_DATA['lname'],
+                               'fname': TEST_PERSON_DATA['fname'], 'mname': TEST_PERSON_DATA['mname'],
+                               'bdate': TEST_PERSON_DATA['bdate'], 'cgrag': '804', 'sstate': str(rnd.randint(1, 6)),
+                               'family': str(rnd.randint(1, 4)), 'ceduc': str(rnd.randint(1, 5)), 'vdate': _get_date(rnd)})
+    work = [_element('work', {'cdolgn': rnd.choice(POSITIONS), 'wdohod': str(rnd.randint(0, 60) * 1000),
+                              'wstag': str(rnd.randint(0, 30)), 'vdate': _get_date(rnd)}) for _ in range(works)]
+    # В реальных отчетах ident повторяется для каждого языка (reqlng)
+    return _element('comp', {'id': '1'}, [_element('cki', {'reqlng': '1'}, [ident, ident] + work)])
+
+def _get_credits_comp(rnd:random.Random, crdeals:int, deallifes:int) -> str:
+    deals = []
+    for i in range(crdeals):
+        start = date(2008, 1, 1) + timedelta(days=rnd.randint(0, 5000))
+        amount = rnd.randint(1, 500) * 100
+        debt = float(amount)
+        lifes = []
+        for j in range(deallifes):
+            lifes.append(_element('deallife', {'dlds': (start + timedelta(days=30 * j)).isoformat(),
+                                               'dlamtcur': '%.2f' % debt, 'dlamtexp': '0', 'dlflstat': '1'}))
+            debt = max(debt - rnd.uniform(0, amount / 4), 0.0)
+        deals.append(_element('crdeal', {'dlref': 'REF%06d' % i, 'dlamt': str(amount), 'dlcurr': '980',
+                                         'dlds': start.isoformat()}, lifes))
+    return _element('comp', {'id': '2'}, deals)
+
+def _get_queries_comp(rnd:random.Random, credres:int) -> str:
+    week = rnd.randint(0, 5)
+    reestr = _element('reestrtime', {'hr': '0', 'da': str(min(week, 1)), 'wk': str(week),
+                                     'mn': str(week + rnd.randint(0, 5)), 'ye': str(week + rnd.randint(0, 20))})
+    requests = [_element('credres', {'redate': _get_date(rnd), 'reqreason': str(rnd.randint(0, 5)),
+                                     'reqtype': rnd.choice(['10', '11'])}) for _ in range(credres)]
+    return _element('comp', {'id': '4'}, [reestr] + requests)
+
+def _get_contacts_comp(rnd:random.Random, conts:int, phone:str, email:str) -> str:
+    values = [phone, phone.replace('+', ''), email, email.upper(), '+380%09d' % rnd.randint(0, 10 ** 9 - 1)]
+    return _element('comp', {'id': '10'}, [
+        _element('cont', {'cval': rnd.choice(values), 'ctype': '3', 'vdate': _get_date(rnd)}) for _ in range(conts)])
+
+def _get_date(rnd:random.Random) -> str:
+    return (date(2005, 1, 1) + timedelta(days=rnd.randint(0, 7000))).isoformat()
+
+def _get_amount(rnd:random.Random) -> str:
+    return '%.2f' % rnd.uniform(0, 100000)
+
+def _element(name:str, attrs:dict, children:list = ()) -> str:
+    attrs = ''.join(' %s=%s' % (k, quoteattr(v)) for k, v in attrs.items())
+    if not children:
+        return '<%s%s/>' % (name, attrs)
+    return '<%s%s>%s</%s>' % (name, attrs, ''.join(children), name)
@@ -0,0 +1,236 @@
+from .ubki_credit_report import format_date
+
+from typing import List, Optional, Tuple
+import numpy as np
+import datetime
+
+NAT = np.datetime64('NaT', 'D')
+
+def parse_dates(values: List[Optional[str]]) -> np.ndarray:
+    """ Функция преобразования списка дат "%Y-%m-%d" в массив datetime64[D] за один шаг.
+    Принимает те же строки, что и format_date, некорректные даты и None становятся NaT
+
+    Parameters
+    ----------
+    values : List[str]
+        Даты в виде строк
+
+    Returns
+    -------
+    dates : Массив datetime64[D]
+    """
+    if all(v is not None and len(v) == 10 and v[4] == '-' and v[7] == '-' and v[:4].isdigit()
+           and v[5:7].isdigit() and v[8:].isdigit() and v[:4] != '0000' for v in values):
+        try:
+            return np.array(values, dtype='datetime64[D]')
+        except ValueError:
+            pass
+    return np.array([_parse_date(v) for v in values], dtype='datetime64[D]')
+
+def _parse_date(value: Optional[str]) -> np.datetime64:
+    try:
+        return np.datetime64(format_date(value).date(), 'D')
+    except (TypeError, ValueError):
+        return NAT
+
+def parse_amounts(values: List[Optional[str]]) -> Tuple[np.ndarray, np.ndarray]:
+    """ Функция преобразования списка сумм в массив float64 за один шаг (по правилам float())
+
+    Parameters
+    ----------
+    values : List[str]
+        Суммы в виде строк
+
+    Returns
+    -------
+    amounts : Массив float64 (np.nan на месте некорректных значений) и маска корректных значений
+    """
+    try:
+        return np.fromiter(map(float, values), float, len(values)), np.ones(len(values), dtype=bool)
+    except (TypeError, ValueError):
+        amounts = np.full(len(values), np.nan)
+        valid = np.zeros(len(values), dtype=bool)
+        for i, value in enumerate(values):
+            try:
+                amounts[i] = float(value)
+                valid[i] = True
+            except (TypeError, ValueError):
+                pass
+        return amounts, valid
+
+class CreditTimeline():
+    """ История кредитных соглашений блока comp id=2 в виде массивов numpy.
+    Записи deallife всех кредитов лежат подряд, записи кредита i - срез offsets[i]:offsets[i + 1]
+
+    Attributes
+    ----------
+    dlamt : np.ndarray
+        Сумма каждого кредита (float64, np.nan если некорректна)
+
+    dlamt_valid : np.ndarray
+        Маска корректных сумм кредитов
+
+    offsets : np.ndarray
+        Границы записей каждого кредита (int64, длина - количество кредитов + 1)
+
+    dates : np.ndarray
+        Дата каждой записи deallife, атрибут dlds (datetime64[D], NaT если некорректна)
+
+    amounts : np.ndarray
+        Текущая задолжность каждой записи deallife, атрибут dlamtcur (float64)
+
+    amounts_valid : np.ndarray
+        Маска корректных задолжностей
+    """
+    def __init__(self, dlamt: List[Optional[str]], offsets: List[int], dlds: List[Optional[str]],
+                 dlamtcur: List[Optional[str]]):
+        self.dlamt, self.dlamt_valid = parse_amounts(dlamt)
+        self.offsets = np.array(offsets, dtype=np.int64)
+        self.dates = parse_dates(dlds)
+        self.amounts, self.amounts_valid = parse_amounts(dlamtcur)
+
+    def __len__(self) -> int:
+        return len(self.dlamt)
+
+    def get_counts(self) -> np.ndarray:
+        """ Метод получения количества записей deallife каждого кредита """
+        return np.diff(self.offsets)
+
+    def get_credit(self, i: int) -> Tuple[np.ndarray, np.ndarray]:
+        """ Метод получения истории (даты, задолжности) кредита i """
+        return self.dates[self.offsets[i]:self.offsets[i + 1]], self.amounts[self.offsets[i]:self.offsets[i + 1]]
+
+    def get_valid_credits(self) -> np.ndarray:
+        """ Метод получения маски кредитов с корректной суммой, непустой историей, корректной датой
+        первой записи и корректными задолжностями всех записей
+        """
+        nonempty = self.get_counts() > 0
+        valid = self.dlamt_valid & nonempty
+        if nonempty.any():
+            starts = self.offsets[:-1][nonempty]
+            valid[nonempty] &= ~np.isnat(self.dates[starts])
+            valid[nonempty] &= np.add.reduceat((~self.amounts_valid).astype(np.int64), starts) == 0
+        return valid
+
+    def get_first_dates(self) -> np.ndarray:
+        """ Метод получения даты первой записи каждого кредита (NaT для пустой истории) """
+        first = np.full(len(self), NAT)
+        counts = self.get_counts()
+        first[counts > 0] = self.dates[self.offsets[:-1][counts > 0]]
+        return first
+
+    def get_max_amounts(self) -> np.ndarray:
+        """ Метод получения максимальной задолжности каждого кредита (np.nan для пустой истории).
+        Значения nan обрабатываются так же, как встроенным max()
+        """
+        result = np.full(len(self), np.nan)
+        counts = self.get_counts()
+        if not len(self.amounts):
+            return result
+        starts = self.offsets[:-1][counts > 0]
+        result[counts > 0] = np.maximum.reduceat(self.amounts, starts)
+        if np.isnan(self.amounts).any():
+            for i in np.flatnonzero(counts > 0):
+                result[i] = max(self.amounts[self.offsets[i]:self.offsets[i + 1]].tolist())
+        return result
+
+    def get_month_halves(self, dates: Optional[np.ndarray] = None) -> np.ndarray:
+        """ Метод получения гистограммы дат по половинам месяца: [до 15 числа, с 15 числа]
+
+        Parameters
+        ----------
+        dates : np.ndarray = None
+            Даты, по умолчанию даты первых записей кредитов
+
+        Returns
+        -------
+        halves : Массив из двух счетчиков
+        """
+        dates = self.get_first_dates() if dates is None else dates
+        dates = dates[~np.isnat(dates)]
+        days = (dates - dates.astype('datetime64[M]')).astype(np.int64) + 1
+        first_half = int(np.count_nonzero(days < 15))
+        return np.array([first_half, len(days) - first_half])
+
+class ContactTimeline():
+    """ История контактных данных блока comp id=10 в виде массивов numpy
+
+    Attributes
+    ----------
+    cvals : np.ndarray
+        Значение контакта каждой записи (object)
+
+    dates : np.ndarray
+        Дата каждой записи, атрибут vdate (datetime64[D], NaT если некорректна)
+    """
+    def __init__(self, cvals: List[Optional[str]], vdates: List[Optional[str]]):
+        self.cvals = np.array(cvals, dtype=object)
+        self.dates = parse_dates(vdates)
+
+    def __len__(self) -> int:
+        return len(self.cvals)
+
+    def get_phone_mask(self, phone: str) -> np.ndarray:
+        """ Метод получения маски записей с данным телефоном (без учета '+') """
+        phone = str(phone).replace('+', '')
+        return np.fromiter((c is not None and c.replace('+', '') == phone for c in self.cvals), bool, len(self))
+
+    def get_email_mask(self, email: str) -> np.ndarray:
+        """ Метод получения маски записей с данной почтой (без учета регистра записи) """
+        email = str(email)
+        return np.fromiter((c is not None and c.lower() == email for c in self.cvals), bool, len(self))
+
+    def get_first_date(self, mask: np.ndarray) -> np.datetime64:
+        """ Метод получения самой ранней даты среди отмеченных записей (NaT если записей нет) """
+        return self.dates[mask].min() if mask.any() else NAT
+
+def get_deltatimes(first_dates, dates) -> np.ndarray:
+    """ Функция вычисления давности контакта (ubki_phone_deltatime, ubki_email_deltatime) сразу для многих
+    дат первого упоминания и многих дат расчета, без повторного разбора отчетов.
+    Как и в get_useful_credit_report_fields, давность не определена, если упоминания нет
+    или оно не раньше начала года, следующего за датой расчета
+
+    Parameters
+    ----------
+    first_dates : array-like
+        Даты первого упоминания контакта (datetime64[D], строки "%Y-%m-%d", None или NaT - упоминания нет)
+
+    dates : array-like
+        Даты расчета (datetime, date, datetime64 или строки "%Y-%m-%d")
+
+    Returns
+    -------
+    deltatimes : Массив (len(first_dates), len(dates)) float64 разниц в днях, np.nan там, где давность не определена
+    """
+    first = np.asarray(first_dates, dtype='datetime64[D]').reshape(-1, 1)
+    dates = np.asarray(dates).astype('datetime64[D]').reshape(1, -1)
+    limit = (dates.astype('datetime64[Y]') + 1).astype('datetime64[D]')
+    valid = ~np.isnat(first) & (first < limit)
+    return np.where(valid, (dates - np.where(valid, first, dates)).astype(np.float64), np.nan)
+
+def get_deltatime(first_date, our_date) -> Optional[int]:
+    """ Функция вычисления давности контакта для одной даты первого упоминания (см. get_deltatimes)
+
+    Parameters
+    ----------
+    first_date : np.datetime64 | str | None
+        Дата первого упоминания контакта
+
+    our_date : datetime
+        Дата расчета
+
+    Returns
+    -------
+    deltatime : Разница в днях или None
+    """
+    if first_date is None:
+        return None
+    if isinstance(first_date, str):
+        first_date = datetime.date.fromisoformat(first_date)
+    elif np.isnat(first_date):
+        return None
+    else:
+        first_date = first_date.item()
+    if first_date.year > our_date.year: # Не раньше начала следующего года
+        return None
+    return int((our_date - datetime.datetime.combine(first_date, datetime.time())).days)
@@ -0,0 +1,331 @@
+from .ubki_metrics import get_metrics_sink
+
+from typing import Any, Awaitable, Callable, Optional, Tuple
+import asyncio
+import random
+import time
+
+# http клиенты загружаются при создании первого транспорта (см. _load_requests, _load_aiohttp),
+# чтобы импорт пакета не требовал их установки и не тратил на них время
+requests = None
+aiohttp = None
+
+# Коды ответов, при которых запрос имеет смысл повторить
+TRANSIENT_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+class RetryPolicy():
+    """ Политика повторов запросов с экспоненциальной задержкой и случайным разбросом (full jitter)
+
+    Parameters
+    ----------
+    retries : int = 3
+        Максимальное количество повторов после первой попытки
+
+    backoff : float = 0.5
+        Базовая задержка в секундах, удваивается с каждой попыткой
+
+    backoff_max : float = 10.0
+        Максимальная задержка между попытками в секундах
+    """
+    def __init__(self, retries:int = 3, backoff:float = 0.5, backoff_max:float = 10.0):
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+
+    def get_delay(self, attempt:int) -> float:
+        """ Метод получения задержки перед повтором
+
+        Parameters
+        ----------
+        attempt : int
+            Номер неудачной попытки, начиная с 0
+
+        Returns
+        -------
+        delay : Задержка в секундах
+        """
+        return random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt))
+
+class TransportError(Exception):
+    """ Сервер отвечает временной ошибкой (429/5xx) и после всех повторов RetryPolicy
+
+    Attributes
+    ----------
+    status : int
+        Код ответа последней попытки
+
+    url : str
+        Адрес запроса
+    """
+    def __init__(self, status:int, url:str):
+        super().__init__("Запрос к %s завершился ответом %s после всех повторов" % (url, status))
+        self.status = status
+        self.url = url
+
+def _load_requests():
+    global requests
+    if requests is None:
+        try:
+            import requests as module
+        except ImportError:
+            raise ImportError("Для UbkiTransport необходим пакет requests: pip install ubkisaas[client]") from None
+        requests = module
+    return requests
+
+def _is_read_timeout(error:Exception) -> bool:
+    """ Таймаут чтения ответа: запрос мог уже дойти до УБКИ и быть обработан (в том числе
+    тарифицирован), поэтому такие ошибки не повторяются. При потоковом чтении тела requests
+    оборачивает таймаут urllib3 в ConnectionError
+    """
+    if isinstance(error, requests.ReadTimeout):
+        return True
+    from urllib3.exceptions import ReadTimeoutError
+    return isinstance(error, requests.ConnectionError) and bool(error.args) and isinstance(error.args[0], ReadTimeoutError)
+
+def _is_async_read_timeout(error:Exception) -> bool:
+    """ Асинхронный аналог _is_read_timeout: любой таймаут aiohttp, кроме таймаута установки соединения
+    (sock_connect), считается таймаутом чтения (sock_read)
+    """
+    return isinstance(error, asyncio.TimeoutError) and not isinstance(error, getattr(aiohttp, 'ConnectionTimeoutError', ()))
+
+def _load_aiohttp():
+    global aiohttp
+    if aiohttp is None:
+        try:
+            import aiohttp as module
+        except ImportError:
+            raise ImportError("Для AsyncUbkiTransport необходим пакет aiohttp: pip install ubkisaas[async]") from None
+        aiohttp = module
+    return aiohttp
+
+class UbkiTransport():
+    """ Транспорт для запросов к УБКИ поверх пула постоянных (keep-alive) соединений.
+    Все запросы выполняются с таймаутами, а временные сбои (ошибка или таймаут установки соединения,
+    обрыв соединения, ответы 429/5xx) повторяются согласно RetryPolicy. Если временная ошибка не прошла
+    и после последнего повтора, вызывается TransportError с кодом ответа. Таймаут чтения ответа
+    не повторяется и передается вызывающему: УБКИ мог уже обработать запрос, и повтор
+    запросил бы отчет второй раз.
+
+    Parameters
+    ----------
+    pool_size : int = 10
+        Максимальное количество соединений, удерживаемых в пуле
+
+    timeout : Tuple[float, float] = (5, 60)
+        Таймауты на установку соединения и чтение ответа в секундах
+
+    retry_policy : RetryPolicy = None
+        Политика повторов, по умолчанию RetryPolicy()
+    """
+    def __init__(self, pool_size:int = 10, timeout:Tuple[float, float] = (5, 60),
+                 retry_policy:Optional[RetryPolicy] = None):
+        self.timeout = timeout
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.session = _load_requests().Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def post(self, url:str, data, headers:Optional[dict] = None) -> str:
+        """ Метод отправки POST запроса с повторами при временных сбоях
+
+        Parameters
+        ----------
+        url : str
+            Адрес запроса
+
+        data : str | bytes
+            Тело запроса
+
+        headers : dict = None
+            Заголовки запроса
+
+        Returns
+        -------
+        response text : Текст ответа сервера. Если и последняя попытка завершилась временной ошибкой,
+            вызывается TransportError
+        """
+        return self._send(url, data, headers, False, lambda response: response.text)
+
+    def post_response(self, url:str, data, headers:Optional[dict] = None) -> Tuple[int, str]:
+        """ Метод отправки POST запроса (см. post) с получением кода ответа
+
+        Returns
+        -------
+        status, response text : Код и текст ответа сервера
+        """
+        return self._send(url, data, headers, False, lambda response: (response.status_code, response.text))
+
+    def post_stream(self, url:str, data, create_consumer:Callable[[], Any], headers:Optional[dict] = None,
+                    chunk_size:int = 64 * 1024) -> Any:
+        """ Метод отправки POST запроса с передачей тела ответа по частям, по мере получения.
+        Повторы - как у post. Для каждой попытки создается новый приемник, поэтому при обрыве
+        соединения посреди ответа приемник следующей попытки получает ответ с начала
+
+        Parameters
+        ----------
+        url : str
+            Адрес запроса
+
+        data : str | bytes
+            Тело запроса
+
+        create_consumer : Callable[[], Any]
+            Функция создания приемника с методами feed(bytes) и close(). В атрибут status
+            приемника до передачи тела записывается код ответа
+
+        headers : dict = None
+            Заголовки запроса
+
+        chunk_size : int = 65536
+            Максимальный размер части ответа в байтах
+
+        Returns
+        -------
+        consumer : Приемник, получивший весь ответ (после close)
+        """
+        def read(response):
+            consumer = create_consumer()
+            consumer.status = response.status_code
+            for chunk in response.iter_content(chunk_size):
+                consumer.feed(chunk)
+            consumer.close()
+            return consumer
+        return self._send(url, data, headers, True, read)
+
+    def _send(self, url:str, data, headers:Optional[dict], stream:bool, read:Callable[[Any], Any]) -> Any:
+        sink = get_metrics_sink()
+        attempt = 0
+        while True:
+            start = time.perf_counter() if sink.enabled else 0
+            try:
+                with self.session.post(url, data=data, headers=headers, timeout=self.timeout, stream=stream) as response:
+                    reason = response.status_code
+                    if response.status_code not in TRANSIENT_STATUSES:
+                        result = read(response)
+                        if sink.enabled:
+                            sink.timing('ubki.http.duration', time.perf_counter() - start, {'status': reason})
+                        return result
+                    if attempt >= self.retry_policy.retries:
+                        if sink.enabled:
+                            sink.timing('ubki.http.duration', time.perf_counter() - start, {'status': reason})
+                        raise TransportError(reason, url)
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as error:
+                reason = type(error).__name__
+                if attempt >= self.retry_policy.retries or _is_read_timeout(error):
+                    raise
+            if sink.enabled:
+                sink.timing('ubki.http.duration', time.perf_counter() - start, {'status': reason})
+                sink.increment('ubki.http.retry', 1, {'reason': reason})
+            time.sleep(self.retry_policy.get_delay(attempt))
+            attempt += 1
+
+    def close(self):
+        """ Метод закрытия всех соединений пула
+        """
+        self.session.close()
+
+class AsyncUbkiTransport():
+    """ Асинхронный аналог UbkiTransport на aiohttp
+
+    Parameters
+    ----------
+    pool_size : int = 100
+        Максимальное количество одновременно открытых соединений
+
+    timeout : Tuple[float, float] = (5, 60)
+        Таймауты на установку соединения и чтение ответа в секундах
+
+    retry_policy : RetryPolicy = None
+        Политика повторов, по умолчанию RetryPolicy()
+    """
+    def __init__(self, pool_size:int = 100, timeout:Tuple[float, float] = (5, 60),
+                 retry_policy:Optional[RetryPolicy] = None):
+        _load_aiohttp()
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.session = None
+
+    async def post(self, url:str, data, headers:Optional[dict] = None) -> str:
+        """ Метод отправки POST запроса с повторами при временных сбоях
+
+        Parameters
+        ----------
+        url : str
+            Адрес запроса
+
+        data : str | bytes
+            Тело запроса
+
+        headers : dict = None
+            Заголовки запроса
+
+        Returns
+        -------
+        response text : Текст ответа сервера. Если и последняя попытка завершилась временной ошибкой,
+            вызывается TransportError
+        """
+        return await self._send(url, data, headers, lambda response: response.text())
+
+    async def post_response(self, url:str, data, headers:Optional[dict] = None) -> Tuple[int, str]:
+        """ Метод отправки POST запроса (см. post) с получением кода ответа
+
+        Returns
+        -------
+        status, response text : Код и текст ответа сервера
+        """
+        async def read(response):
+            return response.status, await response.text()
+        return await self._send(url, data, headers, read)
+
+    async def post_stream(self, url:str, data, create_consumer:Callable[[], Any], headers:Optional[dict] = None) -> Any:
+        """ Метод отправки POST запроса с передачей тела ответа приемнику по частям, по мере получения
+        (см. UbkiTransport.post_stream)
+        """
+        async def read(response):
+            consumer = create_consumer()
+            consumer.status = response.status
+            async for chunk in response.content.iter_any():
+                consumer.feed(chunk)
+            consumer.close()
+            return consumer
+        return await self._send(url, data, headers, read)
+
+    async def _send(self, url:str, data, headers:Optional[dict], read:Callable[[Any], Awaitable[Any]]) -> Any:
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=aiohttp.ClientTimeout(sock_connect=self.timeout[0], sock_read=self.timeout[1]))
+        sink = get_metrics_sink()
+        attempt = 0
+        while True:
+            start = time.perf_counter() if sink.enabled else 0
+            try:
+                async with self.session.post(url, data=data, headers=headers) as response:
+                    reason = response.status
+                    if response.status not in TRANSIENT_STATUSES:
+                        result = await read(response)
+                        if sink.enabled:
+                            sink.timing('ubki.http.duration', time.perf_counter() - start, {'status': reason})
+                        return result
+                    if attempt >= self.retry_policy.retries:
+                        if sink.enabled:
+                            sink.timing('ubki.http.duration', time.perf_counter() - start, {'status': reason})
+                        raise TransportError(reason, url)
+            except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError) as error:
+                reason = type(error).__name__
+                if attempt >= self.retry_policy.retries or _is_async_read_timeout(error):
+                    raise
+            if sink.enabled:
+                sink.timing('ubki.http.duration', time.perf_counter() - start, {'status': reason})
+                sink.increment('ubki.http.retry', 1, {'reason': reason})
+            await asyncio.sleep(self.retry_policy.get_delay(attempt))
+            attempt += 1
+
+    async def close(self):
+        """ Метод закрытия всех соединений
+        """
+        if self.session is not None:
+            await self.session.close()
+            self.session = None